@@ -0,0 +1,278 @@
+"""
+Asyncio serving mode with request coalescing
+
+> python aio_server.py [--port 5000] [--window 2] [--max_batch 64]
+
+Concurrent "POST /api/translate" requests are held for a short window and translated together by one call of
+ RuleTranslator.translate_many(), see translators/batcher.py, unless their answer is in the response cache (see
+ http_cache.py). Every other route is served by the Flask app through WSGI in a thread pool, so responses of
+ "/api/translate/batch" are buffered instead of streamed.
+
+Only the plain HTTP/1.1 needed by the web front end and API clients is supported: keep-alive connections and request
+ bodies with a Content-Length. Request lines, headers and bodies are limited, see MAX_LINE_SIZE, MAX_HEADERS and
+ MAX_BODY_SIZE. Run it behind a reverse proxy in production like the Flask development server.
+"""
+import io
+import sys
+import json
+import asyncio
+import argparse
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import http_cache
+from app import app, rule_translator
+from blueprints.api import translation_version, translation_key, render_translation, parse_lang_codes
+from translators.batcher import MicroBatcher, DEFAULT_WINDOW, DEFAULT_MAX_BATCH
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 403: 'Forbidden', 413: 'Payload Too Large',
+           431: 'Request Header Fields Too Large', 500: 'Internal Server Error', 501: 'Not Implemented',
+           503: 'Service Unavailable'}
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length'}
+MAX_LINE_SIZE = 8190  # Bytes of the request line and of each header line
+MAX_HEADERS = 100
+MAX_BODY_SIZE = 16 * 1024 * 1024  # Bytes, large enough for the keyword lists of "/api/translate/batch"
+
+
+class BadRequest(Exception):
+    """
+    Request refused before it is read completely, the connection is closed after the answer
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def translate_many(keywords, lang_codes):
+    """
+    Serialized answers of "/api/translate" for many keywords, run by the batcher in a worker thread
+    :param keywords: list of keywords without spaces
+    :param lang_codes: list
+    :return: list of (<body bytes>, <cacheable>) in the order of keywords, see blueprints.api.render_translation()
+    """
+    return [render_translation(r_result, keyword)
+            for keyword, r_result in zip(keywords, rule_translator.translate_many(keywords, lang_codes))]
+
+
+class AsyncServer:
+    def __init__(self, wsgi_app, window=DEFAULT_WINDOW, max_batch=DEFAULT_MAX_BATCH, threads=8):
+        """
+        :param wsgi_app: serves every route but "POST /api/translate"
+        :param window: seconds to hold a translate request for coalescing, see MicroBatcher
+        :param max_batch: distinct keywords flushing a batch at once
+        :param threads: size of the thread pool running batches and WSGI requests
+        """
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads)
+        self.batcher = MicroBatcher(translate_many, window, max_batch, self.executor)
+        self.host = '127.0.0.1'
+        self.port = 5000
+
+    async def translate(self, method, target, version, headers, body):
+        """
+        Same answers as blueprints.api.translate()
+        :return: (status, headers, body)
+        """
+        try:
+            request = json.loads(body.decode('utf8'))
+            keyword = request.get('keyword', '')
+            lang_codes = parse_lang_codes(request.get('lang_codes', ''))
+        except (ValueError, AttributeError):
+            return 400, [('Content-Type', 'text/plain; charset=utf-8')], b'Invalid JSON request.'
+        if request.get('timing'):  # The timing breakdown is only meaningful for a request translated alone
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.call_wsgi, method, target, version, headers, body)
+        if not isinstance(keyword, str) or ' ' in keyword:
+            return 500, [('Content-Type', 'text/plain; charset=utf-8')], b'Spaces are not permitted in a keyword.'
+        version = translation_version()  # Before the translators, see http_cache.py
+        key = translation_key(keyword, lang_codes)
+        entry = http_cache.response_cache.get((version, key))
+        if entry is None:
+            try:
+                body, cacheable = await self.batcher.submit(keyword, lang_codes)
+            except Exception as e:
+                print('Batch failed: {}: {}'.format(type(e).__name__, str(e)))
+                return 500, [('Content-Type', 'text/plain; charset=utf-8')], b'Internal Server Error'
+            entry = http_cache.store(version, key, body, cacheable)
+        return 200, [('Content-Type', 'text/html; charset=utf-8'), ('ETag', '"{}"'.format(entry[1])),
+                     ('Cache-Control', http_cache.cache_control())], entry[0]
+
+    def call_wsgi(self, method, target, version, headers, body, remote_addr=''):
+        """
+        Run a request through the WSGI application, in a worker thread
+        :return: (status, headers, body)
+        """
+        path, _, query = target.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': urllib.parse.unquote(path, 'latin1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': remote_addr,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            if name == 'content-type':
+                environ['CONTENT_TYPE'] = value
+            elif name == 'content-length':
+                environ['CONTENT_LENGTH'] = value
+            else:
+                environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+        response = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k, v) for k, v in response_headers if k.lower() not in HOP_BY_HOP_HEADERS]
+            return lambda data: chunks.append(data)
+
+        chunks = []
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            for data in iterable:
+                chunks.append(data)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        return response['status'], response['headers'], b''.join(chunks)
+
+    @staticmethod
+    async def read_line(reader):
+        """
+        :return: bytes of a line, b'' at the end of the stream
+        :raise BadRequest: if the line is longer than MAX_LINE_SIZE
+        """
+        try:
+            return await reader.readline()
+        except ValueError:  # Over the limit of the reader, see serve()
+            raise BadRequest(431, 'Line too long.')
+
+    async def read_request(self, reader):
+        """
+        :return: (method, target, version, headers, body), None if the client closed the connection
+        :raise BadRequest: on a malformed or too large request
+        """
+        line = await self.read_line(reader)
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode('latin1').split()
+        except ValueError:
+            raise BadRequest(400, 'Malformed request line.')
+        headers = {}
+        while True:
+            line = await self.read_line(reader)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise BadRequest(431, 'Too many headers.')
+            name, _, value = line.decode('latin1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'transfer-encoding' in headers:
+            raise BadRequest(501, 'Only bodies with a Content-Length are supported.')
+        try:
+            length = int(headers.get('content-length', 0) or 0)
+        except ValueError:
+            raise BadRequest(400, 'Invalid Content-Length.')
+        if length < 0:
+            raise BadRequest(400, 'Invalid Content-Length.')
+        if length > MAX_BODY_SIZE:
+            raise BadRequest(413, 'Request body larger than {} bytes.'.format(MAX_BODY_SIZE))
+        body = await reader.readexactly(length) if length else b''
+        return method, target, version, headers, body
+
+    async def handle(self, reader, writer):
+        """
+        Serve a connection until the client closes it
+        """
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info('peername')
+        remote_addr = peer[0] if isinstance(peer, tuple) else ''
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except BadRequest as e:
+                    message = str(e).encode('latin1')
+                    writer.write('HTTP/1.1 {} {}\r\nContent-Type: text/plain; charset=utf-8\r\n'
+                                 'Content-Length: {}\r\nConnection: close\r\n\r\n'.format(
+                                     e.status, REASONS[e.status], len(message)).encode('latin1') + message)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                if version == 'HTTP/1.1':
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                else:
+                    keep_alive = headers.get('connection', '').lower() == 'keep-alive'
+
+                if method == 'POST' and target.partition('?')[0] == '/api/translate':
+                    status, response_headers, response_body = await self.translate(
+                        method, target, version, headers, body)
+                else:
+                    status, response_headers, response_body = await loop.run_in_executor(
+                        self.executor, self.call_wsgi, method, target, version, headers, body, remote_addr)
+
+                head = ['HTTP/1.1 {} {}'.format(status, REASONS.get(status, 'Unknown'))]
+                head.extend('{}: {}'.format(k, v) for k, v in response_headers)
+                head.append('Content-Length: {}'.format(len(response_body)))
+                head.append('Connection: {}'.format('keep-alive' if keep_alive else 'close'))
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin1'))
+                if method != 'HEAD':
+                    writer.write(response_body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=5000):
+        """
+        Accept connections until the task is cancelled
+        """
+        self.host = host
+        self.port = port
+        # The limit of the readers bounds request lines and header lines, see read_line()
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024, limit=MAX_LINE_SIZE)
+        print('Serving on http://{}:{}/ (batch window {:.1f} ms, max batch {})'.format(
+            host, port, self.batcher.window * 1000, self.batcher.max_batch))
+        async with server:
+            await server.serve_forever()
+
+    def serve_forever(self, host='127.0.0.1', port=5000):
+        try:
+            asyncio.run(self.serve(host, port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown()
+            print('Batcher stats: {}'.format(self.batcher.stats()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the web app with asyncio and coalesced translations')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--window', type=float, default=DEFAULT_WINDOW * 1000,
+                        help='milliseconds to hold a translate request for coalescing')
+    parser.add_argument('--max_batch', type=int, default=DEFAULT_MAX_BATCH,
+                        help='number of distinct keywords flushing a batch at once')
+    parser.add_argument('--threads', type=int, default=8, help='threads running batches and other routes')
+    args = parser.parse_args(argv)
+    AsyncServer(app, args.window / 1000, args.max_batch, args.threads).serve_forever(args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
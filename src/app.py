@@ -1,11 +1,22 @@
+import os
+
 from flask import Flask
 
 from translators.translator import IndexTranslator, RuleTranslator
+from translators.reloader import Reloader, RELOAD_INTERVAL_ENV
+from prefork_server import PREFORK_ENV
 
 app = Flask(__name__)
 
 index_translator = IndexTranslator()
 rule_translator = RuleTranslator()
+reloader = Reloader(rule_translator, index_translator)
+
+# prefork_server.py warms up before forking and starts a watcher in each worker: threads do not survive a fork
+if not os.environ.get(PREFORK_ENV):
+    rule_translator.warm_up(background=True)  # Answer index queries at once while the phonetic model loads
+    if float(os.environ.get(RELOAD_INTERVAL_ENV, 0)) > 0:
+        reloader.start(float(os.environ[RELOAD_INTERVAL_ENV]))
 
 
 def register_blueprints():
@@ -0,0 +1,12 @@
+"""
+Benchmarks of the translators. Run them from "src/" like the web service and the CLI, e.g.
+
+> cd src/
+> python -m benchmarks.rule_loading
+
+"hot_paths" times every stage of a translation on reproducible corpora and compares the results with a stored
+ baseline, see benchmarks/hot_paths.py. "index_memory" compares the memory taken by dictionary results in
+ their former and current layouts. "load_test" replays requests against a server started locally and reports
+ throughput, latency percentiles, errors and memory over time. "phoneme_model" compares the NumPy prediction model with
+ big_phoney's Keras model. "languages" shows how translations scale with the number of loaded languages.
+"""
@@ -0,0 +1,133 @@
+"""
+Latency and throughput of "/api/translate" under concurrent load: the threaded Flask server vs aio_server.py, which
+ coalesces concurrent requests into batches.
+
+> python -m benchmarks.coalescing [<concurrency> [<requests per client> [<window ms>]]]
+
+Each server is started in its own process and waited for until "/api/ready". Clients send requests back to back on
+ keep-alive connections. Most keywords are distinct made up names, so they miss the caches and need a prediction.
+"""
+import sys
+import json
+import time
+import random
+import threading
+import subprocess
+import http.client
+
+PORT = 5123
+DICTIONARY_WORDS = ['Alex', 'Happy', 'Sing', 'Karl', 'London', 'Boy', 'Mike', 'Anna']
+SYLLABLES = ['ka', 'lo', 'mi', 'ver', 'tan', 'dor', 'rel', 'sa', 'bru', 'nix', 'zo', 'phe', 'wil', 'gar']
+
+FLASK_SERVER = 'from app import app; app.run(port={}, threaded=True)'
+
+
+def make_corpus(n, seed=0, dictionary_ratio=0.2):
+    """
+    :param n: number of keywords
+    :param seed:
+    :param dictionary_ratio: share of keywords taken from DICTIONARY_WORDS
+    :return: list of keywords
+    """
+    r = random.Random(seed)
+    corpus = []
+    for i in range(n):
+        if r.random() < dictionary_ratio:
+            corpus.append(r.choice(DICTIONARY_WORDS))
+        else:
+            corpus.append(''.join(r.choice(SYLLABLES) for _ in range(r.randint(2, 4))).capitalize())
+    return corpus
+
+
+def start_server(args):
+    """
+    Start a server process from "src/" and wait until it is ready
+    :param args: command line
+    :return: subprocess.Popen
+    """
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    t_start = time.time()
+    while time.time() - t_start < 600:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=5)
+            conn.request('GET', '/api/ready')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return process
+            conn.close()
+        except OSError:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError('Server exited with {}'.format(process.returncode))
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('Server not ready in 600 s')
+
+
+def run_load(corpus, concurrency):
+    """
+    :param corpus: list of keywords, split among clients
+    :param concurrency: number of client threads
+    :return: (<list of latencies in seconds>, <wall time in seconds>, <number of errors>)
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+
+    def client(keywords):
+        conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=60)
+        l_latencies = []
+        n_errors = 0
+        barrier.wait()
+        for keyword in keywords:
+            body = json.dumps({'keyword': keyword, 'lang_codes': 'en'})
+            t_start = time.perf_counter()
+            conn.request('POST', '/api/translate', body, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            l_latencies.append(time.perf_counter() - t_start)
+            if response.status != 200:
+                n_errors += 1
+        conn.close()
+        with lock:
+            latencies.extend(l_latencies)
+            errors[0] += n_errors
+
+    threads = [threading.Thread(target=client, args=(corpus[i::concurrency],)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    t_start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - t_start, errors[0]
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def main(concurrency=32, requests_per_client=50, window_ms=2.0):
+    corpus = make_corpus(concurrency * requests_per_client)
+    servers = [
+        ('flask (threaded)', [sys.executable, '-c', FLASK_SERVER.format(PORT)]),
+        ('asyncio + coalescing', [sys.executable, 'aio_server.py', '--port', str(PORT),
+                                  '--window', str(window_ms)]),
+    ]
+    print('{} clients x {} requests, {:.0%} dictionary words'.format(concurrency, requests_per_client, 0.2))
+    print('{:24s}{:>12s}{:>12s}{:>12s}{:>10s}'.format('server', 'p50 (ms)', 'p99 (ms)', 'req/s', 'errors'))
+    for name, args in servers:
+        process = start_server(args)
+        try:
+            latencies, seconds, errors = run_load(corpus, concurrency)
+        finally:
+            process.terminate()
+            process.wait()
+        latencies.sort()
+        print('{:24s}{:12.2f}{:12.2f}{:12.1f}{:10d}'.format(
+            name, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, len(latencies) / seconds, errors))
+
+
+if __name__ == '__main__':
+    main(*[float(a) if i == 2 else int(a) for i, a in enumerate(sys.argv[1:])])
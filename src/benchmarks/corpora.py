@@ -0,0 +1,104 @@
+"""
+Reproducible keyword corpora and a mocked prediction model for the benchmarks.
+
+Corpora are generated from fixed seeds, or sampled with a fixed seed from the name indexes, so two runs on the same
+ data measure the same work.
+"""
+import random
+import contextlib
+
+# Common names found in the phonetic dictionary
+DICTIONARY_WORDS = [
+    'Alex', 'Anna', 'Arthur', 'Baker', 'Boston', 'Charles', 'Chester', 'Daniel', 'David', 'Denver', 'Dover',
+    'Edward', 'Elizabeth', 'Emily', 'Frank', 'George', 'Grace', 'Harold', 'Henry', 'Hudson', 'Jack', 'James',
+    'Karl', 'Kent', 'Lincoln', 'London', 'Margaret', 'Martin', 'Mary', 'Mike', 'Milton', 'Nelson', 'Oxford',
+    'Patrick', 'Paul', 'Peter', 'Richard', 'Robert', 'Sarah', 'Stanley', 'Thomas', 'Walter', 'Warren', 'William',
+]
+SYLLABLES = ['ka', 'lo', 'mi', 'ver', 'tan', 'dor', 'rel', 'sa', 'bru', 'nix', 'zo', 'phe', 'wil', 'gar', 'thon',
+             'ash', 'ber', 'cly', 'den', 'ford', 'ham', 'ing', 'mouth', 'stead', 'wick', 'shire', 'ton', 'by']
+
+# Mocked model: every letter is predicted as a consonant followed by a vowel, stable across runs
+MOCK_CONSONANTS = 'B P D T G K V W F Z S DH TH SH CH HH M N L R Y NG'.split()
+MOCK_VOWELS = 'AA AE AH EY ER IH IY AO OW UH UW AY AW EH'.split()
+
+
+def dictionary_words(n, seed=0):
+    """
+    :param n: number of keywords
+    :param seed:
+    :return: list of keywords sampled (with repetition) from DICTIONARY_WORDS
+    """
+    r = random.Random(seed)
+    return [r.choice(DICTIONARY_WORDS) for _ in range(n)]
+
+
+def oov_names(n, seed=0, min_syllables=2, max_syllables=3):
+    """
+    Made up names, mostly out of the phonetic dictionary
+    :param n: number of keywords
+    :param seed:
+    :param min_syllables:
+    :param max_syllables:
+    :return: list of keywords
+    """
+    r = random.Random(seed)
+    return [''.join(r.choice(SYLLABLES) for _ in range(r.randint(min_syllables, max_syllables))).capitalize()
+            for _ in range(n)]
+
+
+def long_place_names(n, seed=0):
+    """
+    :param n: number of keywords
+    :param seed:
+    :return: list of made up names of 5 to 8 syllables
+    """
+    return oov_names(n, seed, 5, 8)
+
+
+def index_names(index, n, seed=0):
+    """
+    Real names sampled from a name index
+    :param index: index_store.NameIndex
+    :param n: number of keywords
+    :param seed:
+    :return: list of names without spaces
+    """
+    r = random.Random(seed)
+    names = []
+    for _ in range(n * 10):
+        name = index.key(r.randrange(len(index))).decode('utf8')
+        if name and ' ' not in name:
+            names.append(name)
+            if len(names) == n:
+                break
+    return names
+
+
+class MockPredictionModel:
+    """
+    Stand in for big_phoney.PredictionModel: instant and deterministic
+    """
+
+    def predict(self, word):
+        result = []
+        for ch in word.upper():
+            result.append(MOCK_CONSONANTS[ord(ch) % len(MOCK_CONSONANTS)])
+            result.append(MOCK_VOWELS[ord(ch) % len(MOCK_VOWELS)] + '0')
+        return ' '.join(result)
+
+
+@contextlib.contextmanager
+def mocked_model():
+    """
+    Replace the prediction model of "en.py" (and bypass the phoneme service) while in the context
+    """
+    from translators import phoneme_service
+    from translators.data.rule import en
+
+    saved = en._pred_model, phoneme_service.predict
+    en._pred_model = MockPredictionModel()
+    phoneme_service.predict = lambda lang_code, words: None
+    try:
+        yield
+    finally:
+        en._pred_model, phoneme_service.predict = saved
@@ -0,0 +1,317 @@
+"""
+Micro benchmarks of the translation hot paths, with the prediction model mocked out (see benchmarks/corpora.py).
+
+> python -m benchmarks.hot_paths                    # run, write benchmarks/results/hot_paths.json
+> python -m benchmarks.hot_paths --save_baseline    # run and keep the results as the baseline
+> python -m benchmarks.hot_paths --stage match      # only the stages containing "match"
+
+Every run is compared against the baseline if there is one. A stage slower than the baseline by more than the
+ threshold is reported as a regression and the exit status is 1, so it can guard a change locally.
+
+Stages, each timed on every corpus in isolation:
+ to_phonetics       ".to_phonetics" function of each rule (dictionary lookup or mocked prediction)
+ match              RuleTranslator._match at every position of precomputed phonetics, both tries of both categories
+ check_pre/post     replay of the check_pre / check_post calls made while matching
+ phonetics2chinese  RuleTranslator._phonetics2chinese of precomputed phonetics, both categories
+ translate          RuleTranslator.translate end to end, caches disabled
+ index_search       IndexTranslator.search, cache disabled
+ suggest_1/2        IndexTranslator.suggest, approximate search within 1 or 2 edits
+ suggest_prefix     IndexTranslator.suggest, names starting with the keyword
+and load_rules (cold parse and cached) and suggest_longest (a keyword of index_store.MAX_KEYWORD_LENGTH characters
+ within index_store.MAX_EDITS edits, the slowest approximate search allowed) once. The size of the phonetics kept by the phonetics cache is reported
+ as phonetics_memory, in bytes per item.
+"""
+import io
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import contextlib
+from unittest import mock
+
+from benchmarks import corpora
+from translators import translator, index_store
+from translators.translator import IndexTranslator, RuleTranslator
+
+RESULTS_DIR = os.path.join('.', 'benchmarks', 'results')
+DEFAULT_OUTPUT = os.path.join(RESULTS_DIR, 'hot_paths.json')
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, 'hot_paths.baseline.json')
+RESULTS_VERSION = 1
+
+
+def quiet(func, *args, **kwargs):
+    """
+    Call func without its loading messages
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def make_corpora(index_translator, size):
+    """
+    :param index_translator:
+    :param size: number of keywords per corpus
+    :return: {<corpus name>: list of keywords}
+    """
+    return {
+        'dictionary': corpora.dictionary_words(size, seed=1),
+        'oov': corpora.oov_names(size, seed=2),
+        'long_places': corpora.long_place_names(size, seed=3),
+        'index_people': corpora.index_names(index_translator.people_index, size, seed=4),
+        'index_places': corpora.index_names(index_translator.places_index, size, seed=5),
+    }
+
+
+def phonetics_of(rule_translator, keywords):
+    """
+    :return: [(<rule>, [<phonetics of keyword>, ...]), ...] for every loaded rule, phonetics are encoded as in the
+             phonetics cache and keywords failing are left out
+    """
+    results = []
+    for rule in rule_translator.rules.values():
+        ll_phonetics = [rule_translator._encode(rule, l_phonetics)
+                        for l_phonetics in rule_translator._words2phonetics_many(rule, keywords)
+                        if not isinstance(l_phonetics, Exception)]
+        results.append((rule, ll_phonetics))
+    return results
+
+
+def recorded_checks(rule_phonetics):
+    """
+    Arguments of every check_pre / check_post call made while matching
+    :param rule_phonetics: result of phonetics_of()
+    :return: ([(<codes>, <i_start>, <pre>, <classes>), ...], [(<codes>, <i_end>, <post>, <classes>), ...])
+    """
+    l_pre, l_post = [], []
+
+    def recorder(calls, check):
+        def record(*args):
+            calls.append(args)
+            return check(*args)
+        return record
+
+    with mock.patch.object(translator, 'check_pre', recorder(l_pre, translator.check_pre)), \
+            mock.patch.object(translator, 'check_post', recorder(l_post, translator.check_post)):
+        for rule, ll_phonetics in rule_phonetics:
+            for trie in rule['tries'].values():
+                for phonetics in ll_phonetics:
+                    for i in range(len(phonetics)):
+                        try:
+                            trie.match(phonetics, i, rule['phonemes'].classes)
+                        except Exception:
+                            pass
+    return l_pre, l_post
+
+
+def stages(rule_translator, index_translator, keywords):
+    """
+    :param rule_translator: with caches disabled
+    :param index_translator: with cache disabled
+    :param keywords: a corpus
+    :return: {<stage>: (<func running the stage on the whole corpus>, <number of items>)}
+    """
+    rule_phonetics = phonetics_of(rule_translator, keywords)
+    l_pre, l_post = recorded_checks(rule_phonetics)
+    # Every position of the phonetics is matched against every trie of its rule
+    matches = sum(len(l_phonetics) * len(rule['tries']) for rule, ll_phonetics in rule_phonetics
+                  for l_phonetics in ll_phonetics)
+
+    def to_phonetics():
+        for rule in rule_translator.rules.values():
+            for keyword in keywords:
+                try:
+                    rule['to_phonetics'](keyword)
+                except Exception:
+                    pass
+
+    def match():
+        for rule, ll_phonetics in rule_phonetics:
+            for trie in rule['tries'].values():
+                for l_phonetics in ll_phonetics:
+                    for i in range(len(l_phonetics)):
+                        try:
+                            rule_translator._match(rule, l_phonetics, i, trie)
+                        except Exception:
+                            pass
+
+    def check_pre():
+        for args in l_pre:
+            try:
+                translator.check_pre(*args)
+            except Exception:
+                pass
+
+    def check_post():
+        for args in l_post:
+            try:
+                translator.check_post(*args)
+            except Exception:
+                pass
+
+    def phonetics2chinese():
+        for rule, ll_phonetics in rule_phonetics:
+            for l_phonetics in ll_phonetics:
+                for category in ('people', 'places'):
+                    try:
+                        rule_translator._phonetics2chinese(rule, l_phonetics, category)
+                    except Exception:
+                        pass
+
+    def translate():
+        for keyword in keywords:
+            try:
+                rule_translator.translate(keyword, [])
+            except Exception:
+                pass
+
+    def index_search():
+        for keyword in keywords:
+            index_translator.search(keyword)
+
+    l_suggest = [keyword for keyword in keywords
+                 if ' ' not in keyword and len(keyword) <= index_store.MAX_KEYWORD_LENGTH]
+
+    def suggester(**kwargs):
+        def suggest():
+            for keyword in l_suggest:
+                index_translator.suggest(keyword, **kwargs)
+        return suggest
+
+    n_words = len(keywords) * len(rule_phonetics)
+    return {
+        'to_phonetics': (to_phonetics, n_words),
+        'match': (match, matches),
+        'check_pre': (check_pre, len(l_pre)),
+        'check_post': (check_post, len(l_post)),
+        'phonetics2chinese': (phonetics2chinese, n_words * 2),
+        'translate': (translate, len(keywords)),
+        'index_search': (index_search, len(keywords)),
+        'suggest_1': (suggester(max_edits=1), len(l_suggest)),
+        'suggest_2': (suggester(max_edits=2), len(l_suggest)),
+        'suggest_prefix': (suggester(prefix=True), len(l_suggest)),
+    }
+
+
+def phonetics_memory(rule_translator, keywords):
+    """
+    :return: bytes of the phonetics kept by the phonetics cache for a corpus, strings of phonemes excluded
+    """
+    return sum(sys.getsizeof(phonetics) for _, ll_phonetics in phonetics_of(rule_translator, keywords)
+               for phonetics in ll_phonetics)
+
+
+def best_of(func, repeat):
+    func()  # Warm up caches of the interpreter and the OS
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def run(size=500, repeat=5, stage_filter=''):
+    """
+    :param size: number of keywords per corpus
+    :param repeat: the best of repeat runs is kept
+    :param stage_filter: only run stages whose name contains it
+    :return: {'<stage>/<corpus>': {'us_per_item': float, 'items': int}}, with 'bytes_per_item' in place of
+             'us_per_item' for phonetics_memory
+    """
+    results = {}
+    with corpora.mocked_model():
+        rule_translator = quiet(RuleTranslator, phonetics_cache_size=0, results_cache_size=0)
+        index_translator = quiet(IndexTranslator, results_cache_size=0)
+        quiet(rule_translator.warm_up)
+
+        if stage_filter in 'load_rules':
+            for name, use_cache in (('load_rules/cold', False), ('load_rules/cached', True)):
+                seconds = best_of(lambda: quiet(RuleTranslator, use_rule_cache=use_cache), repeat)
+                results[name] = {'us_per_item': seconds * 1e6, 'items': 1}
+
+        if stage_filter in 'suggest_longest':
+            keyword = ''.join(corpora.oov_names(20, seed=6))[:index_store.MAX_KEYWORD_LENGTH]
+            seconds = best_of(lambda: index_translator.suggest(keyword, max_edits=index_store.MAX_EDITS), repeat)
+            results['suggest_longest'] = {'us_per_item': seconds * 1e6, 'items': 1}
+
+        for corpus_name, keywords in make_corpora(index_translator, size).items():
+            if stage_filter in 'phonetics_memory':
+                results['phonetics_memory/{}'.format(corpus_name)] = {
+                    'bytes_per_item': phonetics_memory(rule_translator, keywords) / len(keywords),
+                    'items': len(keywords)}
+            for stage_name, (func, items) in stages(rule_translator, index_translator, keywords).items():
+                if stage_filter not in stage_name or items == 0:
+                    continue
+                seconds = best_of(func, repeat)
+                results['{}/{}'.format(stage_name, corpus_name)] = {'us_per_item': seconds * 1e6 / items,
+                                                                   'items': items}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Print results against the baseline
+    :param results:
+    :param baseline: former results or None
+    :param threshold: relative slowdown reported as a regression, e.g. 0.1
+    :return: list of regressed stages
+    """
+    regressions = []
+    print('{:36s}{:>14s}{:>14s}{:>10s}'.format('stage/corpus', 'us|B per item', 'baseline', 'change'))
+    for name, result in results.items():
+        key = 'us_per_item' if 'us_per_item' in result else 'bytes_per_item'
+        line = '{:36s}{:14.3f}'.format(name, result[key])
+        if baseline and key in baseline.get(name, {}):
+            base = baseline[name][key]
+            change = result[key] / base - 1 if base else 0.0
+            line += '{:14.3f}{:+9.1%}'.format(base, change)
+            if change > threshold:
+                line += '  REGRESSION'
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro benchmarks of the translation hot paths')
+    parser.add_argument('--size', '-n', type=int, default=500, help='number of keywords per corpus')
+    parser.add_argument('--repeat', '-r', type=int, default=5, help='keep the best of this number of runs')
+    parser.add_argument('--stage', '-s', default='', help='only run stages whose name contains this')
+    parser.add_argument('--output', '-o', default=DEFAULT_OUTPUT, help='where results are written as JSON')
+    parser.add_argument('--baseline', '-b', default=DEFAULT_BASELINE, help='results to compare against')
+    parser.add_argument('--save_baseline', action='store_true', help='also write the results as the baseline')
+    parser.add_argument('--threshold', '-t', type=float, default=0.1,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    results = run(args.size, args.repeat, args.stage)
+    document = {
+        'version': RESULTS_VERSION,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'size': args.size,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf8') as f:
+            d_baseline = json.load(f)
+        if d_baseline.get('version') == RESULTS_VERSION and d_baseline.get('size') == args.size:
+            baseline = d_baseline['results']
+        else:
+            print('Baseline "{}" was made with other settings, ignored.'.format(args.baseline))
+    regressions = compare(results, baseline, args.threshold)
+
+    paths = [args.output] + ([args.baseline] if args.save_baseline else [])
+    for path in paths:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf8') as f:
+            json.dump(document, f, indent=2)
+    print('Results written to {}'.format(', '.join(paths)))
+    if regressions:
+        print('{} regression(s) beyond {:.0%}: {}'.format(len(regressions), args.threshold, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Memory benchmark of dictionary lookups: resident set size of a process holding the results of the names of the
+ full index (every name of "people.json" and "places.json", or the first --names of them), one layout per process.
+
+ json     the JSON files loaded into dicts of lists of the raw entries, as before the mmap index
+ dicts    the mmap index with a results cache of {'transliterations': [<dict>...]}, as search() cached them
+ records  the mmap index with the results cache of IndexTranslator.lookup(): tuples of Transliteration records
+          sharing interned cultures
+
+> python -m benchmarks.index_memory
+> python -m benchmarks.index_memory --names 16384   # as many names as the default results cache
+"""
+import io
+import os
+import sys
+import json
+import argparse
+import resource
+import subprocess
+import contextlib
+
+LAYOUTS = ('json', 'dicts', 'records')
+
+
+def rss():
+    """
+    :return: resident set size of the current process in bytes, the peak one where /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _former_results(index_translator, keyword):
+    """
+    Result of search() before results were records: fresh dicts and culture strings for every name
+    """
+    results = {'transliterations': []}
+    for category, index, _ in index_translator.indexes:
+        for culture, chinese in index.get(keyword, ()):
+            results['transliterations'].append({
+                'keyword': keyword,
+                'category': category,
+                'language': culture.encode('utf8').decode('utf8'),  # Not interned
+                'chinese': chinese,
+            })
+    return results
+
+
+def _load_json():
+    indexes = []
+    for category in ('people', 'places'):
+        with open(os.path.join('.', 'translators', 'data', 'index', category + '.json'), encoding='utf8') as f:
+            data = json.loads(f.read())
+        d_index = {}
+        for m in data:
+            d_index.setdefault(m['name'], []).append(m)
+        indexes.append(d_index)
+        del data
+    return indexes
+
+
+def measure(layout, n_names):
+    """
+    Load a layout in the current process
+    :param layout: one of LAYOUTS
+    :param n_names: max number of names whose results are held, 0 for all
+    :return: {'layout': str, 'names': int, 'entries': int, 'rss_loaded': bytes, 'rss_results': bytes}
+    """
+    from translators.translator import IndexTranslator
+
+    rss_start = rss()
+    if layout == 'json':
+        indexes = _load_json()
+        rss_loaded = rss()
+        keys = sorted(k for k in set(indexes[0]) | set(indexes[1]) if k == k.capitalize() and ' ' not in k)
+        keys = keys[:n_names] if n_names else keys
+        entries = sum(len(d_index.get(k, ())) for d_index in indexes for k in keys)
+        return {'layout': layout, 'names': len(keys), 'entries': entries, 'rss_start': rss_start,
+                'rss_loaded': rss_loaded, 'rss_results': rss()}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        index_translator = IndexTranslator(results_cache_size=0)
+    rss_loaded = rss()
+    keys = set()
+    for _, index, _ in index_translator.indexes:
+        keys.update(index.key(i).decode('utf8') for i in range(len(index)))
+    keys = sorted(k for k in keys if k == k.capitalize() and ' ' not in k)  # Names search() can find
+    keys = keys[:n_names] if n_names else keys
+    rss_loaded += sys.getsizeof(keys) + sum(sys.getsizeof(k) for k in keys)  # The list of keys is not a result
+
+    held = {}  # Stands for a results cache holding every name
+    if layout == 'dicts':
+        for k in keys:
+            held[k] = _former_results(index_translator, k)
+        entries = sum(len(r['transliterations']) for r in held.values())
+    else:
+        for k in keys:
+            held[k] = index_translator.lookup(k)
+        entries = sum(len(r) for r in held.values())
+    return {'layout': layout, 'names': len(keys), 'entries': entries, 'rss_start': rss_start,
+            'rss_loaded': rss_loaded, 'rss_results': rss()}
+
+
+def run(layout, n_names):
+    """
+    Measure a layout in a new process
+    :return: see measure()
+    """
+    out = subprocess.run([sys.executable, '-m', 'benchmarks.index_memory', '--child', layout,
+                          '--names', str(n_names)], stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(out.decode('utf8').strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Memory benchmark of dictionary lookups')
+    parser.add_argument('--names', '-n', type=int, default=0, help='number of names whose results are held, 0 for all')
+    parser.add_argument('--layout', '-l', default='', help='only run this layout')
+    parser.add_argument('--child', default='', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.names)))
+        return
+    mb = 1024 * 1024
+    print('{:10s}{:>10s}{:>10s}{:>14s}{:>14s}{:>14s}{:>14s}'.format(
+        'layout', 'names', 'entries', 'loaded MiB', 'results MiB', 'total MiB', 'B / entry'))
+    for layout in LAYOUTS:
+        if args.layout and layout != args.layout:
+            continue
+        r = run(layout, args.names)
+        loaded = r['rss_loaded'] - r['rss_start']
+        held = r['rss_results'] - r['rss_loaded']
+        print('{:10s}{:10d}{:10d}{:14.1f}{:14.1f}{:14.1f}{:14.0f}'.format(
+            layout, r['names'], r['entries'], loaded / mb, held / mb, (loaded + held) / mb,
+            (loaded + held) / max(r['entries'], 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Scaling of RuleTranslator with the number of loaded languages, with the prediction model mocked out (see
+ benchmarks/corpora.py).
+
+> python -m benchmarks.languages [--languages 1,2,4,8] [--keywords 500] [--workers 4] [--predict_ms 0.2]
+
+The "en" rule is loaded once and cloned into as many languages, without its precomputed table:
+ shared    clones use the same ".to_phonetics" function, as rule files pointing at the same lookup_or_predict()
+ distinct  each clone wraps it into its own function, as languages with their own models
+Phonetics are generated once per function and keyword, so shared clones only add their rule matching.
+
+--predict_ms adds a delay to every mocked prediction, standing for a prediction model or the phoneme service. It
+ releases the GIL like them, so languages overlap on the worker pool. Caches are disabled.
+
+ translate ms      RuleTranslator.translate(keyword, []) per keyword
+ many ms           RuleTranslator.translate_many() of all keywords, per keyword, languages one after another
+ pool ms           the same by a pool of --workers threads
+"""
+import io
+import time
+import argparse
+import contextlib
+
+from benchmarks import corpora
+from translators.translator import RuleTranslator, IndexTranslator
+
+
+def quiet(func, *args, **kwargs):
+    """
+    Call func without its loading messages
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def clone_languages(rule_translator, en, n, shared):
+    """
+    Replace the rules of the translator by n clones of a rule
+    :param rule_translator: RuleTranslator
+    :param en: the "en" rule loaded by the translator
+    :param n: number of languages
+    :param shared: if False, every clone gets its own ".to_phonetics" functions
+    """
+    rules = {}
+    for k in range(n):
+        rule = dict(en)
+        rule['meta'] = dict(en['meta'], language_name='{} {}'.format(en['meta']['language_name'], k))
+        rule['table'] = None
+        if not shared:
+            rule['to_phonetics'] = lambda keyword, func=en['to_phonetics']: func(keyword)
+            if en.get('to_phonetics_many') is not None:
+                rule['to_phonetics_many'] = lambda keywords, func=en['to_phonetics_many']: func(keywords)
+        rules['en{}'.format(k)] = rule
+    quiet(rule_translator._swap, rules, {lang_code: None for lang_code in rules})
+
+
+def slow_model(predict_ms):
+    """
+    :param predict_ms: milliseconds added to every prediction of the mocked model
+    :return: a model like corpora.MockPredictionModel
+    """
+    class SlowMockPredictionModel(corpora.MockPredictionModel):
+        def predict(self, word):
+            time.sleep(predict_ms / 1000)
+            return corpora.MockPredictionModel.predict(self, word)
+
+    return SlowMockPredictionModel()
+
+
+def per_keyword(func, keywords):
+    """
+    :return: milliseconds per keyword of func(keywords)
+    """
+    t_start = time.perf_counter()
+    func(keywords)
+    return (time.perf_counter() - t_start) * 1000 / len(keywords)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scaling of the rule translator with the number of languages')
+    parser.add_argument('--languages', '-l', default='1,2,4,8', help='comma separated numbers of languages')
+    parser.add_argument('--keywords', '-n', type=int, default=500, help='number of keywords')
+    parser.add_argument('--workers', '-w', type=int, default=4, help='threads of the worker pool')
+    parser.add_argument('--predict_ms', type=float, default=0.0, help='delay of every mocked prediction')
+    args = parser.parse_args(argv)
+
+    from translators.data.rule import en
+
+    index_translator = quiet(IndexTranslator, results_cache_size=0)
+    keywords = corpora.oov_names(args.keywords // 2, seed=2) + corpora.index_names(
+        index_translator.people_index, args.keywords - args.keywords // 2, seed=4)
+    serial = quiet(RuleTranslator, phonetics_cache_size=0, results_cache_size=0, memory_path='', workers=0)
+    pooled = quiet(RuleTranslator, phonetics_cache_size=0, results_cache_size=0, memory_path='',
+                   workers=args.workers)
+    l_translators = [(serial, serial.rules['en']), (pooled, pooled.rules['en'])]
+
+    print('{:>10s}{:>10s}{:>14s}{:>10s}{:>10s}'.format('languages', 'phonetics', 'translate ms', 'many ms', 'pool ms'))
+    with corpora.mocked_model():
+        if args.predict_ms > 0:
+            en._pred_model = slow_model(args.predict_ms)
+        for rule_translator, _ in l_translators:  # Warm up
+            rule_translator.translate_many(keywords, [])
+        for n in [int(s) for s in args.languages.split(',')]:
+            for shared in (True, False):
+                for rule_translator, rule in l_translators:
+                    clone_languages(rule_translator, rule, n, shared)
+
+                def translate_each(l_keywords):
+                    for keyword in l_keywords:
+                        try:
+                            serial.translate(keyword, [])
+                        except Exception:  # Failing keywords cost the same as the others
+                            pass
+
+                print('{:10d}{:>10s}{:14.3f}{:10.3f}{:10.3f}'.format(
+                    n, 'shared' if shared else 'distinct', per_keyword(translate_each, keywords),
+                    per_keyword(lambda l_keywords: serial.translate_many(l_keywords, []), keywords),
+                    per_keyword(lambda l_keywords: pooled.translate_many(l_keywords, []), keywords)))
+
+
+if __name__ == '__main__':
+    main()
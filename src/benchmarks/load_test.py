@@ -0,0 +1,348 @@
+"""
+Load test of the web API: replays a stream of requests against a server started locally and reports throughput,
+ latency percentiles, error rate and the memory of the server over time.
+
+> python -m benchmarks.load_test --server flask --concurrency 16 --duration 30
+> python -m benchmarks.load_test --server prefork --workers 4 --rate 200 --duration 60
+> python -m benchmarks.load_test --server aio --log access.log --output results.json
+> python -m benchmarks.load_test --server "gunicorn -w 4 -b 127.0.0.1:{port} wsgi:app"
+
+Servers are "flask" (threaded development server), "aio" (aio_server.py), "prefork" (prefork_server.py with
+ --workers) or any command line started from "src/" with "{port}" in it, e.g. a WSGI server serving wsgi.py. The test
+ starts when "/api/ready" answers.
+
+Requests are synthetic by default, drawn with a fixed seed according to --mix from:
+ dictionary  GET /api/translate of names sampled from the name indexes
+ known       GET /api/translate of words of the phonetic dictionary (see benchmarks/corpora.py)
+ oov         GET /api/translate of made up names, which need a prediction
+ lang_codes  GET /api/lang_codes
+or replayed from --log, one request per line: JSON objects {"method": "POST", "path": "/api/translate", "json": {...}}
+ or access log lines with a request line such as "GET /api/translate?keyword=Alex&lang_codes=en HTTP/1.1".
+
+Clients loop in closed loop by default: each sends its next request once it has the previous answer. With --rate,
+ requests are scheduled at a fixed rate shared by the clients (open loop) and latencies count from the scheduled
+ time, so a server falling behind shows in the latencies instead of slowing down the load.
+
+Memory is the sum of the RSS and PSS of the server process and its descendants, sampled every --interval seconds
+ (Linux only).
+"""
+import os
+import re
+import sys
+import json
+import time
+import shlex
+import random
+import argparse
+import threading
+import http.client
+import urllib.parse
+
+from benchmarks import corpora
+from benchmarks.coalescing import PORT, FLASK_SERVER, start_server, percentile
+from benchmarks.prefork_memory import children
+from prefork_server import memory_of
+from translators import index_store
+
+DEFAULT_MIX = 'dictionary=0.4,known=0.2,oov=0.3,lang_codes=0.1'
+CORPUS_SIZE = 20000  # Synthetic requests drawn, replayed in a loop
+re_request_line = re.compile(r'"?(GET|POST|HEAD) (/\S*) HTTP/[\d.]+"?')
+
+
+def server_command(server, port, workers):
+    """
+    :param server: 'flask' | 'aio' | 'prefork' | a command line with "{port}"
+    :param port:
+    :param workers: number of workers of the "prefork" server
+    :return: list of arguments
+    """
+    if server == 'flask':
+        return [sys.executable, '-c', FLASK_SERVER.format(port)]
+    if server == 'aio':
+        return [sys.executable, 'aio_server.py', '--port', str(port)]
+    if server == 'prefork':
+        return [sys.executable, 'prefork_server.py', '--port', str(port), '--workers', str(workers)]
+    assert '{port}' in server, 'A server command line needs "{port}".'
+    return shlex.split(server.format(port=port))
+
+
+def translate_request(keyword, lang_codes='en'):
+    return 'GET', '/api/translate?' + urllib.parse.urlencode({'keyword': keyword, 'lang_codes': lang_codes}), None
+
+
+def synthetic_requests(mix, n=CORPUS_SIZE, seed=0):
+    """
+    :param mix: {'dictionary': <weight>, 'known': <weight>, 'oov': <weight>, 'lang_codes': <weight>}
+    :param n: number of requests
+    :param seed:
+    :return: list of (<method>, <path>, <JSON body bytes or None>)
+    """
+    index_names = []
+    for category in ('people', 'places'):
+        index = index_store.NameIndex(os.path.join('.', 'translators', 'data', 'index', category + '.idx'))
+        try:
+            index_names.extend(corpora.index_names(index, n // 2, seed))
+        finally:
+            index.close()
+    oov_names = corpora.oov_names(n, seed)
+    r = random.Random(seed)
+    kinds = r.choices(list(mix.keys()), list(mix.values()), k=n)
+    requests = []
+    for i, kind in enumerate(kinds):
+        if kind == 'dictionary':
+            requests.append(translate_request(r.choice(index_names)))
+        elif kind == 'known':
+            requests.append(translate_request(r.choice(corpora.DICTIONARY_WORDS)))
+        elif kind == 'oov':
+            requests.append(translate_request(oov_names[i]))
+        elif kind == 'lang_codes':
+            requests.append(('GET', '/api/lang_codes', None))
+        else:
+            raise ValueError('Unknown kind of request: {}'.format(kind))
+    return requests
+
+
+def logged_requests(log_path):
+    """
+    :param log_path: JSON lines or access log, see above
+    :return: list of (<method>, <path>, <JSON body bytes or None>)
+    """
+    requests = []
+    with open(log_path, encoding='utf8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('{'):
+                d_request = json.loads(line)
+                body = json.dumps(d_request['json']).encode('utf8') if 'json' in d_request else None
+                requests.append((d_request.get('method', 'GET'), d_request['path'], body))
+                continue
+            m = re_request_line.search(line)
+            if m:
+                requests.append((m.group(1), m.group(2), None))
+    assert requests, 'No request found in {}'.format(log_path)
+    return requests
+
+
+def process_tree(pid):
+    """
+    :return: pid and the pids of all its descendants
+    """
+    pids = [pid]
+    for child in children(pid):
+        pids.extend(process_tree(child))
+    return pids
+
+
+def server_memory(pid):
+    """
+    :return: (<RSS bytes>, <PSS bytes>) summed over the server process and its descendants
+    """
+    rss = pss = 0
+    for p in process_tree(pid):
+        try:
+            m = memory_of(p)
+        except OSError:  # Exited meanwhile
+            continue
+        rss += m['rss']
+        pss += m['pss']
+    return rss, pss
+
+
+class LoadTest:
+    def __init__(self, requests, concurrency, duration, rate=0.0, max_requests=0, timeout=60.0):
+        """
+        :param requests: list of (<method>, <path>, <body>), replayed in a loop
+        :param concurrency: number of clients
+        :param duration: seconds
+        :param rate: requests per second, 0 for closed loop
+        :param max_requests: stop after this number of requests, 0 for no limit
+        :param timeout: seconds to wait for an answer
+        """
+        self.requests = requests
+        self.concurrency = concurrency
+        self.duration = duration
+        self.rate = rate
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.results = []  # (<seconds since the start when sent>, <latency>, <status, 0 for a connection error>)
+        self._lock = threading.Lock()
+        self._next = 0
+        self._t_start = 0.0
+        self.elapsed = 0.0
+
+    def _take(self):
+        """
+        :return: (<number of the request>, <scheduled time>), None when the test is over
+        """
+        with self._lock:
+            k = self._next
+            self._next += 1
+        if self.max_requests and k >= self.max_requests:
+            return None
+        if self.rate:
+            t_scheduled = self._t_start + k / self.rate
+        else:
+            t_scheduled = time.perf_counter()
+        if t_scheduled - self._t_start >= self.duration:
+            return None
+        return k, t_scheduled
+
+    def _client(self):
+        conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=self.timeout)
+        l_results = []
+        while True:
+            taken = self._take()
+            if taken is None:
+                break
+            k, t_scheduled = taken
+            delay = t_scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            method, path, body = self.requests[k % len(self.requests)]
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=self.timeout)
+                status = 0
+            l_results.append((t_scheduled - self._t_start, time.perf_counter() - t_scheduled, status))
+        conn.close()
+        with self._lock:
+            self.results.extend(l_results)
+
+    def run(self, server_pid=None, interval=1.0):
+        """
+        :param server_pid: pid of the server whose memory is sampled, None not to sample it
+        :param interval: seconds between two samples
+        :return: [(<seconds since the start>, <RSS bytes>, <PSS bytes>), ...]
+        """
+        samples = []
+        done = threading.Event()
+
+        def sample():
+            while True:
+                samples.append((time.perf_counter() - self._t_start,) + server_memory(server_pid))
+                if done.wait(interval):
+                    break
+
+        self._t_start = time.perf_counter()
+        threads = [threading.Thread(target=self._client) for _ in range(self.concurrency)]
+        if server_pid is not None:
+            threads.append(threading.Thread(target=sample))
+        for t in threads:
+            t.start()
+        for t in threads[:self.concurrency]:
+            t.join()
+        self.elapsed = time.perf_counter() - self._t_start
+        done.set()
+        for t in threads[self.concurrency:]:
+            t.join()
+        if server_pid is not None:
+            samples.append((self.elapsed,) + server_memory(server_pid))
+        return samples
+
+
+def summarize(results, seconds):
+    """
+    :param results: list of (<sent>, <latency>, <status>)
+    :param seconds: duration the results were collected in
+    :return: {'requests', 'throughput', 'p50', 'p95', 'p99', 'max', 'error_rate'}, latencies in seconds
+    """
+    latencies = sorted(latency for _, latency, _ in results)
+    errors = sum(1 for _, _, status in results if status == 0 or status >= 500)
+    return {
+        'requests': len(results),
+        'throughput': len(results) / seconds if seconds else 0.0,
+        'p50': percentile(latencies, 50) if latencies else 0.0,
+        'p95': percentile(latencies, 95) if latencies else 0.0,
+        'p99': percentile(latencies, 99) if latencies else 0.0,
+        'max': latencies[-1] if latencies else 0.0,
+        'error_rate': errors / len(results) if results else 0.0,
+    }
+
+
+def report(results, samples, elapsed, interval):
+    """
+    Print a line per interval and the summary
+    :return: {'summary': <summarize()>, 'intervals': [...]}
+    """
+    mb = 1024 * 1024
+    intervals = []
+    print('{:>8s}{:>10s}{:>10s}{:>10s}{:>10s}{:>10s}{:>10s}'.format(
+        'time (s)', 'req/s', 'p50 ms', 'p99 ms', 'errors', 'RSS MiB', 'PSS MiB'))
+    n_intervals = max(1, int(elapsed / interval + 0.5))
+    for i in range(n_intervals):
+        t_start, t_end = i * interval, elapsed if i == n_intervals - 1 else (i + 1) * interval  # The last one is longer
+        window = [r for r in results if t_start <= r[0] < t_end]
+        l_samples = [s for s in samples if s[0] <= t_end] or samples[:1]
+        rss, pss = (l_samples[-1][1], l_samples[-1][2]) if l_samples else (0, 0)
+        d_window = summarize(window, t_end - t_start)
+        d_window.update({'time': t_end, 'rss': rss, 'pss': pss})
+        intervals.append(d_window)
+        print('{:8.1f}{:10.1f}{:10.2f}{:10.2f}{:10.1%}{:10.1f}{:10.1f}'.format(
+            t_end, d_window['throughput'], d_window['p50'] * 1000, d_window['p99'] * 1000, d_window['error_rate'],
+            rss / mb, pss / mb))
+    d_summary = summarize(results, elapsed)
+    if samples:
+        d_summary['peak_rss'] = max(s[1] for s in samples)
+        d_summary['peak_pss'] = max(s[2] for s in samples)
+    print('===================================================')
+    print('Requests     : {} in {:.1f} s, {:.1f} req/s'.format(d_summary['requests'], elapsed, d_summary['throughput']))
+    print('Latency (ms) : p50 {:.2f}, p95 {:.2f}, p99 {:.2f}, max {:.2f}'.format(
+        d_summary['p50'] * 1000, d_summary['p95'] * 1000, d_summary['p99'] * 1000, d_summary['max'] * 1000))
+    print('Error rate   : {:.2%}'.format(d_summary['error_rate']))
+    if samples:
+        print('Peak memory  : RSS {:.1f} MiB, PSS {:.1f} MiB'.format(d_summary['peak_rss'] / mb,
+                                                                  d_summary['peak_pss'] / mb))
+    print('===================================================')
+    return {'summary': d_summary, 'intervals': intervals}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test of the web API')
+    parser.add_argument('--server', '-s', default='flask',
+                        help='flask, aio, prefork or a command line with "{port}", default is flask')
+    parser.add_argument('--workers', '-w', type=int, default=4, help='workers of the prefork server')
+    parser.add_argument('--concurrency', '-c', type=int, default=16, help='number of clients')
+    parser.add_argument('--rate', '-r', type=float, default=0.0, help='requests per second, default is closed loop')
+    parser.add_argument('--duration', '-d', type=float, default=30.0, help='seconds')
+    parser.add_argument('--requests', '-n', type=int, default=0, help='stop after this number of requests')
+    parser.add_argument('--log', '-l', default=None, help='replay requests of this file instead of synthetic ones')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='weights of synthetic requests, default is ' + DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=0, help='seed of synthetic requests')
+    parser.add_argument('--interval', '-i', type=float, default=1.0, help='seconds per line of the report')
+    parser.add_argument('--output', '-o', default=None, help='also write the report as JSON')
+    args = parser.parse_args(argv)
+
+    if args.log:
+        requests = logged_requests(args.log)
+    else:
+        mix = {k: float(v) for k, v in (item.split('=') for item in args.mix.split(','))}
+        requests = synthetic_requests(mix, seed=args.seed)
+    command = server_command(args.server, PORT, args.workers)
+    print('Starting "{}" ...'.format(' '.join(command)))
+    process = start_server(command)
+    try:
+        print('{} clients, {}, {:.0f} s, {} distinct requests'.format(
+            args.concurrency, '{:.0f} req/s'.format(args.rate) if args.rate else 'closed loop', args.duration,
+            len(set(requests))))
+        test = LoadTest(requests, args.concurrency, args.duration, args.rate, args.requests)
+        samples = test.run(process.pid, args.interval)
+    finally:
+        process.terminate()
+        process.wait()
+    d_report = report(test.results, samples, test.elapsed, args.interval)
+    if args.output:
+        d_report['args'] = vars(args)
+        d_report['samples'] = samples
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(d_report, f, indent=1)
+        print('Report written to "{}"'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
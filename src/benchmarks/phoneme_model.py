@@ -0,0 +1,145 @@
+"""
+Benchmark of the NumPy prediction model (translators/phoneme_model.py) against big_phoney's Keras model: load time,
+ resident memory, prediction speed and agreement of the results, each model in its own process.
+
+> python -m benchmarks.phoneme_model [--words 500] [--word_list words.txt]
+
+Words are held out of the phonetic dictionary, i.e. words the model never saw when it was trained and the only ones
+ rule modules send to it: names of the indexes and made up names (see benchmarks/corpora.py) which are not in the
+ dictionary, or those of --word_list, one per line.
+
+ load ms    importing the model and loading its weights
+ MiB        resident memory taken by the model once loaded and used
+ one ms     mean time of predict() for a word, big_phoney's own PredictionModel.predict() for Keras
+ batch ms   mean time per word of a predict_many() call for all words
+
+Batched results must equal those of predict(). Results of the NumPy model are compared with those of Keras word by
+ word. The Keras model is skipped if TensorFlow is not installed.
+"""
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import contextlib
+
+from benchmarks import corpora
+from benchmarks.index_memory import rss
+
+BACKENDS = ('keras', 'numpy')
+
+
+def held_out_words(n, seed=0):
+    """
+    :param n: number of words
+    :param seed:
+    :return: list of distinct names which are not in the phonetic dictionary, half from the indexes
+    """
+    from translators import phoneme_model
+    from translators.translator import IndexTranslator
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        index_translator = IndexTranslator(results_cache_size=0)
+    phonetic_dict = phoneme_model.PhoneticDictionary()
+    l_index_names = []
+    for _, index, _ in index_translator.indexes:
+        l_index_names.extend(corpora.index_names(index, n, seed))
+    d_words = {}  # Distinct, in a reproducible order
+    for candidates, max_size in ((l_index_names, n // 2), (corpora.oov_names(2 * n, seed), n)):
+        for word in candidates:
+            if len(d_words) >= max_size:
+                break
+            if word.isalpha() and phonetic_dict.lookup(word) is None:
+                d_words[word] = None
+    return list(d_words.keys())
+
+
+def measure(backend, words):
+    """
+    Load a model in the current process
+    :param backend: one of BACKENDS
+    :param words: list of words to predict
+    :return: {'load': s, 'rss': bytes, 'one': s per word, 'batch': s per word, 'results': [...]}
+    """
+    rss_start = rss()
+    t_start = time.perf_counter()
+    from translators import phoneme_model
+    if backend == 'keras':
+        model = phoneme_model.KerasPredictionModel()
+        predict = model.model.predict
+    else:
+        model = phoneme_model.load()
+        predict = model.predict
+    t_load = time.perf_counter() - t_start
+    predict(words[0])  # First calls build Keras' prediction functions
+    model.predict_many(words[:2])
+
+    t_start = time.perf_counter()
+    results = [predict(word) for word in words]
+    t_one = (time.perf_counter() - t_start) / len(words)
+    t_start = time.perf_counter()
+    batch_results = model.predict_many(words)
+    t_batch = (time.perf_counter() - t_start) / len(words)
+    assert batch_results == results, 'Batched and single results differ.'
+    return {'load': t_load, 'rss': rss() - rss_start, 'one': t_one, 'batch': t_batch, 'results': results}
+
+
+def run(backend, path):
+    """
+    Measure a model in a new process
+    :param backend: one of BACKENDS
+    :param path: file of the words, one per line
+    :return: see measure(), None if the model cannot be loaded
+    """
+    process = subprocess.run([sys.executable, '-m', 'benchmarks.phoneme_model', '--child', backend,
+                              '--word_list', path], stdout=subprocess.PIPE)
+    if process.returncode != 0:
+        return None
+    return json.loads(process.stdout.decode('utf8').strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of the NumPy prediction model against Keras')
+    parser.add_argument('--words', '-n', type=int, default=500, help='number of held out words')
+    parser.add_argument('--word_list', '-w', default='', help='file of the words to predict, one per line')
+    parser.add_argument('--child', default='', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        with open(args.word_list, encoding='utf8') as f:
+            words = [line.strip() for line in f if line.strip()]
+        with contextlib.redirect_stdout(io.StringIO()):
+            r = measure(args.child, words)
+        print(json.dumps(r))
+        return
+    if args.word_list:
+        path = args.word_list
+    else:
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf8') as f:
+            f.write('\n'.join(held_out_words(args.words)))
+            path = f.name
+
+    mb = 1024 * 1024
+    d_results = {}
+    print('{:8s}{:>10s}{:>10s}{:>10s}{:>10s}'.format('model', 'load ms', 'MiB', 'one ms', 'batch ms'))
+    for backend in BACKENDS:
+        r = run(backend, path)
+        if r is None:
+            print('{:8s}{:>10s}'.format(backend, 'failed'))
+            continue
+        d_results[backend] = r['results']
+        print('{:8s}{:10.0f}{:10.1f}{:10.2f}{:10.2f}'.format(
+            backend, r['load'] * 1000, r['rss'] / mb, r['one'] * 1000, r['batch'] * 1000))
+    if len(d_results) == len(BACKENDS):
+        l_differ = [(k, n) for k, n in zip(d_results['keras'], d_results['numpy']) if k != n]
+        total = len(d_results['keras'])
+        print('Same results for {} of {} words ({:.1%})'.format(
+            total - len(l_differ), total, 1 - len(l_differ) / total))
+        for keras_result, numpy_result in l_differ[:10]:
+            print('  keras: {:30s} numpy: {}'.format(keras_result, numpy_result))
+
+
+if __name__ == '__main__':
+    main()
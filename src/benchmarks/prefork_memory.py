@@ -0,0 +1,84 @@
+"""
+Memory of the pre-fork serving mode (prefork_server.py) with 1, 4 and 16 workers, with and without gc.freeze().
+
+> python -m benchmarks.prefork_memory [--workers 1,4,16] [--requests 2000]
+
+Each server is started in its own process and waited for until "/api/ready", then sent translate requests (made up
+ names and dictionary words, see benchmarks/coalescing.py) so that workers dirty pages as they do in production.
+ Memory is read from /proc (Linux only):
+
+ uss    unique memory of a worker: pages only it uses, i.e. what each additional worker costs
+ pss    its share of the pages, shared pages being divided among the processes using them
+ total  sum of the pss of the master and the workers, the memory the server actually takes
+ apart  rss of the master times the number of workers: about what as many processes loading the app each would take
+"""
+import os
+import sys
+import time
+import argparse
+
+from benchmarks.coalescing import PORT, make_corpus, start_server, run_load
+from prefork_server import memory_of
+
+
+def children(pid):
+    """
+    :param pid:
+    :return: pids of the child processes of pid
+    """
+    pids = []
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open('/proc/{}/stat'.format(name)) as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+                pids.append(int(name))
+    return pids
+
+
+def measure(workers, freeze, n_requests):
+    """
+    :param workers: number of workers
+    :param freeze: whether the master freezes its objects
+    :param n_requests: number of translate requests sent before measuring
+    :return: {'master': <memory_of()>, 'workers': [<memory_of()>, ...]}
+    """
+    args = [sys.executable, 'prefork_server.py', '--port', str(PORT), '--workers', str(workers)]
+    if not freeze:
+        args.append('--no_freeze')
+    process = start_server(args)
+    try:
+        run_load(make_corpus(n_requests), min(16, max(4, workers)))
+        time.sleep(0.5)
+        return {'master': memory_of(process.pid), 'workers': [memory_of(pid) for pid in children(process.pid)]}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Memory of the pre-fork serving mode')
+    parser.add_argument('--workers', '-w', default='1,4,16', help='comma separated numbers of workers')
+    parser.add_argument('--requests', '-n', type=int, default=2000, help='translate requests sent before measuring')
+    args = parser.parse_args(argv)
+
+    mb = 1024 * 1024
+    print('{:>8s}{:>8s}{:>12s}{:>14s}{:>14s}{:>12s}{:>12s}'.format(
+        'workers', 'freeze', 'master MiB', 'uss / worker', 'pss / worker', 'total MiB', 'apart MiB'))
+    for workers in [int(w) for w in args.workers.split(',')]:
+        for freeze in (True, False):
+            r = measure(workers, freeze, args.requests)
+            l_workers = r['workers']
+            print('{:8d}{:>8s}{:12.1f}{:14.1f}{:14.1f}{:12.1f}{:12.1f}'.format(
+                workers, 'yes' if freeze else 'no', r['master']['rss'] / mb,
+                sum(m['uss'] for m in l_workers) / len(l_workers) / mb,
+                sum(m['pss'] for m in l_workers) / len(l_workers) / mb,
+                (r['master']['pss'] + sum(m['pss'] for m in l_workers)) / mb,
+                r['master']['rss'] * workers / mb))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""
+Startup benchmark of RuleTranslator: cold parsing of "*.rule" files vs loading the precompiled "*.rulec" cache
+"""
+import io
+import sys
+import timeit
+import contextlib
+
+from translators.translator import RuleTranslator
+
+
+def quiet_init(use_cache):
+    """
+    Initialize a RuleTranslator without its loading messages
+    :param use_cache:
+    :return: RuleTranslator
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return RuleTranslator(use_rule_cache=use_cache)
+
+
+def main(repeat=20):
+    quiet_init(use_cache=True)  # Import ".py" rule modules and make sure "*.rulec" files are up to date
+    cold = min(timeit.repeat(lambda: quiet_init(use_cache=False), number=1, repeat=repeat))
+    cached = min(timeit.repeat(lambda: quiet_init(use_cache=True), number=1, repeat=repeat))
+    print('Rule loading (best of {}):'.format(repeat))
+    print('  cold parse  : {:8.2f} ms'.format(cold * 1000))
+    print('  cached load : {:8.2f} ms'.format(cached * 1000))
+    print('  speedup     : {:8.2f}x'.format(cold / cached))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,71 @@
+"""
+Startup benchmark: time from launching a new process to its first responses.
+
+ web: import the Flask app and query /api/lang_codes, /api/translate (dictionary word) and /api/translate
+      (out of dictionary word) with the test client.
+ cli: run "cli.py suggest" (index only) and "cli.py translate" on a one-word file.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+WEB_CLIENT = '''
+import io, sys, time, json, contextlib
+with contextlib.redirect_stdout(io.StringIO()):
+    from app import app
+client = app.test_client()
+marks = {'import': time.time()}
+client.get('/api/lang_codes')
+marks['lang_codes'] = time.time()
+client.post('/api/translate', json={'keyword': 'Alex', 'lang_codes': 'en'})
+marks['translate (dictionary word)'] = time.time()
+client.post('/api/translate', json={'keyword': 'Zyxwvut', 'lang_codes': 'en'})
+marks['translate (out of dictionary)'] = time.time()
+print(json.dumps(marks))
+'''
+
+
+def run_web():
+    """
+    :return: [(<mark>, <seconds since launching>), ...]
+    """
+    t_start = time.time()
+    out = subprocess.run([sys.executable, '-c', WEB_CLIENT], stdout=subprocess.PIPE, check=True).stdout
+    marks = json.loads(out.decode('utf8').strip().splitlines()[-1])
+    return [(k, v - t_start) for k, v in sorted(marks.items(), key=lambda kv: kv[1])]
+
+
+def run_cli():
+    """
+    :return: [(<command>, <seconds until the process exits>), ...]
+    """
+    results = []
+    t_start = time.time()
+    subprocess.run([sys.executable, 'cli.py', 'suggest', 'Alex'], stdout=subprocess.DEVNULL, check=True)
+    results.append(('cli.py suggest', time.time() - t_start))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'words.txt')
+        with open(input_path, 'w', encoding='utf8') as f:
+            f.write('Alex\n')
+        t_start = time.time()
+        subprocess.run([sys.executable, 'cli.py', 'translate', '-i', input_path, '-o', os.path.join(tmp_dir, 'out.tsv'),
+                        '-p', '1'], stdout=subprocess.DEVNULL, check=True)
+        results.append(('cli.py translate (1 word)', time.time() - t_start))
+    return results
+
+
+def main():
+    print('Time to first response (seconds since launching the process):')
+    print('web:')
+    for mark, seconds in run_web():
+        print('  {:32s}{:8.3f} s'.format(mark, seconds))
+    print('cli:')
+    for command, seconds in run_cli():
+        print('  {:32s}{:8.3f} s'.format(command, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,319 @@
+import os
+import hmac
 import json
+import time
+import shutil
+import tempfile
 
+import http_cache
 from flask import Response, Blueprint, request
-from app import index_translator, rule_translator
+from app import index_translator, rule_translator, reloader
+from translators import metrics, index_store
+from translators.cache import LRUCache
+from translators.translator import NoRuleMatched
 
 api_bp = Blueprint('api', __name__)
 
+BATCH_CHUNK_SIZE = 256  # Number of keywords sent to the translators at once in a batch
+BATCH_DEDUPE_SIZE = 65536  # Number of recent distinct keywords remembered to skip duplicates in a batch
+ADMIN_TOKEN_ENV = 'PPAT_ADMIN_TOKEN'
 
-@api_bp.route('/api/translate', methods=['POST'])
-def translate():
+
+def translation_version():
+    """
+    Content version of translations, read it before the translators
+    :return: str
+    """
+    return rule_translator.version[:16] + index_translator.version[:16]
+
+
+def parse_lang_codes(s_lang_codes):
+    """
+    :param s_lang_codes: comma separated language codes, e.g. 'fr,en'
+    :return: sorted list without empty codes, e.g. ['en', 'fr'], empty for all languages. Results of the translators
+             are in the order of the loaded rules whatever the order of lang_codes.
+    """
+    return sorted(c for c in s_lang_codes.split(',') if c)
+
+
+def translation_key(keyword, lang_codes):
     """
-    Translate API
     :param keyword:
-    :return:
+    :param lang_codes: list given by parse_lang_codes()
+    :return: key of a translation in the response cache, keywords are case insensitive like the translators
+    """
+    return 'translate', keyword.capitalize(), tuple(lang_codes)
+
+
+def render_translation(r_result, keyword):
+    """
+    Serialize the answer of "/api/translate"
+    :param r_result: result of RuleTranslator.translate() or the exception it raised
+    :param keyword:
+    :return: (<body bytes>, <cacheable>), errors other than NoRuleMatched may be transient and are not cacheable
+    """
+    cacheable = not isinstance(r_result, Exception) or isinstance(r_result, NoRuleMatched)
+    if isinstance(r_result, Exception):
+        r_result = str(r_result)
+    result = {'index': index_translator.search(keyword), 'rule': r_result}
+    return json.dumps(result).encode('utf8'), cacheable
+
+
+def _json_body():
+    """
+    :return: the JSON object of the request body, None if the body is not one
     """
-    assert request.method == 'POST'
-    keyword = request.json.get('keyword', '')
-    lang_codes = request.json.get('lang_codes', []).split(',')
+    body = request.get_json(silent=True)
+    return body if isinstance(body, dict) else None
+
+
+def _bad_request(message):
+    return Response(json.dumps({'error': message}), status=400)
+
+
+def _translate(keyword, lang_codes):
     try:
         r_result = rule_translator.translate(keyword, lang_codes)
     except Exception as e:
-        r_result = str(e)
-    result = {'index': index_translator.search(keyword), 'rule': r_result}
+        r_result = e
+    return render_translation(r_result, keyword)
+
+
+@api_bp.route('/api/translate', methods=['GET', 'POST'])
+def translate():
+    """
+    Translate API, parameters in the JSON body of a POST or in the query string of a GET.
+     Answers are cached by content version, see http_cache.py.
+    :param keyword:
+    :param lang_codes: comma separated, default is all
+    :param timing: optional, if true the response has a "timing" breakdown in milliseconds by stage and is not
+                   cached
+    :return:
+    """
+    params = _json_body() if request.method == 'POST' else request.args
+    if params is None:
+        return _bad_request('Request body should be a JSON object.')
+    keyword = params.get('keyword', '')
+    lang_codes = parse_lang_codes(params.get('lang_codes', ''))
+    if params.get('timing') in (None, False, 0, '', '0', 'false'):
+        version = translation_version()
+        body, s_etag = http_cache.cached(version, translation_key(keyword, lang_codes),
+                                         lambda: _translate(keyword, lang_codes))
+        return http_cache.response(body, s_etag)
+
+    t_start = time.perf_counter()
+    with metrics.collect() as timings:
+        try:
+            r_result = rule_translator.translate(keyword, lang_codes)
+        except Exception as e:
+            r_result = str(e)
+        result = {'index': index_translator.search(keyword), 'rule': r_result}
+    timings['total'] = time.perf_counter() - t_start
+    result['timing'] = {name: round(seconds * 1000, 3) for name, seconds in sorted(timings.items())}
     return Response(json.dumps(result))
 
 
+def _iter_batch_keywords(upload, keywords):
+    """
+    Keywords of a batch request: one keyword per line of the uploaded file,
+     or the "keywords" list of the JSON body.
+    :param upload: a binary file object or None
+    :param keywords: list of keywords used if there is no upload
+    :return: generator of stripped, non-empty keywords
+    """
+    if upload is not None:
+        with upload:
+            for line in upload:
+                keyword = line.decode('utf8', errors='replace').strip()
+                if keyword:
+                    yield keyword
+    else:
+        for keyword in keywords:
+            keyword = str(keyword).strip()
+            if keyword:
+                yield keyword
+
+
+def _iter_chunks(keywords, size):
+    """
+    Deduplicate keywords (case insensitive like the translators) and group them into lists of size.
+     Only the last BATCH_DEDUPE_SIZE distinct keywords are remembered, so that memory stays bounded for any input.
+    :param keywords: iterable of str
+    :param size:
+    :return: generator of lists
+    """
+    seen = LRUCache(BATCH_DEDUPE_SIZE)
+    chunk = []
+    for keyword in keywords:
+        if seen.get(keyword.capitalize()) is not None:
+            continue
+        seen.put(keyword.capitalize(), True)
+        chunk.append(keyword)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _translate_chunk(keywords, lang_codes):
+    """
+    Translate a chunk of keywords by both translators
+    :param keywords: list of distinct keywords
+    :param lang_codes: list
+    :return: generator of results like the ones of translate()
+    """
+    l_valid = [keyword for keyword in keywords if ' ' not in keyword]
+    r_results = dict(zip(l_valid, rule_translator.translate_many(l_valid, lang_codes)))
+    for keyword in keywords:
+        if keyword not in r_results:
+            yield {'keyword': keyword, 'error': 'Spaces are not permitted in a keyword.'}
+            continue
+        r_result = r_results[keyword]
+        if isinstance(r_result, Exception):
+            r_result = str(r_result)
+        yield {'keyword': keyword, 'index': index_translator.search(keyword), 'rule': r_result}
+
+
+@api_bp.route('/api/translate/batch', methods=['POST'])
+def translate_batch():
+    """
+    Batch translate API
+    Accept a JSON body {"keywords": [...], "lang_codes": "en,fr"} or a form with an uploaded "file" (one keyword per
+     line) and a "lang_codes" field. Duplicated keywords are translated once.
+    :return: NDJSON stream, one line per distinct keyword in the order of input
+    """
+    upload = None
+    keywords = []
+    if 'file' in request.files:
+        s_lang_codes = request.form.get('lang_codes', '')
+        # Uploaded files are closed with the request, keep a copy on disk for the response stream
+        upload = tempfile.TemporaryFile()
+        shutil.copyfileobj(request.files['file'].stream, upload)
+        upload.seek(0)
+    else:
+        params = _json_body()
+        if params is None:
+            return _bad_request('Request body should be a JSON object or a form with a "file".')
+        s_lang_codes = params.get('lang_codes', '')
+        keywords = params.get('keywords', [])
+        if not isinstance(keywords, list):
+            return _bad_request('keywords should be a list.')
+    lang_codes = parse_lang_codes(s_lang_codes)
+
+    def generate():
+        for chunk in _iter_chunks(_iter_batch_keywords(upload, keywords), BATCH_CHUNK_SIZE):
+            for result in _translate_chunk(chunk, lang_codes):
+                yield json.dumps(result) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@api_bp.route('/api/suggest', methods=['POST'])
+def suggest():
+    """
+    Approximate search API for spelling variants or autocomplete
+    :param keyword: up to index_store.MAX_KEYWORD_LENGTH characters
+    :param max_edits: optional, default is 1
+    :param limit: optional, default is 10
+    :param prefix: optional, default is false
+    :return:
+    """
+    params = _json_body()
+    if params is None:
+        return _bad_request('Request body should be a JSON object.')
+    keyword = params.get('keyword', '')
+    # Checked here as well as by the index, the cost of a fuzzy lookup grows with the square of the keyword length
+    if not isinstance(keyword, str) or len(keyword) > index_store.MAX_KEYWORD_LENGTH:
+        return _bad_request('keyword should be a string of at most {} characters.'.format(
+            index_store.MAX_KEYWORD_LENGTH))
+    try:
+        result = index_translator.suggest(keyword,
+                                          max_edits=int(params.get('max_edits', 1)),
+                                          limit=int(params.get('limit', 10)),
+                                          prefix=bool(params.get('prefix', False)))
+    except (AssertionError, ValueError, TypeError) as e:
+        return _bad_request(str(e) or 'Invalid parameters.')
+    return Response(json.dumps(result))
+
+
+@api_bp.route('/api/reverse', methods=['POST'])
+def reverse():
+    """
+    Reverse lookup API: names of the dictionary transliterated into a Chinese variant
+    :param chinese:
+    :param substring: optional, default is false
+    :param limit: optional, default is 20
+    :return:
+    """
+    params = _json_body()
+    if params is None:
+        return _bad_request('Request body should be a JSON object.')
+    chinese = params.get('chinese', '')
+    try:
+        result = index_translator.reverse(chinese,
+                                          substring=bool(params.get('substring', False)),
+                                          limit=int(params.get('limit', 20)))
+    except (AssertionError, ValueError, TypeError) as e:
+        return _bad_request(str(e) or 'Invalid parameters.')
+    return Response(json.dumps(result))
+
+
+@api_bp.route('/api/ready')
+def ready():
+    """
+    Report which subsystems are loaded. Status is 503 until all of them are ready.
+    :return:
+    """
+    subsystems = {'index': True, 'rules': bool(rule_translator.rules)}
+    subsystems.update(rule_translator.loaded_resources())
+    r = {'ready': all(subsystems.values()), 'subsystems': subsystems}
+    return Response(json.dumps(r), status=200 if r['ready'] else 503)
+
+
+@api_bp.route('/api/metrics')
+def prometheus_metrics():
+    """
+    Stage latency histograms and cache counters in the Prometheus text format
+    :return:
+    """
+    d_caches = {'index_results': index_translator.cache_stats()['results'],
+                'http_responses': http_cache.response_cache.stats()}
+    for name, stats in rule_translator.cache_stats().items():
+        d_caches['rule_' + name] = stats
+    body = metrics.render() + metrics.render_cache_stats(d_caches)
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+@api_bp.route('/api/admin/reload', methods=['POST'])
+def admin_reload():
+    """
+    Reload changed rule and index files, see translators/reloader.py.
+     Requires the "X-Admin-Token" header matching $PPAT_ADMIN_TOKEN, the endpoint is disabled if it is not set.
+     The address of the client cannot be trusted: behind a reverse proxy every request comes from the local host.
+    :return: the reload report
+    """
+    token = os.environ.get(ADMIN_TOKEN_ENV)
+    if not token:
+        return Response(json.dumps({'error': 'Set ${} to enable this endpoint.'.format(ADMIN_TOKEN_ENV)}),
+                        status=403)
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode('utf8'), token.encode('utf8')):
+        return Response(json.dumps({'error': 'Forbidden.'}), status=403)
+    return Response(json.dumps(reloader.reload()))
+
+
 @api_bp.route('/api/lang_codes')
 def lang_codes():
     """
     Get all available language codes
     :return:
     """
-    r = {'lang_codes': {}}
-    for lang_code in rule_translator.rules.keys():
-        r['lang_codes'][lang_code] = rule_translator.rules[lang_code]['meta']['language_name']
-    return Response(json.dumps(r))
+    def render():
+        r = {'lang_codes': {}}
+        for lang_code in rules.keys():
+            r['lang_codes'][lang_code] = rules[lang_code]['meta']['language_name']
+        return json.dumps(r).encode('utf8'), True
+
+    version = rule_translator.version
+    rules = rule_translator.rules
+    return http_cache.response(*http_cache.cached(version, 'lang_codes', render))
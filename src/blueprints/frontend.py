@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template
 
+import http_cache
 from app import rule_translator
 
 frontend_bp = Blueprint('frontend', __name__)
@@ -8,11 +9,16 @@ frontend_bp = Blueprint('frontend', __name__)
 @frontend_bp.route('/')
 def index():
     """
-    Response the index page HTML
+    Response the index page HTML, cached by the version of the rules
 
     :return:
     """
-    lang_codes = {}
-    for lang_code in rule_translator.rules.keys():
-        lang_codes[lang_code] = rule_translator.rules[lang_code]['meta']['language_name']
-    return render_template('index.html', lang_codes=lang_codes)
+    def render():
+        lang_codes = {}
+        for lang_code in rules.keys():
+            lang_codes[lang_code] = rules[lang_code]['meta']['language_name']
+        return render_template('index.html', lang_codes=lang_codes).encode('utf8'), True
+
+    version = rule_translator.version
+    rules = rule_translator.rules
+    return http_cache.response(*http_cache.cached(version, 'index.html', render))
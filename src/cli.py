@@ -1,19 +1,46 @@
 """
 Transliterate in CLI mode
+
+> python cli.py                                              # Interactive mode
+> python cli.py translate --input FILE --output FILE [-l en]  # Translate a localization file or a word list
+> python cli.py build_index                                  # Rebuild "data/index/*.idx" from the JSON files
+> python cli.py suggest KEYWORD [--max_edits 1] [--prefix]     # Approximate search in the dictionary
+> python cli.py reverse CHINESE [--substring] [--limit 20]   # Names of the dictionary by their Chinese
+> python cli.py phoneme_service [--workers 2]                # Share one prediction model between processes
+> python cli.py build_tables [-l en] [--force]               # Precompute results of known words by rules
+> python cli.py memory [--prune]                             # Hit ratio of the translation memory
+> python cli.py export_model [--output FILE]                 # Export the prediction model for NumPy
 """
+import io
+import os
+import re
+import sys
+import time
+import argparse
+import contextlib
+import multiprocessing
+
+from translators import index_store, reverse_index, rule_table, rule_cache, phoneme_service, memory, phoneme_model
 from translators.translator import IndexTranslator, RuleTranslator
 
+CHUNK_SIZE = 256  # Number of names sent to a worker at once
+FORMATS = ('csv', 'yml', 'txt')
+DEFAULT_ENCODINGS = {'csv': 'cp1252', 'yml': 'utf-8-sig', 'txt': 'utf8'}  # CK2 CSV, EU4 YAML and word lists
 
-if __name__ == '__main__':
+re_word = re.compile(r'[^\W\d_]+')  # A name without spaces, digits or punctuations
+re_yml_entry = re.compile(r'^\s*([^\s#:]+):\d*\s*"(.*)"\s*$')  # ' PROV1:0 "Stockholm"'
+
+
+def interactive():
     print("""!!!Welcome to Places & People Automate Translator!!!
      /$$$$$$$  /$$$$$$$   /$$$$$$  /$$$$$$$$
     | $$__  $$| $$__  $$ /$$__  $$|__  $$__/
-    | $$  \ $$| $$  \ $$| $$  \ $$   | $$   
-    | $$$$$$$/| $$$$$$$/| $$$$$$$$   | $$   
-    | $$____/ | $$____/ | $$__  $$   | $$   
-    | $$      | $$      | $$  | $$   | $$   
-    | $$      | $$      | $$  | $$   | $$   
-    |__/      |__/      |__/  |__/   |__/   
+    | $$  \ $$| $$  \ $$| $$  \ $$   | $$
+    | $$$$$$$/| $$$$$$$/| $$$$$$$$   | $$
+    | $$____/ | $$____/ | $$__  $$   | $$
+    | $$      | $$      | $$  | $$   | $$
+    | $$      | $$      | $$  | $$   | $$
+    |__/      |__/      |__/  |__/   |__/
     """)
 
     index_translator = IndexTranslator()
@@ -26,7 +53,7 @@ if __name__ == '__main__':
     print("""Usage:
     Type names and hit ENTER to get transliterations.
     Use option "-l" to specify language codes. Available codes are:
-    
+
     {}
     Default is ALL language codes.
     Use Ctrl+C to quit.
@@ -55,3 +82,429 @@ if __name__ == '__main__':
         for d_r in r_result['transliterations']:
             print('{}\t{}\t{}\t{}'.format(d_r['keyword'], d_r['language'], d_r['category'], d_r['chinese']))
         print('===================================================')
+
+
+def available_lang_codes():
+    """
+    Language codes of the "*.rule" files, without loading them
+    :return: list
+    """
+    return [os.path.splitext(f)[0] for f in os.listdir(os.path.join('.', 'translators', 'data', 'rule'))
+            if os.path.splitext(f)[1] == '.rule']
+
+
+def iter_records(input_file, file_format):
+    """
+    Read (key, text) records of a localization file line by line
+     csv: CK2 localization, "KEY;ENGLISH;FRENCH;..." The english column is translated.
+     yml: EU4 localization, ' KEY:0 "English"'
+     txt: one name per line, the name is also the key
+    :param input_file: opened text file
+    :param file_format: 'csv' | 'yml' | 'txt'
+    :return: generator of (key, text)
+    """
+    for line in input_file:
+        line = line.rstrip('\r\n')
+        if file_format == 'csv':
+            if line.startswith('#'):
+                continue
+            columns = line.split(';')
+            if len(columns) > 1 and columns[1]:
+                yield columns[0], columns[1]
+        elif file_format == 'yml':
+            m = re_yml_entry.match(line)
+            if m is not None:
+                yield m.group(1), m.group(2)
+        elif line.strip():
+            yield line.strip(), line.strip()
+
+
+def iter_names(records):
+    """
+    Split texts of records into names which could be translated
+    :param records: iterable of (key, text)
+    :return: generator of (key, name)
+    """
+    for key, text in records:
+        for name in re_word.findall(text):
+            yield key, name
+
+
+def iter_chunks(iterable, size):
+    """
+    :param iterable:
+    :param size:
+    :return: generator of lists of size
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+_index_translator = None
+_rule_translator = None
+_lang_codes = []
+
+
+def _init_worker(lang_codes):
+    """
+    Load translators once per worker process
+    :param lang_codes:
+    """
+    global _index_translator, _rule_translator, _lang_codes
+    with contextlib.redirect_stdout(io.StringIO()):  # Do not repeat loading messages in every worker
+        _index_translator = IndexTranslator()
+        _rule_translator = RuleTranslator()
+    _lang_codes = lang_codes
+
+
+def _translate_chunk(chunk):
+    """
+    Translate a chunk of names in a worker process
+    :param chunk: list of (key, name)
+    :return: (<rows of the chunk>, <number of names>, <pid>, <cache stats of the worker>)
+    """
+    rows = []
+    r_results = _rule_translator.translate_many([name for _, name in chunk], _lang_codes)
+    for (key, name), r_result in zip(chunk, r_results):
+        for t in _index_translator.lookup(name):
+            rows.append((key, name, 'Dictionary', t.language, t.category, t.chinese))
+        if isinstance(r_result, Exception):
+            rows.append((key, name, 'Rule', '', '', 'ERROR: ' + ' '.join(str(r_result).split())))
+            continue
+        for t in r_result['transliterations']:
+            rows.append((key, name, 'Rule', t['language'], t['category'], t['chinese']))
+    if _rule_translator.memory is not None:  # Pool workers exit without running atexit functions
+        _rule_translator.memory.flush()
+    stats = {'index': _index_translator.cache_stats(), 'rule': _rule_translator.cache_stats()}
+    return rows, len(chunk), os.getpid(), stats
+
+
+def _hit_rate(d_stats, translator, cache):
+    """
+    :param d_stats: {<pid>: <latest cache stats of the worker>}
+    :return: hit rate of a cache summed over workers
+    """
+    hits = sum(stats[translator][cache]['hits'] for stats in d_stats.values() if cache in stats[translator])
+    misses = sum(stats[translator][cache]['misses'] for stats in d_stats.values() if cache in stats[translator])
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+def translate_file(args):
+    """
+    Translate a localization file or a word list. Names are streamed through a pool of worker processes and rows
+     of results are written to the output file in the order of input as soon as they are ready.
+    :param args: parsed arguments of the "translate" command
+    """
+    file_format = args.format
+    if file_format == 'auto':
+        file_format = os.path.splitext(args.input)[1].lstrip('.').lower()
+        file_format = 'yml' if file_format == 'yaml' else file_format
+        if file_format not in FORMATS:
+            file_format = 'txt'
+    encoding = args.encoding or DEFAULT_ENCODINGS[file_format]
+    l_available_codes = available_lang_codes()
+    for c in args.lang_codes:
+        if c not in l_available_codes:
+            print('ERROR: "{}" is not an available language code.'.format(c))
+            exit(1)
+
+    print('Translating "{}" ({}, {}) with {} processes ...'.format(args.input, file_format, encoding, args.processes))
+    t_start = time.time()
+    n_names = 0
+    d_stats = {}
+    with open(args.input, 'r', encoding=encoding, errors='replace') as input_file, \
+            open(args.output, 'w', encoding='utf8') as output_file, \
+            multiprocessing.Pool(args.processes, _init_worker, (args.lang_codes,)) as pool:
+        output_file.write('Key\tKeyword\tFrom\tLanguage\tCategory\tChinese\n')
+        chunks = iter_chunks(iter_names(iter_records(input_file, file_format)), CHUNK_SIZE)
+        for rows, n, pid, stats in pool.imap(_translate_chunk, chunks):
+            output_file.writelines('\t'.join(row) + '\n' for row in rows)
+            n_names += n
+            d_stats[pid] = stats
+    t_elapsed = time.time() - t_start
+
+    print('===================================================')
+    print('Names translated : {}'.format(n_names))
+    print('Elapsed          : {:.2f} s'.format(t_elapsed))
+    print('Throughput       : {:.1f} names/s'.format(n_names / t_elapsed if t_elapsed else 0.0))
+    print('Cache hit rate   : rule {:.1%}, dictionary {:.1%}'.format(
+        _hit_rate(d_stats, 'rule', 'results'), _hit_rate(d_stats, 'index', 'results')))
+    if memory.memory_path():
+        print('Memory hit rate  : {:.1%} of the words out of the precomputed tables'.format(
+            _hit_rate(d_stats, 'rule', 'memory')))
+    print('Output written to "{}"'.format(args.output))
+    print('===================================================')
+
+
+def build_index(args):
+    """
+    Rebuild name indexes from "data/index/people.json" and "places.json", and their reverse indexes
+    :param args: parsed arguments of the "build_index" command
+    """
+    for category in ('people', 'places'):
+        json_path = os.path.join('.', 'translators', 'data', 'index', category + '.json')
+        idx_path = index_store.index_path(json_path)
+        if not args.force and index_store.is_fresh(json_path, idx_path):
+            print('"data/index/{}.idx" is up to date.'.format(category))
+        else:
+            print('Building "data/index/{}.idx" ... '.format(category), end='')
+            t_start = time.time()
+            n = index_store.build(json_path, idx_path)
+            print('OK. {} names in {:.2f} s'.format(n, time.time() - t_start))
+        rev_path = reverse_index.reverse_path(idx_path)
+        if not args.force and reverse_index.is_fresh(idx_path, rev_path):
+            print('"data/index/{}.rev" is up to date.'.format(category))
+            continue
+        print('Building "data/index/{}.rev" ... '.format(category), end='')
+        t_start = time.time()
+        n = reverse_index.build(idx_path, rev_path)
+        print('OK. {} Chinese variants in {:.2f} s'.format(n, time.time() - t_start))
+
+
+def suggest(args):
+    """
+    Approximate search in the dictionary
+    :param args: parsed arguments of the "suggest" command
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        index_translator = IndexTranslator()
+    t_start = time.time()
+    try:
+        result = index_translator.suggest(args.keyword, args.max_edits, args.limit, args.prefix)
+    except AssertionError as e:
+        print('ERROR: {}'.format(str(e)))
+        exit(1)
+    t_elapsed = time.time() - t_start
+    print('Keyword\tDistance\tLanguage\tCategory\tChinese')
+    for d_r in result['transliterations']:
+        print('{}\t{}\t{}\t{}\t{}'.format(d_r['keyword'], d_r['distance'], d_r['language'], d_r['category'],
+                                          d_r['chinese']))
+    print('({:.3f} ms)'.format(t_elapsed * 1000))
+
+
+def reverse(args):
+    """
+    Reverse lookup of names in the dictionary by their Chinese
+    :param args: parsed arguments of the "reverse" command
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        index_translator = IndexTranslator()
+    t_start = time.time()
+    try:
+        result = index_translator.reverse(args.chinese, args.substring, args.limit)
+    except AssertionError as e:
+        print('ERROR: {}'.format(str(e)))
+        exit(1)
+    t_elapsed = time.time() - t_start
+    print('Keyword\tLanguage\tCategory\tChinese\tVariant')
+    for d_r in result['transliterations']:
+        print('{}\t{}\t{}\t{}\t{}'.format(d_r['keyword'], d_r['language'], d_r['category'], d_r['chinese'],
+                                          d_r['variant']))
+    if result['truncated']:
+        print('... more than {} results, use "--limit" to show more'.format(args.limit))
+    print('({:.3f} ms)'.format(t_elapsed * 1000))
+
+
+def _init_table_worker(lang_code):
+    """
+    Load a rule translator once per worker process, without the precomputed table being rebuilt
+    :param lang_code:
+    """
+    global _rule_translator, _lang_codes
+    with contextlib.redirect_stdout(io.StringIO()):
+        _rule_translator = RuleTranslator(memory_path='')
+    _rule_translator.rules[lang_code]['table'] = None
+    _lang_codes = [lang_code]
+
+
+def _table_chunk(chunk):
+    """
+    Results of a chunk of keywords by the rule, in a worker process
+    :param chunk: list of capitalized keywords
+    :return: ([(<keyword>, <people chinese>, <places chinese>), ...], <number of keywords failed>)
+    """
+    lang_code = _lang_codes[0]
+    rule = _rule_translator.rules[lang_code]
+    items = []
+    for keyword, l_phonetics in zip(chunk, _rule_translator._words2phonetics_many(rule, chunk)):
+        if isinstance(l_phonetics, Exception):
+            continue
+        try:
+            people, places = _rule_translator._transliterations(rule, lang_code, keyword, l_phonetics)
+        except Exception:  # Not precomputed, translated (and failing) live
+            continue
+        items.append((keyword, people['chinese'], places['chinese']))
+    return items, len(chunk) - len(items)
+
+
+def build_tables(args):
+    """
+    Precompute results of the words known by the rule modules and of the names in the indexes,
+     see translators/rule_table.py
+    :param args: parsed arguments of the "build_tables" command
+    """
+    l_available_codes = available_lang_codes()
+    for c in args.lang_codes:
+        if c not in l_available_codes:
+            print('ERROR: "{}" is not an available language code.'.format(c))
+            exit(1)
+    with contextlib.redirect_stdout(io.StringIO()):  # Rule modules are imported by loading the rules
+        index_translator = IndexTranslator()
+        RuleTranslator()
+    index_names = []
+    for index in (index_translator.people_index, index_translator.places_index):
+        index_names.extend(index.key(i).decode('utf8') for i in range(len(index)))
+
+    for lang_code in args.lang_codes or l_available_codes:
+        rule_path = os.path.join('.', 'translators', 'data', 'rule', lang_code + '.rule')
+        path = rule_table.table_path(rule_path)
+        if not args.force and rule_table.is_fresh(rule_path, path):
+            print('"data/rule/{}.table" is up to date.'.format(lang_code))
+            continue
+        module = sys.modules.get('translators.data.rule.{}'.format(lang_code))
+        vocabulary = module.vocabulary() if hasattr(module, 'vocabulary') else []
+        keywords = list({w.capitalize(): None for w in vocabulary + index_names if w and ' ' not in w}.keys())
+
+        print('Building "data/rule/{}.table" from {} words with {} processes ... '.format(
+            lang_code, len(keywords), args.processes), end='', flush=True)
+        t_start = time.time()
+        items = []
+        n_failed = 0
+        with multiprocessing.Pool(args.processes, _init_table_worker, (lang_code,)) as pool:
+            for chunk_items, n in pool.imap_unordered(_table_chunk, iter_chunks(keywords, CHUNK_SIZE)):
+                items.extend(chunk_items)
+                n_failed += n
+        n = rule_table.build(rule_path, path, items)
+        print('OK. {} words ({} left to live translation) in {:.2f} s'.format(n, n_failed, time.time() - t_start))
+
+
+def run_phoneme_service(args):
+    """
+    Run the phoneme prediction service, see translators/phoneme_service.py
+    :param args: parsed arguments of the "phoneme_service" command
+    """
+    lang_codes = args.lang_codes or [c for c in available_lang_codes()
+                                     if os.path.exists(os.path.join('.', 'translators', 'data', 'rule', c + '.py'))]
+    try:
+        phoneme_service.serve(args.socket, args.workers, lang_codes)
+    except (PermissionError, FileExistsError) as e:
+        print('ERROR: {}'.format(str(e)))
+        exit(1)
+
+
+def export_model(args):
+    """
+    Export the weights of big_phoney's prediction model for the NumPy model, see translators/phoneme_model.py
+    :param args: parsed arguments of the "export_model" command
+    """
+    t_start = time.time()
+    path = phoneme_model.export(args.output, args.weights)
+    print('Exported into "{}" ({:.1f} MiB) in {:.2f} s'.format(
+        path, os.path.getsize(path) / 1024 / 1024, time.time() - t_start))
+
+
+def memory_report(args):
+    """
+    Report the hit ratio of every rule version in the translation memory, see translators/memory.py
+    :param args: parsed arguments of the "memory" command
+    """
+    path = args.path or memory.memory_path()
+    if not path:
+        print('ERROR: set ${} or use "--path".'.format(memory.MEMORY_ENV))
+        exit(1)
+    d_versions = {}  # Current versions, without loading the rules
+    for lang_code in available_lang_codes():
+        rule_path = os.path.join('.', 'translators', 'data', 'rule', lang_code + '.rule')
+        d_versions[lang_code] = rule_cache.results_digest(rule_path).hex()
+    translation_memory = memory.TranslationMemory(path)
+    if args.prune:
+        n = translation_memory.prune(d_versions, other_lang_codes=True)
+        print('{} rows of former rule versions pruned.'.format(n))
+    print('Language\tVersion\tRows\tHits\tMisses\tHit ratio')
+    for lang_code, version, n, hits, misses in translation_memory.report():
+        print('{}\t{}{}\t{}\t{}\t{}\t{:.1%}'.format(
+            lang_code, version[:12], '' if d_versions.get(lang_code) == version else ' (former)', n, hits, misses,
+            hits / (hits + misses) if hits + misses else 0.0))
+    translation_memory.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Places & People Automate Translator')
+    subparsers = parser.add_subparsers(dest='command')
+    p_translate = subparsers.add_parser('translate', help='translate a CK2 CSV, EU4 YAML or word list file')
+    p_translate.add_argument('--input', '-i', required=True, help='file to be translated')
+    p_translate.add_argument('--output', '-o', required=True, help='tab separated results')
+    p_translate.add_argument('--format', '-f', choices=('auto',) + FORMATS, default='auto',
+                             help='csv: CK2, yml: EU4, txt: one name per line. Default is by the file extension')
+    p_translate.add_argument('--encoding', '-e', default=None,
+                             help='encoding of the input file. Default is cp1252 for csv, utf-8-sig for yml')
+    p_translate.add_argument('--lang_codes', '-l', nargs='*', default=[],
+                             help='language codes of rules, default is ALL language codes')
+    p_translate.add_argument('--processes', '-p', type=int, default=os.cpu_count() or 1,
+                             help='number of worker processes, default is the number of CPUs')
+    p_build_index = subparsers.add_parser('build_index', help='rebuild name indexes from the JSON files')
+    p_build_index.add_argument('--force', action='store_true', help='rebuild even if the indexes are up to date')
+    p_suggest = subparsers.add_parser('suggest', help='find spelling variants or names starting with a keyword')
+    p_suggest.add_argument('keyword')
+    p_suggest.add_argument('--max_edits', '-d', type=int, default=1,
+                           help='max edit distance, up to {}'.format(index_store.MAX_EDITS))
+    p_suggest.add_argument('--limit', '-n', type=int, default=10, help='max number of names')
+    p_suggest.add_argument('--prefix', action='store_true', help='find names starting with the keyword')
+    p_reverse = subparsers.add_parser('reverse', help='find names of the dictionary transliterated into a Chinese')
+    p_reverse.add_argument('chinese')
+    p_reverse.add_argument('--substring', '-s', action='store_true', help='find Chinese containing the argument')
+    p_reverse.add_argument('--limit', '-n', type=int, default=20, help='max number of results')
+    p_service = subparsers.add_parser('phoneme_service', help='run the shared phoneme prediction service')
+    p_service.add_argument('--socket', '-s', default=phoneme_service.socket_path(),
+                           help='path of the Unix socket, default is ${} or {}'
+                           .format(phoneme_service.SOCKET_ENV, phoneme_service.default_socket_path()))
+    p_service.add_argument('--workers', '-w', type=int, default=1, help='number of processes owning a model')
+    p_service.add_argument('--lang_codes', '-l', nargs='*', default=[],
+                           help='rule modules to warm up, default is all with a "<lang_code>.py"')
+    p_tables = subparsers.add_parser('build_tables', help='precompute results of known words by rules')
+    p_tables.add_argument('--lang_codes', '-l', nargs='*', default=[],
+                          help='language codes of rules, default is ALL language codes')
+    p_tables.add_argument('--force', action='store_true', help='rebuild even if the tables are up to date')
+    p_tables.add_argument('--processes', '-p', type=int, default=os.cpu_count() or 1,
+                          help='number of worker processes, default is the number of CPUs')
+    p_memory = subparsers.add_parser('memory', help='report the hit ratio of the translation memory')
+    p_memory.add_argument('--path', default=None,
+                          help='SQLite file of the translation memory, default is ${}'.format(memory.MEMORY_ENV))
+    p_memory.add_argument('--prune', action='store_true',
+                          help='delete rows of former rule versions and of rules not found')
+    p_export = subparsers.add_parser('export_model', help='export the prediction model for inference with NumPy')
+    p_export.add_argument('--output', '-o', default=phoneme_model.model_path(),
+                          help='".npz" file, default is ${} or "{}" in {}'.format(
+                              phoneme_model.PATH_ENV, phoneme_model.MODEL_FILE_NAME, phoneme_model.cache_dir()))
+    p_export.add_argument('--weights', default=None,
+                          help='HDF5 weights of the model, default is those of the installed big_phoney')
+    args = parser.parse_args(argv)
+
+    if args.command == 'translate':
+        translate_file(args)
+    elif args.command == 'build_index':
+        build_index(args)
+    elif args.command == 'suggest':
+        suggest(args)
+    elif args.command == 'reverse':
+        reverse(args)
+    elif args.command == 'phoneme_service':
+        run_phoneme_service(args)
+    elif args.command == 'build_tables':
+        build_tables(args)
+    elif args.command == 'memory':
+        memory_report(args)
+    elif args.command == 'export_model':
+        export_model(args)
+    else:
+        interactive()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Versioned HTTP response caching
+
+Translators expose a content version of what they loaded (RuleTranslator.version, IndexTranslator.version) which
+ changes whenever a reload changes their results. Responses depending on them are serialized once and kept in
+ response_cache under (<version>, <key>) with a strong ETag made of the version and a digest of the body, so
+ repeated queries skip both translation and JSON encoding, and entries of former versions are never hit again but
+ only age out of the LRU cache.
+
+Responses carry "Cache-Control: public, max-age=HTTP_MAX_AGE" and a GET or HEAD request whose "If-None-Match"
+ matches gets "304 Not Modified". POST responses have an ETag too but are never 304: caches do not reuse them.
+"""
+import hashlib
+
+from flask import Response, request
+
+from translators.cache import LRUCache
+
+RESPONSE_CACHE_SIZE = 16384  # (<version>, <key>) --> (<body>, <etag>)
+HTTP_MAX_AGE = 60  # Seconds clients and proxies may reuse a response before revalidating it
+
+response_cache = LRUCache(RESPONSE_CACHE_SIZE)
+
+
+def etag(version, body):
+    """
+    :param version: content version the body depends on
+    :param body: bytes
+    :return: unquoted strong ETag
+    """
+    return '{}-{}'.format(version[:16], hashlib.sha1(body).hexdigest()[:16])
+
+
+def cached(version, key, render):
+    """
+    Serialized response from the response cache, rendered on a miss
+    :param version: content version, read before the translators used by render
+    :param key: hashable identifying the response within the version
+    :param render: func() -> (<body bytes>, <cacheable>), cacheable is False for transient errors
+    :return: (<body>, <etag>)
+    """
+    entry = response_cache.get((version, key))
+    if entry is None:
+        entry = store(version, key, *render())
+    return entry
+
+
+def store(version, key, body, cacheable=True):
+    """
+    Keep a serialized response in the response cache, see cached()
+    :return: (<body>, <etag>)
+    """
+    entry = (body, etag(version, body))
+    if cacheable:
+        response_cache.put((version, key), entry)
+    return entry
+
+
+def cache_control():
+    """
+    :return: value of the Cache-Control header
+    """
+    return 'public, max-age={}'.format(HTTP_MAX_AGE)
+
+
+def is_not_modified(method, if_none_match, s_etag):
+    """
+    :param method: HTTP method of the request
+    :param if_none_match: value of the If-None-Match header, None if absent
+    :param s_etag: unquoted ETag of the response
+    :return: True if the response should be "304 Not Modified"
+    """
+    if method not in ('GET', 'HEAD') or not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip() in ('"{}"'.format(s_etag), 'W/"{}"'.format(s_etag)) for tag in if_none_match.split(','))
+
+
+def response(body, s_etag, mimetype=None):
+    """
+    Flask response of a cached body for the current request, "304 Not Modified" if the client has it
+    :param body: bytes
+    :param s_etag: unquoted ETag
+    :param mimetype: default is the one of Flask
+    :return: Response
+    """
+    if is_not_modified(request.method, request.headers.get('If-None-Match'), s_etag):
+        r = Response(status=304)
+    else:
+        r = Response(body, mimetype=mimetype)
+    r.headers['ETag'] = '"{}"'.format(s_etag)
+    r.headers['Cache-Control'] = cache_control()
+    return r
@@ -0,0 +1,180 @@
+"""
+Pre-fork serving mode
+
+> python prefork_server.py [--port 5000] [--workers 4]
+
+The master process loads and warms up both translators (rules, indexes, the phonetic dictionary and the prediction
+ model) and the web app, then forks the workers, which serve the Flask app on the socket bound by the master. The
+ pages of everything loaded are shared copy-on-write by all workers instead of being loaded once per worker.
+
+Objects only stay shared if nothing writes to them. The cyclic garbage collector of a worker would write to every
+ object it tracks on each full collection, so the master runs with the collector disabled (no freed holes in its
+ pages get reused by workers either) and moves everything it allocated to the permanent generation with
+ gc.freeze() right before forking, as recommended by the documentation of gc. Workers enable the collector again
+ and only collect what they allocate. Reference counting still dirties the pages of objects used by every request,
+ see benchmarks/prefork_memory.py for the unique memory of each worker.
+
+A worker exiting is replaced by a new fork of the master. SIGTERM or SIGINT stop all of them. Workers have their own
+ caches and their own reloads: with "$PPAT_RELOAD_INTERVAL" set, each worker starts a watcher (threads do not survive
+ a fork) and files it reloads are no longer shared.
+
+Predictions of the model loaded by the master run in the workers. If the TensorFlow build does not support that
+ (workers hanging on predictions), start the phoneme service first (python cli.py phoneme_service): the model then
+ lives in the processes of the service and the master only loads the phonetic dictionary.
+"""
+import io
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import threading
+import contextlib
+
+PREFORK_ENV = 'PPAT_PREFORK'
+DEFAULT_WORKERS = 4
+WARM_UP_PATHS = ('/', '/api/lang_codes', '/api/ready')  # First requests compile templates and URL maps
+
+
+def memory_of(pid):
+    """
+    Memory of a process as reported by Linux
+    :param pid:
+    :return: {'rss': bytes, 'pss': bytes, 'uss': bytes}, uss being the private memory only this process uses
+    """
+    d_kb = {}
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+            lines = f.readlines()
+    except FileNotFoundError:  # Before Linux 4.14
+        with open('/proc/{}/smaps'.format(pid)) as f:
+            lines = f.readlines()
+    for line in lines:
+        name, _, value = line.partition(':')
+        if value.strip().endswith(' kB'):
+            d_kb[name] = d_kb.get(name, 0) + int(value.split()[0])
+    return {'rss': d_kb.get('Rss', 0) * 1024,
+            'pss': d_kb.get('Pss', 0) * 1024,
+            'uss': (d_kb.get('Private_Clean', 0) + d_kb.get('Private_Dirty', 0)) * 1024}
+
+
+def load(freeze=True):
+    """
+    Import and warm up the web app in the master
+    :param freeze: if False, skip gc.freeze() to measure what it saves
+    :return: the app module
+    """
+    os.environ[PREFORK_ENV] = '1'
+    gc.disable()
+    import app
+
+    t_start = time.time()
+    app.rule_translator.warm_up()
+    client = app.app.test_client()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path in WARM_UP_PATHS:
+            client.get(path)
+    print('Warmed up in {:.2f} s.'.format(time.time() - t_start))
+    if threading.active_count() > 1:
+        print('Warning: threads started before forking are missing in workers: {}'.format(
+            ', '.join(t.name for t in threading.enumerate() if t is not threading.current_thread())))
+    if freeze and hasattr(gc, 'freeze'):  # Python 3.7+
+        gc.freeze()
+        print('{} objects frozen out of the garbage collector.'.format(gc.get_freeze_count()))
+    return app
+
+
+def _serve_worker(app_module, sock, host, port):
+    """
+    Serve requests in a forked worker until it is terminated
+    """
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C reaches the whole process group, the master stops workers
+    gc.enable()
+    interval = float(os.environ.get(app_module.RELOAD_INTERVAL_ENV, 0))
+    if interval > 0:
+        app_module.reloader.start(interval)
+    make_server(host, port, app_module.app, threaded=True, fd=sock.fileno()).serve_forever()
+
+
+def _fork_worker(app_module, sock, host, port):
+    """
+    :return: pid of the new worker
+    """
+    sys.stdout.flush()  # Else the worker inherits and prints again what the master has buffered
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            _serve_worker(app_module, sock, host, port)
+        except BaseException as e:
+            print('Worker {} failed: {}: {}'.format(os.getpid(), type(e).__name__, str(e)))
+            status = 1
+        finally:
+            sys.stdout.flush()
+            os._exit(status)  # Never return into the loop of the master
+    return pid
+
+
+def serve(host='127.0.0.1', port=5000, workers=DEFAULT_WORKERS, freeze=True):
+    """
+    Load the app, fork workers and replace those exiting until SIGTERM or SIGINT
+    :param host:
+    :param port:
+    :param workers: number of worker processes
+    :param freeze: see load()
+    """
+    assert hasattr(os, 'fork'), 'Pre-fork serving needs os.fork().'
+    assert workers > 0
+    app_module = load(freeze)
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+
+    stopping = []
+
+    def _stop(signum, frame):
+        stopping.append(signum)
+        for pid in list(pids):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+    pids = {_fork_worker(app_module, sock, host, port): time.time() for _ in range(workers)}  # pid --> start time
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    print('Master {} serving on http://{}:{}/ with {} workers: {}'.format(
+        os.getpid(), host, port, workers, ' '.join(str(pid) for pid in sorted(pids))))
+    while pids:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        if pid not in pids:
+            continue
+        t_started = pids.pop(pid)
+        if not stopping:
+            print('Worker {} exited with status {}, replacing it.'.format(pid, status))
+            if time.time() - t_started < 1:  # Do not fork in a loop if workers fail at once
+                time.sleep(1)
+            pids[_fork_worker(app_module, sock, host, port)] = time.time()
+    sock.close()
+    print('Stopped.')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the web app from workers forked after loading the translators')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', '-w', type=int, default=DEFAULT_WORKERS, help='number of worker processes')
+    parser.add_argument('--no_freeze', action='store_true', help='do not freeze objects out of the garbage collector')
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers, not args.no_freeze)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+import io
+import os
+import sys
+import contextlib
+import importlib.util
+
+import pytest
+
+# Translators open their data files relative to "src/", where the web app and cli.py run
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+os.chdir(SRC_DIR)
+
+# Rules of "en" get their phonetics from big_phoney
+requires_big_phoney = pytest.mark.skipif(importlib.util.find_spec('big_phoney') is None,
+                                         reason='big_phoney is not installed.')
+
+@pytest.fixture(scope='session')
+def client():
+    """
+    Test client of the web app, with the name indexes of "translators/data/index/"
+    """
+    index_dir = os.path.join('translators', 'data', 'index')
+    for category in ('people', 'places'):
+        if not any(os.path.exists(os.path.join(index_dir, category + ext)) for ext in ('.json', '.idx')):
+            pytest.skip('No "{}" index in "{}".'.format(category, index_dir))
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import app
+    return app.test_client()
@@ -0,0 +1,24 @@
+"""
+Access control of "/api/admin/reload"
+"""
+import pytest
+
+
+@pytest.fixture
+def token_env(client):
+    from blueprints.api import ADMIN_TOKEN_ENV  # After the app, which the blueprint imports
+    return ADMIN_TOKEN_ENV
+
+
+def test_reload_is_disabled_without_token(client, token_env, monkeypatch):
+    monkeypatch.delenv(token_env, raising=False)
+    # Requests relayed by a local reverse proxy come from the local host as well
+    response = client.post('/api/admin/reload', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 403
+
+
+def test_reload_requires_the_token(client, token_env, monkeypatch):
+    monkeypatch.setenv(token_env, 'secret')
+    for headers in ({}, {'X-Admin-Token': 'wrong'}, {'X-Admin-Token': 'sécret'}):
+        assert client.post('/api/admin/reload', headers=headers).status_code == 403
+    assert client.post('/api/admin/reload', headers={'X-Admin-Token': 'secret'}).status_code == 200
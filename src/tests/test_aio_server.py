@@ -0,0 +1,72 @@
+"""
+Refusal of malformed and oversized requests by the asyncio server (aio_server.py)
+"""
+import asyncio
+
+import pytest
+
+
+def hello_app(environ, start_response):
+    body = environ['wsgi.input'].read()
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'hello ' + body]
+
+
+@pytest.fixture(scope='module')
+def aio_server(client):  # Loads the app like the server does
+    import aio_server
+    return aio_server
+
+
+def exchange(aio_server, request):
+    """
+    Send raw bytes to a server of hello_app and read until it closes the connection
+    :return: (<status>, <body>)
+    """
+    async def run():
+        server = aio_server.AsyncServer(hello_app, threads=1)
+        listener = await asyncio.start_server(server.handle, '127.0.0.1', 0, limit=aio_server.MAX_LINE_SIZE)
+        try:
+            reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+            writer.write(request)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 10)
+            writer.close()
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server.executor.shutdown()
+        return response
+
+    head, _, body = asyncio.run(run()).partition(b'\r\n\r\n')
+    return int(head.split()[1]), body
+
+
+def test_valid_request(aio_server):
+    assert exchange(aio_server, b'POST /hello HTTP/1.1\r\nContent-Length: 5\r\nConnection: close\r\n\r\nworld') == (
+        200, b'hello world')
+
+
+@pytest.mark.parametrize('length', [b'-1', b'abc', b'1.5'])
+def test_invalid_content_length(aio_server, length):
+    assert exchange(aio_server, b'POST /hello HTTP/1.1\r\nContent-Length: ' + length + b'\r\n\r\n')[0] == 400
+
+
+def test_body_too_large(aio_server):
+    length = str(aio_server.MAX_BODY_SIZE + 1).encode()
+    assert exchange(aio_server, b'POST /hello HTTP/1.1\r\nContent-Length: ' + length + b'\r\n\r\n')[0] == 413
+
+
+def test_too_many_headers(aio_server):
+    headers = b''.join(b'X-Header-%d: 1\r\n' % i for i in range(aio_server.MAX_HEADERS + 1))
+    assert exchange(aio_server, b'GET /hello HTTP/1.1\r\n' + headers + b'\r\n')[0] == 431
+
+
+def test_line_too_long(aio_server):
+    assert exchange(aio_server, b'GET /hello HTTP/1.1\r\nX-Long: ' + b'a' * aio_server.MAX_LINE_SIZE + b'\r\n\r\n')[
+        0] == 431
+
+
+def test_chunked_body_is_refused(aio_server):
+    assert exchange(aio_server, b'POST /hello HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nworld\r\n0\r\n\r\n')[
+        0] == 501
@@ -0,0 +1,67 @@
+"""
+Parameters and caching of the API
+"""
+import io
+import json
+
+import pytest
+
+import http_cache
+from conftest import requires_big_phoney
+
+
+@pytest.fixture
+def api(client):
+    from blueprints import api  # After the app, which the blueprint imports
+    return api
+
+
+def translate(client, query):
+    response = client.get('/api/translate?' + query)
+    assert response.status_code == 200
+    return json.loads(response.data)
+
+
+@requires_big_phoney  # Results of the "en" rule
+def test_missing_lang_codes_select_all_languages(client):
+    expected = translate(client, 'keyword=Alex&lang_codes=en')['rule']
+    assert isinstance(expected, dict) and expected['transliterations']
+    assert translate(client, 'keyword=Alex')['rule'] == expected
+    assert translate(client, 'keyword=Alex&lang_codes=')['rule'] == expected
+    assert translate(client, 'keyword=Alex&lang_codes=,en,')['rule'] == expected
+
+
+@requires_big_phoney
+def test_order_of_lang_codes_shares_cache_entries(client):
+    translate(client, 'keyword=London&lang_codes=fr,en')
+    stats = http_cache.response_cache.stats()
+    translate(client, 'keyword=London&lang_codes=en,fr')
+    assert http_cache.response_cache.stats()['hits'] == stats['hits'] + 1
+    assert http_cache.response_cache.stats()['size'] == stats['size']
+
+
+@pytest.mark.parametrize('path', ['/api/translate', '/api/translate/batch', '/api/suggest', '/api/reverse'])
+def test_bodies_which_are_not_json_objects(client, path):
+    for kwargs in ({'data': 'keyword=Alex'}, {'data': '{"keyword": ', 'content_type': 'application/json'},
+                   {'json': ['Alex']}):
+        response = client.post(path, **kwargs)
+        assert response.status_code == 400
+        assert 'error' in json.loads(response.data)
+
+
+def test_batch_keywords_should_be_a_list(client):
+    assert client.post('/api/translate/batch', json={'keywords': 'Alex'}).status_code == 400
+
+
+@requires_big_phoney
+def test_batch_upload_which_is_not_utf8(client):
+    data = {'file': (io.BytesIO(b'Alex\nLon\xffdon\n'), 'names.txt'), 'lang_codes': 'en'}
+    response = client.post('/api/translate/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert [json.loads(line)['keyword'] for line in response.data.decode('utf8').splitlines()] == [
+        'Alex', 'Lon�don']
+
+
+def test_batch_deduplication_is_bounded(api, monkeypatch):
+    monkeypatch.setattr(api, 'BATCH_DEDUPE_SIZE', 2)
+    assert list(api._iter_chunks(['a', 'b', 'A', 'c', 'b', 'c'], 4)) == [['a', 'b', 'c', 'b']]
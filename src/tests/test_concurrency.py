@@ -0,0 +1,102 @@
+"""
+Stress test of one RuleTranslator shared by many threads, as the web app does: results of concurrent translate() and
+ translate_many() calls with mixed lang_codes must equal those of serial translate() calls.
+"""
+import io
+import random
+import threading
+import contextlib
+
+import pytest
+
+from conftest import requires_big_phoney
+from translators.translator import RuleTranslator
+
+pytestmark = requires_big_phoney
+
+N_THREADS = 8
+N_KEYWORDS = 300
+BATCH_SIZE = 40  # Batches reach the worker pool, see RuleTranslator._map()
+
+
+def outcome(func, *args):
+    """
+    :return: the result of func, or (<type>, <message>) of the exception it raised
+    """
+    try:
+        return func(*args)
+    except Exception as e:
+        return type(e), str(e)
+
+
+def marked_rule(rule, mark):
+    """
+    Copy of a loaded rule giving other transliterations, so that results of languages mixed up by threads differ
+    :param rule: a loaded rule
+    :param mark: str appended to every Chinese of the ".transliteration" sections
+    :return: dict
+    """
+    marked = dict(rule, table=None)
+    marked['meta'] = dict(rule['meta'], language_name=rule['meta']['language_name'] + mark)
+    for category in ('people', 'places'):
+        section = 'transliteration ' + category
+        marked[section] = {k: v + mark for k, v in rule[section].items()}
+    return marked
+
+
+@pytest.fixture(scope='module')
+def rule_translator():
+    with contextlib.redirect_stdout(io.StringIO()):
+        rule_translator = RuleTranslator(use_rule_cache=False, phonetics_cache_size=256, results_cache_size=256,
+                                         memory_path='', workers=4)
+    if 'en' not in rule_translator.rules:
+        pytest.skip('No "en" rule.')
+    en = rule_translator.rules['en']
+    rules = {'en': dict(en, table=None), 'xx': marked_rule(en, '·'), 'yy': marked_rule(en, '—')}
+    rule_translator._swap(rules, {lang_code: None for lang_code in rules})
+    return rule_translator
+
+
+@pytest.fixture(scope='module')
+def keywords(rule_translator):
+    module = rule_translator._rule_modules()['en']
+    return [word.capitalize() for word in random.Random(7).sample(sorted(module.vocabulary()), N_KEYWORDS)]
+
+
+def test_concurrent_results_match_serial(rule_translator, keywords):
+    l_lang_codes = [[], ['en'], ['xx'], ['yy', 'en'], ['xx', 'yy']]
+    expected = {(keyword, tuple(lang_codes)): outcome(rule_translator.translate, keyword, lang_codes)
+                for keyword in keywords for lang_codes in l_lang_codes}
+    rule_translator._swap(rule_translator.rules, rule_translator.versions)  # Empty caches
+
+    l_differences = []
+    barrier = threading.Barrier(N_THREADS)
+
+    def work(seed):
+        try:
+            check(seed)
+        except Exception as e:  # Not to be lost in the thread
+            l_differences.append(('error', type(e), str(e)))
+
+    def check(seed):
+        rnd = random.Random(seed)
+        tasks = list(expected.keys())
+        rnd.shuffle(tasks)
+        barrier.wait()
+        for n, (keyword, lang_codes) in enumerate(tasks):
+            if n % 50 == 0:  # A batch of other keywords now and then
+                l_batch = rnd.sample(keywords, BATCH_SIZE)
+                for batch_keyword, result in zip(l_batch, rule_translator.translate_many(l_batch, list(lang_codes))):
+                    if isinstance(result, Exception):
+                        result = type(result), str(result)
+                    if result != expected[(batch_keyword, lang_codes)]:
+                        l_differences.append(('translate_many', batch_keyword, lang_codes))
+            if outcome(rule_translator.translate, keyword, list(lang_codes)) != expected[(keyword, lang_codes)]:
+                l_differences.append(('translate', keyword, lang_codes))
+
+    threads = [threading.Thread(target=work, args=(seed,)) for seed in range(N_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not l_differences, '{} differences, first ones: {}'.format(len(l_differences), l_differences[:10])
@@ -0,0 +1,139 @@
+"""
+Differential test of the compiled matcher (PhoneticTrie) against the linear scan it replaced.
+
+Every word of the rule modules' vocabularies (e.g. the whole phonetic dictionary of "en.py") is matched at every
+ position by both, for each language and category, and both must give the same (<coord>, <length>) or raise the
+ same error.
+"""
+import io
+import contextlib
+
+import pytest
+
+from conftest import requires_big_phoney
+from translators.translator import RuleTranslator
+
+pytestmark = requires_big_phoney
+
+
+def reference_check_pre(rule, pre_phonetic, pre_pattern):
+    """
+    _check_pre() of the linear scan, kept as it was
+    """
+    l_all_consonants = rule['phonetics']['consonants']
+    l_all_vowels = rule['phonetics']['vowels']
+    if not pre_phonetic:  # No phonetic in pre
+        if pre_pattern == ('$',):
+            return True
+        else:
+            return False
+    index = len(pre_phonetic)
+    for i in pre_pattern:
+        if i == '@' and pre_phonetic[index] not in l_all_vowels:  # Any Vowels
+            return False
+        if i == '&' and pre_phonetic[index] not in l_all_consonants:  # Any Consonants
+            return False
+        if i == '$' and index != 1:
+            return False
+        if i not in ['@', '&', '$'] and i != pre_phonetic[index]:
+            return False
+        index -= 1
+    return True
+
+
+def reference_check_post(rule, post_phonetic, post_pattern):
+    """
+    _check_post() of the linear scan, kept as it was
+    """
+    l_all_consonants = rule['phonetics']['consonants']
+    l_all_vowels = rule['phonetics']['vowels']
+    if not post_phonetic:  # No phonetic in post
+        if post_pattern == ('^',):
+            return True
+        else:
+            return False
+    index = 0
+    for i in post_pattern:
+        if i == '@' and post_phonetic[index] not in l_all_vowels:  # Any Vowels
+            return False
+        if i == '&' and post_phonetic[index] not in l_all_consonants:  # Any Consonants
+            return False
+        if i == '^' and index != (len(post_phonetic) - 1):
+            return False
+        if i not in ['@', '&', '^'] and i != post_phonetic[index]:
+            return False
+        index += 1
+    return True
+
+
+def reference_match(rule, phonetic, i_start, section):
+    """
+    _match() of the linear scan: every rule of the section is tried at i_start
+    :param rule: a loaded rule
+    :param phonetic: list of phonetics
+    :param i_start:
+    :param section: e.g. 'vowels people'
+    :return: (<value of the matched rule>, <length of the matched pattern>)
+    """
+    matched_rule_value = 0
+    pattern_len = 0
+    tail = phonetic[i_start:]
+    for k, v in rule[section].items():  # k: (<pre>, (<match1>, <match2>, ...), <post>)
+        pre, l_patterns, post = k
+        for patterns in l_patterns:
+            if len(patterns) > len(tail) or list(patterns) != tail[:len(patterns)]:
+                continue
+            _pattern_len = len(patterns)
+            if pre and not reference_check_pre(rule, phonetic[0:i_start], pre):
+                break  # invalid match, check next rule
+            if post and not reference_check_post(rule, phonetic[i_start + _pattern_len:], post):
+                break  # invalid match, check next rule
+            if _pattern_len > pattern_len:
+                pattern_len = _pattern_len
+                matched_rule_value = v
+    return matched_rule_value, pattern_len
+
+
+def outcome(func, *args):
+    """
+    :return: the result of func, or the type of the exception it raised
+    """
+    try:
+        return func(*args)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.fixture(scope='module')
+def rule_translator():
+    with contextlib.redirect_stdout(io.StringIO()):
+        return RuleTranslator(use_rule_cache=False, phonetics_cache_size=0, results_cache_size=0, memory_path='')
+
+
+def vocabulary_phonetics(rule_translator):
+    """
+    :return: generator of (<lang_code>, <rule>, <word>, <phonetics list>) of every word of the vocabularies
+    """
+    for lang_code, module in sorted(rule_translator._rule_modules().items()):
+        if not hasattr(module, 'vocabulary'):
+            continue
+        rule = rule_translator.rules[lang_code]
+        for word in sorted(module.vocabulary()):
+            yield lang_code, rule, word, rule['to_phonetics'](word)
+
+
+def test_trie_matches_linear_scan(rule_translator):
+    n_words = 0
+    l_differences = []
+    for lang_code, rule, word, l_phonetics in vocabulary_phonetics(rule_translator):
+        n_words += 1
+        codes = rule['phonemes'].encode(l_phonetics)
+        for section, trie in rule['tries'].items():
+            for i_start in range(len(l_phonetics)):
+                expected = outcome(reference_match, rule, l_phonetics, i_start, section)
+                got = outcome(rule_translator._match, rule, codes, i_start, trie)
+                if got != expected:
+                    l_differences.append((lang_code, section, word, i_start, expected, got))
+    if n_words == 0:
+        pytest.skip('No rule module has a vocabulary.')
+    assert not l_differences, '{} differences, first ones: {}'.format(len(l_differences), l_differences[:10])
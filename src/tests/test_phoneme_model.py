@@ -0,0 +1,56 @@
+"""
+Prediction models of translators/phoneme_model.py: batched beam search against big_phoney's word by word one, and
+ export of the weights
+"""
+import os
+import sys
+import subprocess
+import importlib.util
+
+import pytest
+
+from conftest import requires_big_phoney
+from translators import phoneme_model, rule_cache, rule_table
+
+WORDS = ['Zorkle', 'Brannigan', 'Quixley', 'Ouagadougou', 'Xi', 'Tchaikovskyesque']
+
+
+@requires_big_phoney
+@pytest.mark.skipif(importlib.util.find_spec('tensorflow') is None, reason='TensorFlow is not installed.')
+def test_keras_batches_equal_single_predictions():
+    model = phoneme_model.KerasPredictionModel()
+    assert model.predict_many(WORDS) == [model.model.predict(word) for word in WORDS]
+
+
+def test_model_is_exported_into_the_user_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv(phoneme_model.PATH_ENV, raising=False)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    assert phoneme_model.model_path() == os.path.join(str(tmp_path), 'ppat', phoneme_model.MODEL_FILE_NAME)
+
+
+@requires_big_phoney
+@pytest.mark.skipif(importlib.util.find_spec('h5py') is None, reason='h5py is not installed.')
+def test_concurrent_exports(tmp_path):
+    if not os.path.exists(os.path.join(phoneme_model._big_phoney_data_dir(), 'prediction_model_weights.hdf5')):
+        pytest.skip('No weights in big_phoney.')
+    path = str(tmp_path / phoneme_model.MODEL_FILE_NAME)
+    code = 'from translators import phoneme_model; phoneme_model.export({!r})'.format(path)
+    processes = [subprocess.Popen([sys.executable, '-c', code]) for _ in range(4)]
+    assert [process.wait(300) for process in processes] == [0] * len(processes)
+    assert os.listdir(str(tmp_path)) == [phoneme_model.MODEL_FILE_NAME]
+    assert phoneme_model.NumpyPredictionModel(path).predict_many(WORDS[:2])
+
+
+def test_tables_are_stale_after_the_model_changes(tmp_path, monkeypatch):
+    rule_path = os.path.join('.', 'translators', 'data', 'rule', 'en.rule')
+    model = tmp_path / 'other.npz'
+    model.write_bytes(b'weights')
+    monkeypatch.setenv(phoneme_model.PATH_ENV, str(model))
+    path = str(tmp_path / 'en.table')
+    rule_table.build(rule_path, path, [('Alex', '阿莱克斯', '阿莱克斯')])
+    assert rule_table.is_fresh(rule_path, path)
+    digest = rule_cache.results_digest(rule_path)
+
+    model.write_bytes(b'other weights')
+    assert not rule_table.is_fresh(rule_path, path)
+    assert rule_cache.results_digest(rule_path) != digest  # The version of the translation memory too
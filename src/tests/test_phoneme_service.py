@@ -0,0 +1,140 @@
+"""
+Phoneme prediction service on localhost: results through the socket, fallback to the in-process model and safety of
+ the socket path
+"""
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import socketserver
+
+import pytest
+
+from conftest import requires_big_phoney
+from translators import phoneme_service
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='Unix sockets are not supported.')
+
+WORDS = ['Zorkle', 'Brannigan', 'Quixley', 'Alex']
+START_TIMEOUT = 120  # Seconds for the service to load its models
+
+
+@pytest.fixture
+def socket_dir():
+    directory = tempfile.mkdtemp(prefix='ppat-')  # Short, socket paths are limited to about 100 bytes
+    yield directory
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def service(socket_dir, monkeypatch):
+    path = os.path.join(socket_dir, 'phoneme.sock')
+    process = subprocess.Popen([sys.executable, 'cli.py', 'phoneme_service', '--socket', path, '--workers', '1',
+                                '-l', 'en'], stdout=subprocess.DEVNULL)
+    t_start = time.time()
+    while not os.path.exists(path):
+        assert process.poll() is None, 'The phoneme service failed to start.'
+        assert time.time() - t_start < START_TIMEOUT, 'The phoneme service did not start in time.'
+        time.sleep(0.1)
+    monkeypatch.setenv(phoneme_service.SOCKET_ENV, path)
+    monkeypatch.setattr(phoneme_service, '_unavailable_until', 0)
+    yield path
+    process.terminate()
+    process.wait(30)
+
+
+@requires_big_phoney
+def test_service_results_equal_in_process_predictions(service):
+    from translators.data.rule import en
+    assert phoneme_service.available()
+    assert phoneme_service.predict('en', WORDS) == en.predict_many_local(WORDS)
+    assert en.predict_many(WORDS) == en.predict_many_local(WORDS)
+
+
+@requires_big_phoney
+def test_fallback_without_service(socket_dir, monkeypatch):
+    from translators.data.rule import en
+    monkeypatch.setenv(phoneme_service.SOCKET_ENV, os.path.join(socket_dir, 'missing.sock'))
+    monkeypatch.setattr(phoneme_service, '_unavailable_until', 0)
+    assert not phoneme_service.available()
+    assert phoneme_service.predict('en', WORDS) is None
+    assert en.predict_many(WORDS) == en.predict_many_local(WORDS)
+
+
+def test_serve_keeps_files_which_are_not_sockets(socket_dir):
+    path = os.path.join(socket_dir, 'phoneme.sock')
+    with open(path, 'w') as f:
+        f.write('data')
+    with pytest.raises(FileExistsError):
+        phoneme_service.serve(path, 1, [])
+    with open(path) as f:
+        assert f.read() == 'data'
+
+
+def test_default_socket_is_in_a_private_directory(socket_dir, monkeypatch):
+    monkeypatch.delenv(phoneme_service.SOCKET_ENV, raising=False)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', socket_dir)
+    assert phoneme_service.socket_path() == os.path.join(socket_dir, phoneme_service.SOCKET_NAME)
+    assert phoneme_service.is_private_dir(socket_dir)  # mkdtemp() creates it with mode 0o700
+    os.chmod(socket_dir, 0o777)
+    with pytest.raises(PermissionError):
+        phoneme_service.serve(phoneme_service.socket_path(), 1, [])
+
+
+@pytest.fixture
+def fake_service(socket_dir, monkeypatch):
+    """
+    Service answering requests with answer(<number of the request>), on a temporary socket
+    :return: {'answer': <function>, 'connections': <number of connections accepted>}
+    """
+    path = os.path.join(socket_dir, 'fake.sock')
+    state = {'answer': None, 'connections': 0, 'requests': 0}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            state['connections'] += 1
+            for _ in self.rfile:
+                state['requests'] += 1
+                answer = state['answer'](state['requests'])
+                if answer is None:  # Stuck
+                    time.sleep(2)
+                    return
+                self.wfile.write(answer)
+
+    server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv(phoneme_service.SOCKET_ENV, path)
+    monkeypatch.setattr(phoneme_service, '_unavailable_until', 0)
+    monkeypatch.setattr(phoneme_service, '_client', None)
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def test_error_answer_falls_back_for_one_call(fake_service):
+    fake_service['answer'] = lambda n: b'{"error": "KeyError: \'xx\'"}\n' if n == 1 else b'{"results": ["Z"]}\n'
+    assert phoneme_service.predict('xx', ['Zork']) is None
+    assert phoneme_service.available()
+    assert phoneme_service.predict('en', ['Zork']) == ['Z']
+    assert fake_service['connections'] == 1
+
+
+def test_malformed_answer_makes_the_service_unavailable(fake_service):
+    fake_service['answer'] = lambda n: b'not json\n'
+    assert phoneme_service.predict('en', ['Zork']) is None
+    assert not phoneme_service.available()
+
+
+def test_timeout_of_a_reused_connection_is_not_retried(fake_service):
+    fake_service['answer'] = lambda n: b'{"results": ["Z"]}\n' if n == 1 else None
+    client = phoneme_service.PhonemeClient(os.environ[phoneme_service.SOCKET_ENV], timeout=0.5)
+    assert client.predict('en', ['Zork']) == ['Z']
+    with pytest.raises(socket.timeout):
+        client.predict('en', ['Zork'])
+    assert fake_service['connections'] == 1
+    client.close()
@@ -0,0 +1,79 @@
+"""
+Approximate search of the name index (index_store.NameIndex.fuzzy() and prefix(), and "/api/suggest")
+"""
+import os
+import json
+import random
+
+import pytest
+
+from translators import index_store
+
+NAMES = ['Alexander', 'Alexandre', 'Aleksandr', 'Alex', 'Alexis', 'Anna', 'London', 'Londres', 'McDonald', 'Mcintyre',
+         'MacLeod']
+
+
+@pytest.fixture(scope='module')
+def name_index(tmp_path_factory):
+    json_path = str(tmp_path_factory.mktemp('index') / 'people.json')
+    with open(json_path, 'w', encoding='utf8') as f:
+        json.dump([{'name': name, 'culture': '', 'chinese': str(i)} for i, name in enumerate(NAMES)], f)
+    idx_path = index_store.index_path(json_path)
+    index_store.build(json_path, idx_path)
+    index = index_store.NameIndex(idx_path)
+    yield index
+    index.close()
+    os.remove(idx_path)
+
+
+def reference_levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+        previous = current
+    return previous[-1]
+
+
+def test_levenshtein_matches_reference():
+    rnd = random.Random(1)
+    for _ in range(20000):
+        a = ''.join(rnd.choice('abcé') for _ in range(rnd.randint(0, 12)))
+        b = ''.join(rnd.choice('abcé') for _ in range(rnd.randint(0, 12)))
+        max_distance = rnd.randint(0, 3)
+        distance = reference_levenshtein(a, b)
+        expected = distance if distance <= max_distance else max_distance + 1
+        assert index_store.levenshtein(a, b, max_distance) == expected, (a, b, max_distance)
+
+
+def test_fuzzy_finds_spelling_variants(name_index):
+    assert [name for _, name, _ in name_index.fuzzy('alexandar', 1)] == ['Alexander']
+    assert [(distance, name) for distance, name, _ in name_index.fuzzy('Alexandr', 2)] == [
+        (1, 'Alexander'), (1, 'Alexandre'), (2, 'Aleksandr')]
+
+
+def test_prefix_is_case_insensitive(name_index):
+    def names(prefix):
+        return [name_index.key(i).decode('utf8') for i in name_index.prefix(prefix, 10)]
+
+    assert names('McD') == names('mcd') == names('MCD') == ['McDonald']
+    assert names('mc') == ['McDonald', 'Mcintyre']
+    assert names('Al') == ['Aleksandr', 'Alex', 'Alexander', 'Alexandre', 'Alexis']
+    assert names('Alex')[:1] == ['Alex'] and len(name_index.prefix('a', 2)) == 2
+    assert names('Mz') == []
+
+
+def test_fuzzy_rejects_long_keywords(name_index):
+    name_index.fuzzy('a' * index_store.MAX_KEYWORD_LENGTH, index_store.MAX_EDITS)
+    with pytest.raises(AssertionError):
+        name_index.fuzzy('a' * (index_store.MAX_KEYWORD_LENGTH + 1), index_store.MAX_EDITS)
+
+
+def test_api_rejects_long_keywords(client):
+    for keyword in ('Alexander' * 100, 'a' * (index_store.MAX_KEYWORD_LENGTH + 1)):
+        response = client.post('/api/suggest', json={'keyword': keyword, 'max_edits': index_store.MAX_EDITS})
+        assert response.status_code == 400
+        assert 'error' in json.loads(response.data)
+    response = client.post('/api/suggest', json={'keyword': 'Alexandr', 'max_edits': 1})
+    assert response.status_code == 200
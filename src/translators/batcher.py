@@ -0,0 +1,115 @@
+"""
+Coalescing of concurrent requests into micro-batches for asyncio servers.
+
+Requests submitted within a short window (or until max_batch distinct keywords are pending) are answered by one call
+ of a batch function like RuleTranslator.translate_many(), so a burst of out-of-dictionary words costs one batched
+ prediction instead of one per request. Requests for a keyword already pending or in flight share its result.
+"""
+import asyncio
+
+DEFAULT_WINDOW = 0.002  # Seconds to hold the first request of a batch
+DEFAULT_MAX_BATCH = 64  # Distinct keywords flushing a batch at once
+
+
+class MicroBatcher:
+    """
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, func_many, window=DEFAULT_WINDOW, max_batch=DEFAULT_MAX_BATCH, executor=None):
+        """
+        :param func_many: func_many(keywords, lang_codes) --> list of results in the order of keywords, a result may be
+                          an exception which is raised to the requests of its keyword. Run in executor.
+        :param window: seconds to wait for more requests after the first one of a batch, 0 to flush at the next
+                       iteration of the event loop
+        :param max_batch: flush as soon as this number of distinct keywords are pending
+        :param executor: concurrent.futures.Executor running func_many, None for the default executor of the loop
+        """
+        assert window >= 0 and max_batch > 0
+        self.func_many = func_many
+        self.window = window
+        self.max_batch = max_batch
+        self.executor = executor
+        self._pending = {}  # (keyword, lang_codes) --> future, waiting for the next batch
+        self._in_flight = {}  # (keyword, lang_codes) --> future, being computed
+        self._timer = None
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_keywords = 0
+
+    async def submit(self, keyword, lang_codes):
+        """
+        :param keyword: capitalized like the translators do before it is used as a key
+        :param lang_codes: list
+        :return: the result of keyword
+        """
+        loop = asyncio.get_running_loop()
+        key = (keyword.capitalize(), tuple(lang_codes))
+        self.requests += 1
+        future = self._pending.get(key) or self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = loop.create_future()
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+        # A cancelled request must not cancel the others waiting for the same keyword
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        self._in_flight.update(batch)
+        self.batches += 1
+        self.batched_keywords += len(batch)
+        done = asyncio.get_running_loop().run_in_executor(self.executor, self._run, list(batch.keys()))
+        done.add_done_callback(lambda f: self._resolve(batch, f))
+
+    def _run(self, keys):
+        """
+        Run in the executor
+        :param keys: list of (keyword, lang_codes)
+        :return: {(keyword, lang_codes): <result>}
+        """
+        d_keywords = {}  # lang_codes --> keywords, a call of func_many per distinct lang_codes
+        for keyword, lang_codes in keys:
+            d_keywords.setdefault(lang_codes, []).append(keyword)
+        results = {}
+        for lang_codes, keywords in d_keywords.items():
+            for keyword, result in zip(keywords, self.func_many(keywords, list(lang_codes))):
+                results[(keyword, lang_codes)] = result
+        return results
+
+    def _resolve(self, batch, done):
+        for key in batch.keys():
+            self._in_flight.pop(key, None)
+        for key, future in batch.items():
+            if future.done():
+                continue
+            if done.exception() is not None:
+                future.set_exception(done.exception())
+                continue
+            result = done.result()[key]
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        """
+        :return: {'requests': int, 'coalesced': int, 'batches': int, 'mean_batch_size': float}
+        """
+        return {
+            'requests': self.requests,
+            'coalesced': self.coalesced,
+            'batches': self.batches,
+            'mean_batch_size': self.batched_keywords / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,88 @@
+"""
+Size bounded LRU cache with hit/miss/eviction counters
+"""
+import threading
+from collections import OrderedDict
+
+DEFAULT_PHONETICS_CACHE_SIZE = 65536  # (lang_code, keyword) --> phonetics
+DEFAULT_RESULTS_CACHE_SIZE = 16384  # (keyword, lang_codes) --> result of translate() / search()
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Least recently used cache. A maxsize of 0 disables the cache.
+     Cached values are shared by all callers and must not be modified.
+    """
+
+    def __init__(self, maxsize):
+        assert isinstance(maxsize, int) and maxsize >= 0
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        :param key: a hashable key
+        :param default: returned if key is not cached
+        :return: the cached value or default
+        """
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Cache a value, evicting the least recently used one if the cache is full
+        :param key:
+        :param value:
+        """
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop all values, counters are kept
+        """
+        with self._lock:
+            self._data.clear()
+
+    def empty_copy(self):
+        """
+        A new empty cache of the same size, counters are carried over.
+         Replacing a cache by its empty copy invalidates it without racing with threads still writing to the old one.
+        :return: LRUCache
+        """
+        cache = LRUCache(self.maxsize)
+        cache.hits, cache.misses, cache.evictions = self.hits, self.misses, self.evictions
+        return cache
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        :return: {'size': int, 'maxsize': int, 'hits': int, 'misses': int, 'evictions': int}
+        """
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -1,11 +1,107 @@
+import time
+import threading
 from string import digits
 
-from big_phoney import PhoneticDictionary, PredictionModel
+from translators import phoneme_service, metrics
 
-phonetic_dict = PhoneticDictionary()
-pred_model = PredictionModel()
 remove_digits = str.maketrans('', '', digits)  # Remove stress levels from big_phoney's results
 
+# big_phoney pulls in TensorFlow and the trained Keras model, which take seconds to load.
+# They are built on first use (or by warm_up()) so that importing this module is instant,
+# and kept when the module is reloaded by RuleTranslator.reload().
+# Without TensorFlow, the model runs on NumPy instead, see translators/phoneme_model.py.
+_phonetic_dict = globals().get('_phonetic_dict')
+_pred_model = globals().get('_pred_model')
+_phonetic_dict_lock = threading.Lock()
+_pred_model_lock = threading.Lock()
+
+
+def get_phonetic_dict():
+    """
+    :return: the shared big_phoney.PhoneticDictionary, loaded on first call
+    """
+    global _phonetic_dict
+    if _phonetic_dict is None:
+        with _phonetic_dict_lock:
+            if _phonetic_dict is None:
+                try:
+                    from big_phoney import PhoneticDictionary
+                except ImportError:  # big_phoney imports Keras first
+                    from translators.phoneme_model import PhoneticDictionary
+                _phonetic_dict = PhoneticDictionary()
+    return _phonetic_dict
+
+
+def get_pred_model():
+    """
+    :return: the shared phoneme_model.KerasPredictionModel or NumpyPredictionModel, loaded on first call
+    """
+    global _pred_model
+    if _pred_model is None:
+        with _pred_model_lock:
+            if _pred_model is None:
+                from translators import phoneme_model
+                if phoneme_model.backend() == 'numpy':
+                    _pred_model = phoneme_model.load()
+                else:
+                    _pred_model = phoneme_model.KerasPredictionModel()
+    return _pred_model
+
+
+def warm_up():
+    """
+    Load all lazy resources of this module. The prediction model is not loaded if the phoneme service is running.
+    """
+    get_phonetic_dict()
+    if not phoneme_service.available():
+        get_pred_model()
+
+
+def warm_up_local():
+    """
+    Load the in-process prediction model, used by workers of the phoneme service
+    """
+    get_pred_model()
+
+
+def loaded_resources():
+    """
+    :return: {<resource name>: <whether it is loaded>}
+    """
+    return {'phonetic_dict': _phonetic_dict is not None,
+            'pred_model': _pred_model is not None or phoneme_service.available()}
+
+
+def data_version():
+    """
+    Version of the phonetic dictionary and the prediction model, part of the version of the results of the rule
+    :return: str
+    """
+    from translators import phoneme_model
+    return phoneme_model.data_version()
+
+
+def vocabulary():
+    """
+    Words whose phonetics are known without prediction, precomputed by "python cli.py build_tables"
+    :return: list of words
+    """
+    return list(get_phonetic_dict().keys())
+
+
+def _split_phonetics(s_phonetics):
+    """
+    Split a big_phoney's result into a list of phonetics without stress levels.
+    :param s_phonetics: e.g. 'B OY1'
+    :return: e.g. ['B', 'OW', 'IH']
+    """
+    result = s_phonetics.translate(remove_digits).split(' ')
+    # Transform "OY" (written as "oi" in "boy") into a sequence of "OW" "IH"
+    while result.count('OY'):
+        pos = result.index('OY')
+        result[pos: pos+1] = ('OW', 'IH')
+    return result
+
 
 def lookup_or_predict(word):
     """
@@ -14,16 +110,59 @@ def lookup_or_predict(word):
     :param word:
     :return:
     """
+    phonetic_dict = get_phonetic_dict()
+    t_start = time.perf_counter()
     result = phonetic_dict.lookup(word)
-    if result:
-        result = result.translate(remove_digits).split(' ')
-    else:
-        result = pred_model.predict(word).translate(remove_digits).split(' ')
-    # Transform "OY" (written as "oi" in "boy") into a sequence of "OW" "IH"
-    while result.count('OY'):
-        pos = result.index('OY')
-        result[pos: pos+1] = ('OW', 'IH')
-    return result
+    metrics.observe('dictionary_lookup', time.perf_counter() - t_start, 'en')
+    if not result:
+        result = predict_many([word])[0]
+    return _split_phonetics(result)
+
+
+def predict_many(words):
+    """
+    Predict phonetics of words which are not in the dictionary.
+     Words are sent to the phoneme service if it is running, else predicted in process.
+    :param words: list of distinct words
+    :return: list of big_phoney's results in the order of words
+    """
+    t_start = time.perf_counter()
+    results = phoneme_service.predict('en', words)
+    if results is None:
+        results = predict_many_local(words)
+    metrics.observe('prediction', time.perf_counter() - t_start, 'en')
+    return results
+
+
+def predict_many_local(words):
+    """
+    Predict phonetics by the in-process model.
+     This is the only place sending words to the model. Both models decode them in batches.
+    :param words: list of distinct words
+    :return: list of big_phoney's results in the order of words
+    """
+    return get_pred_model().predict_many(words)
+
+
+def lookup_or_predict_many(words):
+    """
+    Batch version of lookup_or_predict.
+     All words are looked up in the dictionary first, then the distinct missed words are predicted in one
+     predict_many() call.
+    :param words: list of words
+    :return: list of phonetics lists in the order of words
+    """
+    phonetic_dict = get_phonetic_dict()
+    t_start = time.perf_counter()
+    l_results = [phonetic_dict.lookup(word) for word in words]
+    metrics.observe('dictionary_lookup', time.perf_counter() - t_start, 'en')
+    d_predicted = {}  # keeps the order of the first occurrences
+    for word, result in zip(words, l_results):
+        if not result:
+            d_predicted[word] = None
+    if d_predicted:
+        d_predicted = dict(zip(d_predicted.keys(), predict_many(list(d_predicted.keys()))))
+    return [_split_phonetics(result if result else d_predicted[word]) for word, result in zip(words, l_results)]
 
 
 def post_process_people(word):
@@ -0,0 +1,332 @@
+"""
+Compact on-disk name index queried through mmap.
+
+"data/index/people.json" and "places.json" are compiled into "people.idx" and "places.idx":
+
+ +--------+---------------+---------------------+-------------------------+------------------+----------+--------------+
+ | header | deletions (m) | key offsets (n + 1) | payload offsets (n + 1) | folded order (n) | key blob | payload blob |
+ +--------+---------------+---------------------+-------------------------+------------------+----------+--------------+
+
+Keys (names) are UTF-8 encoded and sorted by bytes, so a name is found by a binary search over the key table. The
+ payload of a name holds all its (culture, chinese) entries in the order of the JSON file. The folded order lists the
+ positions of the keys sorted by their lowercase form, so that a prefix is found case insensitively by a binary search
+ as well. Offsets and positions are native unsigned 32-bit integers. Pages are shared by all processes through the
+ page cache, so opening an index is nearly free and it costs no private memory.
+
+The deletion table serves approximate search (symmetric deletion): every string obtained by deleting up to
+ MAX_EDITS characters of a lowercase name is stored as "<crc32 of the string> << 32 | <position of the name>" in a
+ sorted array of native unsigned 64-bit integers. Two names within MAX_EDITS edits share at least one of those
+ strings, so candidates of a query are found by a few binary searches and only they are verified by Levenshtein
+ distance.
+"""
+import os
+import sys
+import json
+import mmap
+import zlib
+import bisect
+import struct
+import hashlib
+from array import array
+
+MAGIC = b'PPATIX3' + (b'L' if sys.byteorder == 'little' else b'B')  # Offsets are in native byte order
+# magic, source mtime_ns, source size, source sha1, number of keys, number of deletions. 8 bytes aligned.
+HEADER = struct.Struct('<8sQQ20sIQ')
+FIELD_SEP = '\x1f'
+ENTRY_SEP = '\x1e'
+MAX_EDITS = 2  # Max edit distance supported by approximate search
+MAX_KEYWORD_LENGTH = 64  # Longest keyword of approximate search, its deletions grow with the square of its length
+
+
+def index_path(json_path):
+    """
+    :param json_path: e.g. './translators/data/index/people.json'
+    :return: e.g. './translators/data/index/people.idx'
+    """
+    return os.path.splitext(json_path)[0] + '.idx'
+
+
+def deletions(word, max_edits):
+    """
+    All strings obtained by deleting up to max_edits characters of word
+    :param word:
+    :param max_edits:
+    :return: set of str, including word itself
+    """
+    result = {word}
+    frontier = {word}
+    for _ in range(max_edits):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+def char_masks(word):
+    """
+    :param word:
+    :return: {<character>: <bit mask of its positions in word>}, see levenshtein()
+    """
+    masks = {}
+    for i, ch in enumerate(word):
+        masks[ch] = masks.get(ch, 0) | 1 << i
+    return masks
+
+
+def levenshtein(a, b, max_distance, a_masks=None):
+    """
+    Levenshtein distance of a and b, by the bit-parallel algorithm of Myers and Hyyro: a column of the distance matrix
+     is kept as bit vectors of its vertical deltas, and each character of b updates it with a few integer operations.
+     It stops as soon as the distance cannot be within max_distance any more.
+    :param a:
+    :param b:
+    :param max_distance:
+    :param a_masks: char_masks(a), given by callers comparing a with many strings
+    :return: the distance, or max_distance + 1 if it is greater than max_distance
+    """
+    too_far = max_distance + 1
+    m, n = len(a), len(b)
+    if abs(m - n) > max_distance:
+        return too_far
+    if a == b:
+        return 0
+    if m == 0:
+        return n
+    if a_masks is None:
+        a_masks = char_masks(a)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv = full  # Positive and negative vertical deltas
+    mv = 0
+    distance = m  # Distance of a and b[:j + 1]
+    for j, ch in enumerate(b):
+        eq = a_masks.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last:
+            distance += 1
+        elif mh & last:
+            distance -= 1
+        if distance - (n - j - 1) > max_distance:  # Each remaining character lowers it by 1 at most
+            return too_far
+        ph = (ph << 1 | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+    return distance if distance <= max_distance else too_far
+
+
+def _digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+def is_fresh(json_path, idx_path):
+    """
+    Check whether idx_path was built from the current content of json_path
+    :param json_path:
+    :param idx_path:
+    :return: True if fresh, else False
+    """
+    try:
+        with open(idx_path, 'rb') as f:
+            magic, mtime_ns, size, sha1, _, _ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return False
+    if magic != MAGIC:
+        return False
+    stat = os.stat(json_path)
+    if stat.st_mtime_ns == mtime_ns and stat.st_size == size:
+        return True
+    return _digest(json_path) == sha1
+
+
+def build(json_path, idx_path):
+    """
+    Compile a people/places JSON file into an index file.
+     Raises json.JSONDecodeError if the JSON file is invalid.
+    :param json_path:
+    :param idx_path:
+    :return: number of names in the index
+    """
+    stat = os.stat(json_path)
+    with open(json_path, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw.decode('utf8'))
+
+    entries = {}
+    for m in data:
+        entries.setdefault(m['name'], []).append(str(m['culture']) + FIELD_SEP + str(m['chinese']))
+    keys = sorted(entries.keys(), key=lambda k: k.encode('utf8'))
+
+    key_offsets = array('I', [0])
+    payload_offsets = array('I', [0])
+    assert key_offsets.itemsize == 4
+    key_blob = bytearray()
+    payload_blob = bytearray()
+    for k in keys:
+        key_blob += k.encode('utf8')
+        key_offsets.append(len(key_blob))
+        payload_blob += ENTRY_SEP.join(entries[k]).encode('utf8')
+        payload_offsets.append(len(payload_blob))
+
+    l_deletions = []
+    for i, k in enumerate(keys):
+        for d in deletions(k.lower(), MAX_EDITS):
+            l_deletions.append(zlib.crc32(d.encode('utf8')) << 32 | i)
+    l_deletions.sort()
+    deletion_table = array('Q', l_deletions)
+    assert deletion_table.itemsize == 8
+    folded_order = array('I', sorted(range(len(keys)), key=lambda i: (keys[i].lower(), keys[i].encode('utf8'))))
+
+    tmp_path = '{}.{}.tmp'.format(idx_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, stat.st_mtime_ns, stat.st_size, hashlib.sha1(raw).digest(), len(keys),
+                            len(deletion_table)))
+        f.write(deletion_table.tobytes())
+        f.write(key_offsets.tobytes())
+        f.write(payload_offsets.tobytes())
+        f.write(folded_order.tobytes())
+        f.write(key_blob)
+        f.write(payload_blob)
+    os.replace(tmp_path, idx_path)  # Processes still reading the old index keep their own mapping
+    return len(keys)
+
+
+class NameIndex:
+    """
+    Read-only view of an index file
+    """
+
+    def __init__(self, idx_path):
+        with open(idx_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, _, sha1, n, m = HEADER.unpack_from(self._mm, 0)
+        assert magic == MAGIC, 'Invalid index file: {}'.format(idx_path)
+        self.n = n
+        self.source_sha1 = sha1  # Identifies the content of the JSON file
+        view = memoryview(self._mm)
+        start = HEADER.size
+        self._deletions = view[start: start + 8 * m].cast('Q')
+        start += 8 * m
+        self._key_offsets = view[start: start + 4 * (n + 1)].cast('I')
+        start += 4 * (n + 1)
+        self._payload_offsets = view[start: start + 4 * (n + 1)].cast('I')
+        start += 4 * (n + 1)
+        self._folded_order = view[start: start + 4 * n].cast('I')
+        start += 4 * n
+        self._key_base = start
+        self._payload_base = start + self._key_offsets[n]
+
+    def __len__(self):
+        return self.n
+
+    def key(self, i):
+        """
+        :param i: position in the sorted key table
+        :return: bytes of the i-th key
+        """
+        return self._mm[self._key_base + self._key_offsets[i]: self._key_base + self._key_offsets[i + 1]]
+
+    def entries(self, i):
+        """
+        :param i: position in the sorted key table
+        :return: [(<culture>, <chinese>), ...] of the i-th key. Cultures are interned, a few distinct values such as
+                 "法、美" are shared by all entries kept alive.
+        """
+        payload = self._mm[self._payload_base + self._payload_offsets[i]:
+                           self._payload_base + self._payload_offsets[i + 1]].decode('utf8')
+        l_entries = []
+        for entry in payload.split(ENTRY_SEP):
+            culture, chinese = entry.split(FIELD_SEP, 1)
+            l_entries.append((sys.intern(culture), chinese))
+        return l_entries
+
+    def bisect(self, b_key):
+        """
+        :param b_key: UTF-8 encoded key
+        :return: the leftmost position where b_key could be inserted into the key table
+        """
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < b_key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, key, default=None):
+        """
+        :param key: a name
+        :param default: returned if the name is not in the index
+        :return: [(<culture>, <chinese>), ...]
+        """
+        b_key = key.encode('utf8')
+        i = self.bisect(b_key)
+        if i < self.n and self.key(i) == b_key:
+            return self.entries(i)
+        return default
+
+    def folded_key(self, j):
+        """
+        :param j: position in the folded order
+        :return: lowercase str of the key
+        """
+        return self.key(self._folded_order[j]).decode('utf8').lower()
+
+    def prefix(self, prefix, limit):
+        """
+        Names starting with prefix, case insensitive, in the order of their lowercase forms
+        :param prefix:
+        :param limit: max number of names
+        :return: list of positions in the key table
+        """
+        prefix = prefix.lower()
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.folded_key(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        l_positions = []
+        while lo < self.n and len(l_positions) < limit and self.folded_key(lo).startswith(prefix):
+            l_positions.append(self._folded_order[lo])
+            lo += 1
+        return l_positions
+
+    def fuzzy(self, word, max_edits):
+        """
+        Names within max_edits edits of word, case insensitive
+        :param word: at most MAX_KEYWORD_LENGTH characters
+        :param max_edits: int, not greater than MAX_EDITS
+        :return: [(<distance>, <name>, <position in the key table>), ...] sorted by distance and name
+        """
+        assert 0 <= max_edits <= MAX_EDITS, 'max_edits should be in [0, {}]'.format(MAX_EDITS)
+        assert len(word) <= MAX_KEYWORD_LENGTH, 'keyword should be at most {} characters'.format(MAX_KEYWORD_LENGTH)
+        word = word.lower()
+        word_masks = char_masks(word)
+        candidates = set()
+        for d in deletions(word, max_edits):
+            crc = zlib.crc32(d.encode('utf8'))
+            j = bisect.bisect_left(self._deletions, crc << 32)
+            while j < len(self._deletions) and self._deletions[j] >> 32 == crc:
+                candidates.add(self._deletions[j] & 0xffffffff)
+                j += 1
+        results = []
+        for i in candidates:
+            name = self.key(i).decode('utf8')
+            distance = levenshtein(word, name.lower(), max_edits, word_masks)
+            if distance <= max_edits:
+                results.append((distance, name, i))
+        results.sort()
+        return results
+
+    def close(self):
+        self._deletions.release()
+        self._key_offsets.release()
+        self._payload_offsets.release()
+        self._folded_order.release()
+        self._mm.close()
@@ -0,0 +1,252 @@
+"""
+Persistent translation memory shared by processes and runs.
+
+Results of rules are kept in a SQLite file keyed by (lang_code, version, keyword), the version being the hex SHA1 of
+ the ".rule" and ".py" files of the rule and of the data of its module, e.g. the phonetic dictionary and the
+ prediction model (see rule_cache.results_digest()), so a changed rule never reads results of its former version.
+ A row holds the phonetics of the keyword and the Chinese of both categories after the ".post" functions, or only
+ the phonetics if no rule matched them: NoRuleMatched is then raised again without predicting.
+
+The file is in WAL mode, so readers of any process never block and are never blocked, and writers wait for each
+ other up to BUSY_TIMEOUT. Each process buffers its new rows and writes them in one transaction every FLUSH_SIZE rows
+ or FLUSH_INTERVAL seconds, and at exit. Rows buffered by a process which is killed are lost, they are only a cache.
+ Keep the file on a local file system: WAL needs shared memory between the processes.
+
+Set "$PPAT_TRANSLATION_MEMORY" to the path of the file to enable it, for the web app and the CLI at once. Rows of
+ former versions of the rules are pruned when rules are loaded. "python cli.py memory" reports the hit ratio of every
+ version, counted by all processes.
+"""
+import os
+import time
+import atexit
+import sqlite3
+import threading
+
+MEMORY_ENV = 'PPAT_TRANSLATION_MEMORY'
+FLUSH_SIZE = 256  # Buffered rows written at once
+FLUSH_INTERVAL = 5.0  # Max seconds a row stays buffered while rows are added
+BUSY_TIMEOUT = 10.0  # Seconds to wait for the writer of another process
+MAX_VARIABLES = 500  # Keywords per "IN (...)" query, SQLite allows 999 variables
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS memory (
+    lang_code TEXT NOT NULL,
+    version TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    phonetics TEXT NOT NULL,
+    people TEXT,
+    places TEXT,
+    PRIMARY KEY (lang_code, version, keyword)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats (
+    lang_code TEXT NOT NULL,
+    version TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (lang_code, version)
+);
+'''
+
+
+def memory_path():
+    """
+    :return: path of the translation memory, None if it is disabled
+    """
+    return os.environ.get(MEMORY_ENV) or None
+
+
+class TranslationMemory:
+    """
+    SQLite translation memory, safe to use from many threads and processes
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()  # A connection per thread and process
+        self._lock = threading.Lock()
+        self._pending = {}  # (lang_code, version, keyword) --> (phonetics, people, places)
+        self._t_pending = 0.0  # When the oldest buffered row was added
+        self._counts = {}  # (lang_code, version) --> [hits, misses] not written yet
+        self.hits = 0
+        self.misses = 0
+        self.written = 0
+        self.pruned = 0
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+        atexit.register(self.flush)
+
+    def _connection(self):
+        """
+        :return: sqlite3.Connection of the current thread, a forked process opens its own
+        """
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            self._local.connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _count(self, lang_code, version, hits, misses):
+        with self._lock:
+            counts = self._counts.setdefault((lang_code, version), [0, 0])
+            counts[0] += hits
+            counts[1] += misses
+            self.hits += hits
+            self.misses += misses
+
+    def get(self, lang_code, version, keyword):
+        """
+        :param lang_code:
+        :param version: hex digest of the rule
+        :param keyword: capitalized keyword
+        :return: (<phonetics list>, <people chinese>, <places chinese>), the Chinese being None if no rule matched,
+                 None if the keyword is not remembered
+        """
+        return self.get_many(lang_code, version, [keyword]).get(keyword)
+
+    def get_many(self, lang_code, version, keywords):
+        """
+        :param lang_code:
+        :param version: hex digest of the rule
+        :param keywords: list of distinct capitalized keywords
+        :return: {<keyword>: (<phonetics list>, <people chinese>, <places chinese>)} of the remembered keywords
+        """
+        d_rows = {}
+        l_missed = []
+        with self._lock:
+            for keyword in keywords:
+                row = self._pending.get((lang_code, version, keyword))
+                if row is None:
+                    l_missed.append(keyword)
+                else:
+                    d_rows[keyword] = row
+        connection = self._connection()
+        for start in range(0, len(l_missed), MAX_VARIABLES):
+            chunk = l_missed[start: start + MAX_VARIABLES]
+            cursor = connection.execute(
+                'SELECT keyword, phonetics, people, places FROM memory '
+                'WHERE lang_code = ? AND version = ? AND keyword IN ({})'.format(','.join('?' * len(chunk))),
+                [lang_code, version] + chunk)
+            for keyword, phonetics, people, places in cursor:
+                d_rows[keyword] = (phonetics, people, places)
+        self._count(lang_code, version, len(d_rows), len(keywords) - len(d_rows))
+        return {keyword: (phonetics.split(' '), people, places)
+                for keyword, (phonetics, people, places) in d_rows.items()}
+
+    def put(self, lang_code, version, keyword, l_phonetics, people=None, places=None):
+        """
+        Remember a result, written with the next batch
+        :param lang_code:
+        :param version: hex digest of the rule
+        :param keyword: capitalized keyword
+        :param l_phonetics: list of phonetics of the keyword
+        :param people: Chinese of the people category, None if no rule matched
+        :param places: Chinese of the places category, None if no rule matched
+        """
+        with self._lock:
+            if not self._pending:
+                self._t_pending = time.time()
+            self._pending[(lang_code, version, keyword)] = (' '.join(l_phonetics), people, places)
+            full = len(self._pending) >= FLUSH_SIZE or time.time() - self._t_pending >= FLUSH_INTERVAL
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows and hit counts in one transaction
+        :return: number of rows written
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            counts, self._counts = self._counts, {}
+        if not pending and not counts:
+            return 0
+        connection = self._connection()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany('INSERT OR REPLACE INTO memory VALUES (?, ?, ?, ?, ?, ?)',
+                                       [k + v for k, v in pending.items()])
+                connection.executemany('INSERT OR IGNORE INTO stats (lang_code, version) VALUES (?, ?)',
+                                       list(counts.keys()))
+                connection.executemany('UPDATE stats SET hits = hits + ?, misses = misses + ? '
+                                       'WHERE lang_code = ? AND version = ?',
+                                       [(hits, misses) + k for k, (hits, misses) in counts.items()])
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:  # A cache, translations go on without it
+            print('Translation memory not written: {}'.format(str(e)))
+            return 0
+        with self._lock:
+            self.written += len(pending)
+        return len(pending)
+
+    def prune(self, d_versions, other_lang_codes=False):
+        """
+        Delete rows and counts of former versions of the rules
+        :param d_versions: {<lang_code>: <current version>}
+        :param other_lang_codes: if True, also delete those of lang_codes not in d_versions
+        :return: number of rows deleted
+        """
+        self.flush()
+        connection = self._connection()
+        n = 0
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                for table in ('memory', 'stats'):
+                    for lang_code, version in d_versions.items():
+                        cursor = connection.execute('DELETE FROM {} WHERE lang_code = ? AND version != ?'.format(
+                            table), (lang_code, version))
+                        n += cursor.rowcount if table == 'memory' else 0
+                    if other_lang_codes:
+                        cursor = connection.execute('DELETE FROM {} WHERE lang_code NOT IN ({})'.format(
+                            table, ','.join('?' * len(d_versions))), list(d_versions.keys()))
+                        n += cursor.rowcount if table == 'memory' else 0
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            print('Translation memory not pruned: {}'.format(str(e)))
+            return 0
+        with self._lock:
+            self.pruned += n
+        return n
+
+    def report(self):
+        """
+        Rows and hit counts of every version, written by all processes
+        :return: [(<lang_code>, <version>, <rows>, <hits>, <misses>), ...] sorted by lang_code and version
+        """
+        self.flush()
+        connection = self._connection()
+        d_report = {}
+        for lang_code, version, n in connection.execute(
+                'SELECT lang_code, version, COUNT(*) FROM memory GROUP BY lang_code, version'):
+            d_report[(lang_code, version)] = [n, 0, 0]
+        for lang_code, version, hits, misses in connection.execute(
+                'SELECT lang_code, version, hits, misses FROM stats'):
+            d_report.setdefault((lang_code, version), [0, 0, 0])[1:] = [hits, misses]
+        return [k + tuple(v) for k, v in sorted(d_report.items())]
+
+    def stats(self):
+        """
+        Counters of this process, like LRUCache.stats()
+        :return: {'size': <rows written>, 'maxsize': 0, 'hits': int, 'misses': int, 'evictions': <rows pruned>}
+        """
+        return {
+            'size': self.written,
+            'maxsize': 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.pruned,
+        }
+
+    def close(self):
+        self.flush()
+        if getattr(self._local, 'pid', None) == os.getpid():
+            self._local.connection.close()
+            self._local.pid = None
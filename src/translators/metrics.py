@@ -0,0 +1,131 @@
+"""
+Lightweight per-stage timing of translations.
+
+Stages observe their durations with observe(), which feeds a latency histogram per (stage, lang_code, category)
+ rendered in the Prometheus text format by render(). Inside a collect() block, durations observed by the current
+ thread are also summed up, which gives the timing breakdown of a single request.
+
+Stages:
+ translate / search   whole RuleTranslator.translate() / IndexTranslator.lookup() calls, cache hits included
+ table_lookup         lookup of a keyword in the precomputed table of a rule
+ memory_lookup        lookup of keywords in the translation memory (see memory.py)
+ to_phonetics         ".to_phonetics" function of a rule
+ dictionary_lookup    phonetic dictionary lookups of a rule module (e.g. "en.py")
+ prediction           predictions of a rule module's model, local or by the phoneme service
+ rule_match           matching phonetics against the rules of a category
+ post                 ".post" function of a category
+ index_search         lookup of a name in the index of a category
+ reverse_search       IndexTranslator.reverse() lookups of names by Chinese
+ reload_rules / _index  RuleTranslator.reload() / IndexTranslator.reload()
+"""
+import bisect
+import threading
+import contextlib
+
+# Upper bounds in seconds
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class Registry:
+    """
+    Histograms of stage durations, safe to use from many threads
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}  # (stage, lang_code, category) --> Histogram
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def observe(self, stage, seconds, lang_code='', category=''):
+        """
+        :param stage: see the stages above
+        :param seconds: duration of the stage
+        :param lang_code: '' if the stage is not specific to a language
+        :param category: 'people' | 'places', '' if the stage is not specific to a category
+        """
+        key = (stage, lang_code, category)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+        timings = getattr(self._local, 'timings', None)
+        if timings is not None:
+            name = '.'.join(label for label in key if label)
+            timings[name] = timings.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def collect(self):
+        """
+        Sum up durations observed by the current thread while in the block
+        :return: {'<stage>[.<lang_code>][.<category>]': <seconds>}, filled when the block exits
+        """
+        timings = {}
+        saved = getattr(self._local, 'timings', None)
+        self._local.timings = timings
+        try:
+            yield timings
+        finally:
+            self._local.timings = saved
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """
+        :return: histograms in the Prometheus text exposition format
+        """
+        lines = ['# HELP ppat_stage_seconds Time spent in each stage of translations.',
+                 '# TYPE ppat_stage_seconds histogram']
+        with self._lock:
+            items = sorted((key, list(h.counts), h.sum, h.count) for key, h in self._histograms.items())
+        for (stage, lang_code, category), counts, s_sum, count in items:
+            labels = 'stage="{}",lang_code="{}",category="{}"'.format(stage, lang_code, category)
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append('ppat_stage_seconds_bucket{{{},le="{}"}} {}'.format(labels, bound, cumulative))
+            lines.append('ppat_stage_seconds_bucket{{{},le="+Inf"}} {}'.format(labels, count))
+            lines.append('ppat_stage_seconds_sum{{{}}} {}'.format(labels, repr(s_sum)))
+            lines.append('ppat_stage_seconds_count{{{}}} {}'.format(labels, count))
+        return '\n'.join(lines) + '\n'
+
+
+def render_cache_stats(d_caches):
+    """
+    :param d_caches: {<cache name>: <LRUCache.stats()>}
+    :return: cache counters and sizes in the Prometheus text exposition format
+    """
+    lines = []
+    for metric, key, metric_type, s_help in (
+            ('ppat_cache_hits_total', 'hits', 'counter', 'Lookups answered by the cache.'),
+            ('ppat_cache_misses_total', 'misses', 'counter', 'Lookups missing the cache.'),
+            ('ppat_cache_evictions_total', 'evictions', 'counter', 'Entries evicted from the cache.'),
+            ('ppat_cache_size', 'size', 'gauge', 'Entries in the cache.')):
+        lines.append('# HELP {} {}'.format(metric, s_help))
+        lines.append('# TYPE {} {}'.format(metric, metric_type))
+        for name, stats in sorted(d_caches.items()):
+            lines.append('{}{{cache="{}"}} {}'.format(metric, name, stats[key]))
+    return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+observe = REGISTRY.observe
+collect = REGISTRY.collect
+render = REGISTRY.render
@@ -0,0 +1,428 @@
+"""
+NumPy inference of big_phoney's prediction model, without TensorFlow and Keras.
+
+big_phoney's PredictionModel is a small sequence-to-sequence network: characters are embedded and encoded by a
+ bidirectional LSTM, and phonetics are decoded by an LSTM attending to the encoded characters, with a beam search
+ keeping the 3 best sequences. Importing TensorFlow and Keras to run it takes seconds and hundreds of MB per process,
+ so the weights are exported once into a ".npz" file and the same computation runs on NumPy arrays:
+
+> python cli.py export_model
+
+The weights are read from big_phoney's HDF5 file with h5py, so exporting needs neither TensorFlow nor Keras. The file
+ is also exported on first use if missing. It is a generated file, so it goes into the cache directory of the user,
+ "$XDG_CACHE_HOME/ppat/" or "~/.cache/ppat/", never into the source tree of a serving process.
+
+Words are predicted in batches: all characters are encoded at once and every decoding step computes the live
+ sequences of all words in one matrix product. The beam search is the one of big_phoney, word by word, so results are
+ the same as those of PredictionModel.predict() but for rounding (see benchmarks/phoneme_model.py). The same batched
+ beam search drives big_phoney's own Keras encoder and decoder when TensorFlow is used, see KerasPredictionModel.
+
+"$PPAT_PREDICTION_BACKEND" selects the model of "en.py": "keras", "numpy", or "auto" (default), which is big_phoney's
+ model if TensorFlow is installed, else this one. "$PPAT_NUMPY_MODEL" is the path of the ".npz" file, see
+ model_path().
+"""
+import os
+import pickle
+import importlib.util
+
+import numpy as np
+
+BACKEND_ENV = 'PPAT_PREDICTION_BACKEND'
+PATH_ENV = 'PPAT_NUMPY_MODEL'
+MODEL_FILE_NAME = 'en.npz'
+BATCH_SIZE = 256  # Words decoded at once
+
+# Constants of big_phoney 1.0.1 (prediction_model_utils.py and shared_constants.py)
+CHARS = [''] + ['.', '-', "'"] + [chr(c) for c in range(ord('A'), ord('Z') + 1)]
+START_PHONE_SYM = '\t'
+END_PHONE_SYM = '\n'
+MAX_CHAR_SEQ_LEN = 20
+MAX_PADDED_PHONE_SEQ_LEN = 21
+SEARCH_WIDTH = 3
+
+# Layers with weights, in the order of the HDF5 file: (<name in the ".npz">, <Keras layer>, <weights>)
+LAYERS = (
+    ('char_embedding', 'Embedding', ('embeddings',)),
+    ('encoder', 'Bidirectional(LSTM)', ('forward_kernel', 'forward_recurrent_kernel', 'forward_bias',
+                                        'backward_kernel', 'backward_recurrent_kernel', 'backward_bias')),
+    ('attention_1', 'Dense(tanh)', ('kernel', 'bias')),
+    ('attention_2', 'Dense(relu)', ('kernel', 'bias')),
+    ('phone_embedding', 'Embedding', ('embeddings',)),
+    ('context_phone', 'Dense(relu)', ('kernel', 'bias')),
+    ('decoder', 'LSTM', ('kernel', 'recurrent_kernel', 'bias')),
+    ('output', 'Dense(softmax)', ('kernel', 'bias')),
+)
+
+
+def cache_dir():
+    """
+    :return: cache directory of the user for generated files, "$XDG_CACHE_HOME/ppat" or "~/.cache/ppat"
+    """
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'ppat')
+
+
+def model_path():
+    """
+    :return: path of the exported ".npz" file, "$PPAT_NUMPY_MODEL" or "en.npz" in cache_dir()
+    """
+    return os.environ.get(PATH_ENV) or os.path.join(cache_dir(), MODEL_FILE_NAME)
+
+
+def backend():
+    """
+    :return: 'keras' or 'numpy', the prediction model to be loaded by rule modules
+    """
+    value = os.environ.get(BACKEND_ENV, 'auto').lower()
+    assert value in ('auto', 'keras', 'numpy'), '${} must be "auto", "keras" or "numpy".'.format(BACKEND_ENV)
+    if value == 'auto':
+        return 'keras' if importlib.util.find_spec('tensorflow') is not None else 'numpy'
+    return value
+
+
+def _big_phoney_data_dir():
+    """
+    :return: "data" directory of the installed big_phoney, found without importing it (which imports Keras)
+    """
+    spec = importlib.util.find_spec('big_phoney')
+    assert spec is not None and spec.submodule_search_locations, 'big_phoney is not installed.'
+    return os.path.join(list(spec.submodule_search_locations)[0], 'data')
+
+
+def data_version():
+    """
+    Identify the phonetic dictionary and the trained weights of big_phoney by the size and mtime of their files,
+     without loading them. The ".npz" file exported into cache_dir() is generated from the weights, so only a
+     "$PPAT_NUMPY_MODEL" given by the user is added. Both backends predict the same phonetics, so it is not added.
+    :return: str
+    """
+    l_paths = []
+    spec = importlib.util.find_spec('big_phoney')
+    if spec is not None and spec.submodule_search_locations:
+        data_dir = os.path.join(list(spec.submodule_search_locations)[0], 'data')
+        l_paths = [os.path.join(data_dir, name) for name in ('bp-phonetic-dict.pkl', 'prediction_model_weights.hdf5')]
+    if os.environ.get(PATH_ENV):
+        l_paths.append(os.environ[PATH_ENV])
+    l_versions = []
+    for path in l_paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            l_versions.append('{}:missing'.format(os.path.basename(path)))
+            continue
+        l_versions.append('{}:{}:{}'.format(os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+    return ';'.join(l_versions)
+
+
+def export(path=None, weights_path=None, symbols_path=None):
+    """
+    Extract the trained weights of big_phoney's model into a ".npz" file
+    :param path: ".npz" file to write, default is model_path()
+    :param weights_path: big_phoney's "prediction_model_weights.hdf5", default is the installed one
+    :param symbols_path: big_phoney's "bp-phonetic-symbols.pkl", default is the installed one
+    :return: path written
+    """
+    import h5py
+
+    path = path or model_path()
+    if weights_path is None or symbols_path is None:
+        data_dir = _big_phoney_data_dir()
+        weights_path = weights_path or os.path.join(data_dir, 'prediction_model_weights.hdf5')
+        symbols_path = symbols_path or os.path.join(data_dir, 'bp-phonetic-symbols.pkl')
+    with open(symbols_path, 'rb') as f:
+        phones = [''] + [START_PHONE_SYM, END_PHONE_SYM] + list(pickle.load(f))
+
+    d_arrays = {'chars': np.array(CHARS), 'phones': np.array(phones)}
+    with h5py.File(weights_path, 'r') as f:
+        if 'model_weights' in f:  # Saved by model.save() instead of model.save_weights()
+            f = f['model_weights']
+        l_layers = []
+        for name in f.attrs['layer_names']:
+            group = f[name]
+            l_weights = [np.asarray(group[w_name]) for w_name in group.attrs['weight_names']]
+            if l_weights:
+                l_layers.append(l_weights)
+    assert len(l_layers) == len(LAYERS), 'Not the model of big_phoney 1.0: {} layers with weights.'.format(
+        len(l_layers))
+    for (name, _, weight_names), l_weights in zip(LAYERS, l_layers):
+        assert len(l_weights) == len(weight_names), 'Unexpected weights of layer "{}".'.format(name)
+        for weight_name, weights in zip(weight_names, l_weights):
+            d_arrays['{}/{}'.format(name, weight_name)] = weights.astype(np.float32)
+
+    assert d_arrays['char_embedding/embeddings'].shape[0] == len(CHARS), 'Characters differ from big_phoney 1.0.'
+    assert d_arrays['output/bias'].shape[0] == len(phones), 'Phonetic symbols differ from the weights.'
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Processes exporting at once write their own file, and other processes never load a partial file
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:  # np.savez() would append ".npz" to a file name
+            np.savez(f, **d_arrays)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def load(path=None):
+    """
+    :param path: ".npz" file, default is model_path(). It is exported first if missing
+    :return: NumpyPredictionModel
+    """
+    path = path or model_path()
+    if not os.path.exists(path):
+        print('Exporting the weights of the prediction model into "{}" ...'.format(path))
+        export(path)
+    return NumpyPredictionModel(path)
+
+
+class PhoneticDictionary:
+    """
+    big_phoney.PhoneticDictionary, which cannot be imported without Keras: big_phoney imports its model first
+    """
+
+    def __init__(self, path=None):
+        with open(path or os.path.join(_big_phoney_data_dir(), 'bp-phonetic-dict.pkl'), 'rb') as f:
+            self._d = pickle.load(f)
+
+    def keys(self):
+        return self._d.keys()
+
+    def lookup(self, word):
+        entries = self._d.get(word.upper())
+        return entries[0] if entries else None
+
+
+def _hard_sigmoid(x):
+    """
+    Recurrent activation of Keras 2 LSTMs
+    """
+    return np.clip(x * np.float32(0.2) + np.float32(0.5), 0, 1)
+
+
+def _lstm_gates(z, c, units):
+    """
+    :param z: (n, 4 * units) input and recurrent products, gates in the order of Keras: i, f, c, o
+    :param c: (n, units) former cell state
+    :return: (h, c) new states
+    """
+    i = _hard_sigmoid(z[:, :units])
+    f = _hard_sigmoid(z[:, units: 2 * units])
+    o = _hard_sigmoid(z[:, 3 * units:])
+    c = f * c + i * np.tanh(z[:, 2 * units: 3 * units])
+    return o * np.tanh(c), c
+
+
+class BatchPredictionModel:
+    """
+    big_phoney's beam search for batches of words. Subclasses run the encoder and the decoder on batches, and set
+     search_width, id_to_phone, start_id, end_id and units (size of the decoder states).
+    """
+
+    def _encode(self, words):
+        """
+        :param words: list of words
+        :return: encoded characters of the words, passed to _decode_step()
+        """
+        raise NotImplementedError
+
+    def _decode_step(self, encoded, rows, prev_ids, h, c):
+        """
+        One step of the decoder for n live sequences
+        :param encoded: result of _encode()
+        :param rows: (n,) word of every sequence
+        :param prev_ids: (n,) last phone of every sequence
+        :param h: (n, units) decoder states
+        :param c: (n, units)
+        :return: (probabilities (n, phones), h, c)
+        """
+        raise NotImplementedError
+
+    def predict(self, word):
+        """
+        :param word:
+        :return: phonetics like big_phoney's, e.g. 'AE1 L AH0 K S'
+        """
+        return self.predict_many([word])[0]
+
+    def predict_many(self, words):
+        """
+        :param words: list of words
+        :return: list of phonetics in the order of words
+        """
+        results = []
+        for start in range(0, len(words), BATCH_SIZE):
+            results.extend(self._beam_search(words[start: start + BATCH_SIZE]))
+        return results
+
+    def _beam_search(self, words):
+        """
+        big_phoney's PredictionModel.beam_search() for a batch of words, the live sequences of all words being
+         decoded together
+        """
+        width = self.search_width
+        encoded = self._encode(words)
+
+        # Live sequences of all words: (<word>, <phone ids>, <score>) and their decoder states by row
+        l_live = [(n, [self.start_id], np.float32(0)) for n in range(len(words))]
+        h = np.zeros((len(words), self.units), dtype=np.float32)
+        c = np.zeros((len(words), self.units), dtype=np.float32)
+        l_finished = [[] for _ in words]  # (<score>, <phone ids>) of every word
+        while l_live:
+            rows = np.array([n for n, _, _ in l_live])
+            prev_ids = np.array([seq[-1] for _, seq, _ in l_live])
+            probs, h, c = self._decode_step(encoded, rows, prev_ids, h, c)
+            log_probs = np.log(probs)
+            best_ids = probs.argsort(axis=1)[:, -width:]
+
+            d_candidates = {}  # word --> [(<phone ids>, <score>, <row of the state>), ...] in big_phoney's order
+            for row, (n, seq, score) in enumerate(l_live):
+                for token_id in best_ids[row]:
+                    new_seq = seq + [token_id]
+                    new_score = score - log_probs[row, token_id]
+                    if token_id == self.end_id or len(new_seq) > MAX_PADDED_PHONE_SEQ_LEN:
+                        l_finished[n].append((new_score, new_seq))
+                    else:
+                        d_candidates.setdefault(n, []).append((new_seq, new_score, row))
+            l_next = []
+            l_rows = []
+            for n, candidates in d_candidates.items():
+                while len(candidates) > width:  # Drop the worst one by one as big_phoney does
+                    del candidates[np.array([score for _, score, _ in candidates]).argsort()[-1]]
+                for new_seq, new_score, row in candidates:
+                    l_next.append((n, new_seq, new_score))
+                    l_rows.append(row)
+            l_live = l_next
+            h, c = h[l_rows], c[l_rows]
+
+        results = []
+        for finished in l_finished:
+            best_seq = finished[int(np.argmin([score for score, _ in finished]))][1]
+            results.append(' '.join(self.id_to_phone[i] for i in best_seq).strip())
+        return results
+
+
+class KerasPredictionModel(BatchPredictionModel):
+    """
+    big_phoney.PredictionModel decoding batches of words: its encoder and decoder models run once per batch and per
+     step instead of once per word and per live sequence
+    """
+
+    def __init__(self, model=None):
+        """
+        :param model: big_phoney.PredictionModel, loaded if None
+        """
+        if model is None:
+            from big_phoney import PredictionModel
+            model = PredictionModel()
+        self.model = model
+        self.search_width = model.search_width
+        self.id_to_phone = model.utils.id_to_phone
+        self.start_id = model.utils.phone_to_id[START_PHONE_SYM]
+        self.end_id = model.utils.phone_to_id[END_PHONE_SYM]
+        self.units = model.hidden_nodes
+
+    def _encode(self, words):
+        char_ids = np.vstack([self.model.utils.word_to_char_ids(word.upper()) for word in words])
+        return np.asarray(self.model.encoder.predict_on_batch(char_ids))
+
+    def _decode_step(self, encoded, rows, prev_ids, h, c):
+        probs, h, c = self.model.decoder.predict_on_batch([prev_ids[:, None], h, c, encoded[rows]])
+        return np.asarray(probs), np.asarray(h), np.asarray(c)
+
+
+class NumpyPredictionModel(BatchPredictionModel):
+    """
+    Stand in for big_phoney.PredictionModel computing with NumPy only
+    """
+
+    def __init__(self, path, search_width=SEARCH_WIDTH):
+        self.path = path
+        self.search_width = search_width
+        with np.load(path) as npz:
+            d_w = {name: npz[name] for name in npz.files}
+        self.char_to_id = {s: i for i, s in enumerate(d_w['chars'].tolist())}
+        self.id_to_phone = d_w['phones'].tolist()
+        self.start_id = self.id_to_phone.index(START_PHONE_SYM)
+        self.end_id = self.id_to_phone.index(END_PHONE_SYM)
+        self.units = d_w['decoder/recurrent_kernel'].shape[0]
+
+        # Embeddings are lookups, so the products of the layers right after them are precomputed per symbol
+        char_embeddings = np.maximum(d_w['char_embedding/embeddings'], 0)  # Activation('relu')
+        self.forward_inputs = char_embeddings.dot(d_w['encoder/forward_kernel']) + d_w['encoder/forward_bias']
+        self.backward_inputs = char_embeddings.dot(d_w['encoder/backward_kernel']) + d_w['encoder/backward_bias']
+        self.forward_recurrent = d_w['encoder/forward_recurrent_kernel']
+        self.backward_recurrent = d_w['encoder/backward_recurrent_kernel']
+
+        # Attention: Dense(tanh) of [<encoded character>, <decoder state>] split by its two inputs
+        encoded_size = 2 * self.forward_recurrent.shape[0]
+        self.attention_encoded = d_w['attention_1/kernel'][:encoded_size]
+        self.attention_state = d_w['attention_1/kernel'][encoded_size:]
+        self.attention_bias = d_w['attention_1/bias']
+        self.attention_out = d_w['attention_2/kernel'][:, 0]
+        self.attention_out_bias = d_w['attention_2/bias'][0]
+
+        # Dense(relu) of [<context>, <phone embedding>] split likewise
+        self.context_kernel = d_w['context_phone/kernel'][:encoded_size]
+        self.phone_inputs = (d_w['phone_embedding/embeddings'].dot(d_w['context_phone/kernel'][encoded_size:])
+                             + d_w['context_phone/bias'])
+
+        self.decoder_kernel = d_w['decoder/kernel']
+        self.decoder_recurrent = d_w['decoder/recurrent_kernel']
+        self.decoder_bias = d_w['decoder/bias']
+        self.output_kernel = d_w['output/kernel']
+        self.output_bias = d_w['output/bias']
+
+    def _char_ids(self, words):
+        """
+        Like PredictionModelUtils.word_to_char_ids(): unknown characters skipped, padded or cut to 20
+        :param words: list of words
+        :return: (n, MAX_CHAR_SEQ_LEN) int array
+        """
+        char_ids = np.zeros((len(words), MAX_CHAR_SEQ_LEN), dtype=np.int64)
+        for n, word in enumerate(words):
+            l_ids = [self.char_to_id[ch] for ch in word.upper() if ch in self.char_to_id][:MAX_CHAR_SEQ_LEN]
+            char_ids[n, :len(l_ids)] = l_ids
+        return char_ids
+
+    def _encode(self, words):
+        """
+        :return: (<outputs of the encoder>, <outputs projected by the first attention layer>)
+        """
+        encoded = self._encode_chars(self._char_ids(words))
+        return encoded, encoded.dot(self.attention_encoded) + self.attention_bias
+
+    def _encode_chars(self, char_ids):
+        """
+        Bidirectional LSTM over all characters, padding included as in Keras
+        :param char_ids: (n, MAX_CHAR_SEQ_LEN)
+        :return: (n, MAX_CHAR_SEQ_LEN, 2 * units) forward and backward outputs
+        """
+        n, length = char_ids.shape
+        units = self.forward_recurrent.shape[0]
+        encoded = np.empty((n, length, 2 * units), dtype=np.float32)
+        for inputs, recurrent, steps, offset in (
+                (self.forward_inputs, self.forward_recurrent, range(length), 0),
+                (self.backward_inputs, self.backward_recurrent, range(length - 1, -1, -1), units)):
+            h = np.zeros((n, units), dtype=np.float32)
+            c = np.zeros((n, units), dtype=np.float32)
+            for t in steps:
+                h, c = _lstm_gates(inputs[char_ids[:, t]] + h.dot(recurrent), c, units)
+                encoded[:, t, offset: offset + units] = h
+        return encoded
+
+    def _decode_step(self, encoded, rows, prev_ids, h, c):
+        encoded, encoded_attention = encoded
+        e = np.tanh(encoded_attention[rows] + h.dot(self.attention_state)[:, None, :])
+        e = np.maximum(e.dot(self.attention_out) + self.attention_out_bias, 0)  # (n, MAX_CHAR_SEQ_LEN)
+        weights = np.exp(e - e.max(axis=1, keepdims=True))
+        weights /= weights.sum(axis=1, keepdims=True)
+        context = np.einsum('nt,ntd->nd', weights, encoded[rows])
+        x = np.maximum(context.dot(self.context_kernel) + self.phone_inputs[prev_ids], 0)
+        h, c = _lstm_gates(x.dot(self.decoder_kernel) + h.dot(self.decoder_recurrent) + self.decoder_bias, c,
+                           self.units)
+        logits = h.dot(self.output_kernel) + self.output_bias
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+        return probs, h, c
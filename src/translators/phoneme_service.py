@@ -0,0 +1,283 @@
+"""
+Local phoneme prediction service.
+
+Every process importing a rule module like "en.py" would load its own prediction model. Instead, one service process
+ listening on a Unix socket owns the models in a small pool of worker processes, and rule modules send their
+ out-of-dictionary words to it through a pooled client. If the service is absent, predict() returns None and rule
+ modules fall back to their in-process model. After a connection or protocol failure the service is not tried again
+ for RETRY_INTERVAL, while an error answered for some words only sends those words to the in-process model.
+
+Protocol: one JSON object per line on a persistent connection.
+ request:  {"lang_code": "en", "words": ["Zork", ...]}
+ response: {"results": ["Z AO1 R K", ...]} or {"error": "..."}
+
+Start it from "src/":
+
+> python cli.py phoneme_service --workers 2
+
+The socket path is "$PPAT_PHONEME_SOCKET", default "ppat-phoneme.sock" in "$XDG_RUNTIME_DIR" or else in a directory
+ "<tmp dir>/ppat-<uid>" private to the user. Any process able to open the socket could send its own phonetics to the
+ web workers, so the default directory is used only if it is owned by the user and closed to others.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import stat
+import socket
+import tempfile
+import importlib
+import threading
+import socketserver
+import multiprocessing
+
+SOCKET_ENV = 'PPAT_PHONEME_SOCKET'
+SOCKET_NAME = 'ppat-phoneme.sock'
+RETRY_INTERVAL = 30  # Seconds before trying to reach an unavailable service again
+TIMEOUT = 60  # Seconds to wait for a response
+
+
+class PhonemeServiceError(Exception):
+    """
+    The service answered with an error
+    """
+
+
+def default_socket_path():
+    """
+    :return: path of the socket in the user's runtime directory
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if not runtime_dir:
+        runtime_dir = os.path.join(tempfile.gettempdir(), 'ppat-{}'.format(os.getuid() if hasattr(os, 'getuid') else 0))
+    return os.path.join(runtime_dir, SOCKET_NAME)
+
+
+def socket_path():
+    """
+    :return: path of the service's Unix socket
+    """
+    return os.environ.get(SOCKET_ENV) or default_socket_path()
+
+
+def is_private_dir(directory):
+    """
+    :param directory:
+    :return: True if directory is a real directory owned by the user that nobody else can access
+    """
+    try:
+        st = os.lstat(directory)
+    except OSError:
+        return False
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def _trusted(path):
+    """
+    :param path: path of the socket
+    :return: False for the default path in a directory others can access, which anybody may have created
+    """
+    return path != default_socket_path() or is_private_dir(os.path.dirname(path))
+
+
+def _rule_module(lang_code):
+    return importlib.import_module('translators.data.rule.{}'.format(lang_code))
+
+
+# ---------------------------------------------------------------- server
+
+
+def _init_worker(lang_codes):
+    """
+    Load prediction models once per worker process
+    :param lang_codes:
+    """
+    for lang_code in lang_codes:
+        module = _rule_module(lang_code)
+        if hasattr(module, 'warm_up_local'):
+            module.warm_up_local()
+
+
+def _predict_local(lang_code, words):
+    """
+    Run in a worker process
+    :param lang_code:
+    :param words:
+    :return: list of results of the rule module's predict_many_local()
+    """
+    return _rule_module(lang_code).predict_many_local(words)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf8'))
+                results = self.server.pool.apply(_predict_local, (request['lang_code'], list(request['words'])))
+                response = {'results': results}
+            except Exception as e:
+                response = {'error': '{}: {}'.format(type(e).__name__, str(e))}
+            self.wfile.write((json.dumps(response) + '\n').encode('utf8'))
+
+
+class PhonemeServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Each connection is served by a thread, predictions are run by the worker pool
+    """
+    daemon_threads = True
+
+    def __init__(self, path, pool):
+        self.pool = pool
+        socketserver.UnixStreamServer.__init__(self, path, _RequestHandler)
+
+
+def serve(path, workers, lang_codes):
+    """
+    Run the service until interrupted
+    :param path: path of the Unix socket, its directory is created private to the user if missing
+    :param workers: number of worker processes owning a model each
+    :param lang_codes: rule modules to warm up in every worker
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory, mode=0o700)
+    if not _trusted(path):
+        raise PermissionError('"{}" should be a directory owned by the user and closed to others.'.format(directory))
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            raise FileExistsError('"{}" exists and is not a socket, not removed.'.format(path))
+        os.remove(path)  # Left by a former service
+    with multiprocessing.Pool(workers, _init_worker, (lang_codes,)) as pool:
+        server = PhonemeServer(path, pool)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # Remove the socket when terminated
+        print('Phoneme service listening on "{}" with {} workers.'.format(path, workers))
+        try:
+            server.serve_forever()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            server.server_close()
+            os.remove(path)
+
+
+# ---------------------------------------------------------------- client
+
+
+class PhonemeClient:
+    """
+    Client keeping a pool of persistent connections to the service. Safe to use from many threads.
+    """
+
+    def __init__(self, path, pool_size=4, timeout=TIMEOUT):
+        self.path = path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._pid = os.getpid()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock, sock.makefile('rb')
+
+    def _acquire(self):
+        if self._pid != os.getpid():  # Connections opened before a fork belong to the parent process
+            self._idle = queue.LifoQueue()
+            self._pid = os.getpid()
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def _release(self, conn):
+        if self._idle.qsize() < self.pool_size:
+            self._idle.put(conn)
+        else:
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        conn[1].close()
+        conn[0].close()
+
+    def predict(self, lang_code, words):
+        """
+        :param lang_code:
+        :param words: list of str
+        :return: list of results in the order of words
+        """
+        request = (json.dumps({'lang_code': lang_code, 'words': words}) + '\n').encode('utf8')
+        while True:
+            conn, reused = self._acquire()
+            try:
+                conn[0].sendall(request)
+                line = conn[1].readline()
+                if not line:
+                    raise ConnectionError('Connection closed by the phoneme service')
+                response = json.loads(line.decode('utf8'))
+            except socket.timeout:  # The service is alive but busy or stuck, another full timeout would not help
+                self._close(conn)
+                raise
+            except OSError:
+                self._close(conn)
+                if reused:  # The service may have been restarted, retry with a new connection
+                    continue
+                raise
+            except ValueError:  # Not a response of the protocol, the connection cannot be reused
+                self._close(conn)
+                raise
+            self._release(conn)
+            break
+        if 'error' in response:
+            raise PhonemeServiceError(response['error'])
+        return response['results']
+
+    def close(self):
+        while not self._idle.empty():
+            self._close(self._idle.get_nowait())
+
+
+_client = None
+_client_lock = threading.Lock()
+_unavailable_until = 0
+
+
+def available():
+    """
+    :return: True if the service's socket exists in a trusted directory and it has not failed recently
+    """
+    path = socket_path()
+    return hasattr(socket, 'AF_UNIX') and time.time() >= _unavailable_until and os.path.exists(path) \
+        and _trusted(path)
+
+
+def predict(lang_code, words):
+    """
+    Predict phonetics of words by the service
+    :param lang_code:
+    :param words: list of str
+    :return: list of results in the order of words, None if the service is not available or failed on words
+    """
+    global _client, _unavailable_until
+    if not available():
+        return None
+    with _client_lock:
+        if _client is None or _client.path != socket_path():
+            _client = PhonemeClient(socket_path())
+        client = _client
+    try:
+        return client.predict(lang_code, words)
+    except PhonemeServiceError as e:  # The service works but failed on these words
+        print('Phoneme service failed ({}), predict in process.'.format(str(e)))
+        return None
+    except (OSError, ValueError) as e:  # Connection or protocol failures
+        print('Phoneme service unavailable ({}), predict in process for {} s.'.format(str(e), RETRY_INTERVAL))
+        _unavailable_until = time.time() + RETRY_INTERVAL
+        return None
@@ -0,0 +1,56 @@
+"""
+Hot reload of rule and index files.
+
+Reloader.reload() reloads what changed in "data/rule/" and "data/index/" (see RuleTranslator.reload() and
+ IndexTranslator.reload()). It is called by the "/api/admin/reload" endpoint, or every few seconds by a watcher
+ thread started with start() when "$PPAT_RELOAD_INTERVAL" is set for the web app.
+
+Each process watches its own files, so with several web workers use the watcher: an admin request only reaches
+ one of them.
+"""
+import time
+import threading
+
+RELOAD_INTERVAL_ENV = 'PPAT_RELOAD_INTERVAL'
+
+
+class Reloader:
+    def __init__(self, rule_translator, index_translator):
+        self.rule_translator = rule_translator
+        self.index_translator = index_translator
+        self._lock = threading.Lock()  # One reload at a time, from the watcher or the admin endpoint
+        self._thread = None
+
+    def reload(self):
+        """
+        :return: {'rule': <report of RuleTranslator.reload()>, 'index': <report of IndexTranslator.reload()>,
+                  'seconds': float}
+        """
+        with self._lock:
+            t_start = time.perf_counter()
+            report = {'rule': self.rule_translator.reload(), 'index': self.index_translator.reload()}
+            report['seconds'] = time.perf_counter() - t_start
+        changed = report['rule']['reloaded'] + report['rule']['removed'] + report['index']['reloaded']
+        errors = dict(report['rule']['errors'], **report['index']['errors'])
+        if changed or errors:
+            print('Reloaded [{}] in {:.3f} s{}'.format(', '.join(changed), report['seconds'],
+                                                      ', errors: {}'.format(errors) if errors else ''))
+        return report
+
+    def start(self, interval):
+        """
+        Watch the files in a daemon thread
+        :param interval: seconds between two checks
+        :return: the thread
+        """
+        def _watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception as e:  # Keep watching
+                    print('Reload failed: {}: {}'.format(type(e).__name__, str(e)))
+
+        self._thread = threading.Thread(target=_watch, name='reloader', daemon=True)
+        self._thread.start()
+        return self._thread
@@ -0,0 +1,245 @@
+"""
+Reverse index from Chinese transliterations to the names of a name index, queried through mmap.
+
+"chinese" fields of the dictionary are split into variants: alternates separated by ";" with their parenthesised
+ notes removed, e.g. "亚历克斯;亚历克丝(女名)" gives "亚历克斯" and "亚历克丝". "people.rev" and "places.rev" are built
+ from "people.idx" and "places.idx" (see index_store.py) and refer to their entries by position:
+
+ +--------+--------------+----------+-------------------------+---------------------+--------------+
+ | header | grams (g)    | refs (r) | variant offsets (n + 1) | ref offsets (n + 1) | variant blob |
+ +--------+--------------+----------+-------------------------+---------------------+--------------+
+
+Variants are UTF-8 encoded and sorted by bytes, so an exact variant is found by a binary search. The refs of a
+ variant are "<position of the name in the name index> << 32 | <number of the entry of the name>".
+
+The gram table serves substring search: every character and every pair of adjacent characters of a variant is
+ stored as "<gram> << 22 | <position of the variant>" in a sorted array, a character being its code point and a
+ pair "<first code point> << 21 | <second code point>". Variants containing a query have all its grams, so
+ candidates are the intersection of a few ranges of the table and only they are verified.
+"""
+import os
+import re
+import sys
+import mmap
+import bisect
+import struct
+from array import array
+
+from translators import index_store
+
+MAGIC = b'PPATRV1' + (b'L' if sys.byteorder == 'little' else b'B')  # Offsets are in native byte order
+# magic, source sha1 of the name index, number of variants, number of refs, number of grams. 8 bytes aligned.
+HEADER = struct.Struct('<8s20sIQQ')
+VARIANT_BITS = 22  # Max number of variants is 2 ** VARIANT_BITS
+
+re_variant_sep = re.compile(r'[;；]')
+re_note = re.compile(r'\([^()]*\)|（[^（）]*）')
+
+
+def reverse_path(idx_path):
+    """
+    :param idx_path: e.g. './translators/data/index/people.idx'
+    :return: e.g. './translators/data/index/people.rev'
+    """
+    return os.path.splitext(idx_path)[0] + '.rev'
+
+
+def variants(chinese):
+    """
+    :param chinese: e.g. '亚历克斯;亚历克丝(女名)(教名Alexander、Alexandrina的昵称)'
+    :return: list of distinct variants in order, e.g. ['亚历克斯', '亚历克丝']
+    """
+    l_variants = []
+    for s_variant in re_variant_sep.split(chinese):
+        s_stripped = re_note.sub('', s_variant)
+        while s_stripped != s_variant:  # Nested notes
+            s_variant, s_stripped = s_stripped, re_note.sub('', s_stripped)
+        s_variant = s_variant.strip()
+        if s_variant and s_variant not in l_variants:
+            l_variants.append(s_variant)
+    return l_variants
+
+
+def grams(text):
+    """
+    Grams looked up for a query: its pairs of characters, or its character if it has only one
+    :param text:
+    :return: set of grams, see the gram table above
+    """
+    if len(text) == 1:
+        return {ord(text) << 21}
+    return {ord(a) << 21 | ord(b) for a, b in zip(text, text[1:])}
+
+
+def indexed_grams(s_variant):
+    """
+    Grams stored for a variant: its characters and pairs of characters
+    :param s_variant:
+    :return: set of grams
+    """
+    return {ord(c) << 21 for c in s_variant} | grams(s_variant)
+
+
+def _source_sha1(idx_path):
+    with open(idx_path, 'rb') as f:
+        return index_store.HEADER.unpack(f.read(index_store.HEADER.size))[3]
+
+
+def is_fresh(idx_path, rev_path):
+    """
+    Check whether rev_path was built from the current name index at idx_path
+    :param idx_path:
+    :param rev_path:
+    :return: True if fresh, else False
+    """
+    try:
+        with open(rev_path, 'rb') as f:
+            magic, sha1, _, _, _ = HEADER.unpack(f.read(HEADER.size))
+        return magic == MAGIC and sha1 == _source_sha1(idx_path)
+    except (OSError, struct.error):
+        return False
+
+
+def build(idx_path, rev_path):
+    """
+    Build the reverse index of a name index
+    :param idx_path:
+    :param rev_path:
+    :return: number of variants in the reverse index
+    """
+    index = index_store.NameIndex(idx_path)
+    try:
+        d_refs = {}  # <variant>: [<ref>, ...]
+        for i in range(len(index)):
+            for j, (_, chinese) in enumerate(index.entries(i)):
+                for s_variant in variants(chinese):
+                    d_refs.setdefault(s_variant, []).append(i << 32 | j)
+    finally:
+        index.close()
+    keys = sorted(d_refs.keys(), key=lambda k: k.encode('utf8'))
+    assert len(keys) < 1 << VARIANT_BITS, 'Too many variants in {}'.format(idx_path)
+
+    variant_offsets = array('I', [0])
+    ref_offsets = array('I', [0])
+    refs = array('Q')
+    l_grams = []
+    blob = bytearray()
+    for k_index, k in enumerate(keys):
+        blob += k.encode('utf8')
+        variant_offsets.append(len(blob))
+        refs.extend(d_refs[k])
+        ref_offsets.append(len(refs))
+        for gram in indexed_grams(k):
+            l_grams.append(gram << VARIANT_BITS | k_index)
+    l_grams.sort()
+    gram_table = array('Q', l_grams)
+    assert gram_table.itemsize == 8 and variant_offsets.itemsize == 4
+
+    tmp_path = '{}.{}.tmp'.format(rev_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, _source_sha1(idx_path), len(keys), len(refs), len(gram_table)))
+        f.write(gram_table.tobytes())
+        f.write(refs.tobytes())
+        f.write(variant_offsets.tobytes())
+        f.write(ref_offsets.tobytes())
+        f.write(blob)
+    os.replace(tmp_path, rev_path)  # Processes still reading the old index keep their own mapping
+    return len(keys)
+
+
+class ReverseIndex:
+    """
+    Read-only view of a reverse index file
+    """
+
+    def __init__(self, rev_path):
+        with open(rev_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, n, r, g = HEADER.unpack_from(self._mm, 0)
+        assert magic == MAGIC, 'Invalid reverse index file: {}'.format(rev_path)
+        self.n = n
+        view = memoryview(self._mm)
+        start = HEADER.size
+        self._grams = view[start: start + 8 * g].cast('Q')
+        start += 8 * g
+        self._refs = view[start: start + 8 * r].cast('Q')
+        start += 8 * r
+        self._variant_offsets = view[start: start + 4 * (n + 1)].cast('I')
+        start += 4 * (n + 1)
+        self._ref_offsets = view[start: start + 4 * (n + 1)].cast('I')
+        start += 4 * (n + 1)
+        self._variant_base = start
+
+    def __len__(self):
+        return self.n
+
+    def variant(self, k):
+        """
+        :param k: position of a variant
+        :return: the variant
+        """
+        return self._mm[self._variant_base + self._variant_offsets[k]:
+                        self._variant_base + self._variant_offsets[k + 1]].decode('utf8')
+
+    def refs(self, k):
+        """
+        :param k: position of a variant
+        :return: [(<position of the name in the name index>, <number of the entry of the name>), ...]
+        """
+        return [(ref >> 32, ref & 0xffffffff) for ref in self._refs[self._ref_offsets[k]: self._ref_offsets[k + 1]]]
+
+    def find(self, s_variant):
+        """
+        :param s_variant: a variant
+        :return: its position, None if it is not in the index
+        """
+        b_variant = s_variant.encode('utf8')
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._mm[self._variant_base + self._variant_offsets[mid]:
+                        self._variant_base + self._variant_offsets[mid + 1]] < b_variant:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n and self.variant(lo) == s_variant:
+            return lo
+        return None
+
+    def _gram_range(self, gram):
+        """
+        :return: (start, end) of the gram in the gram table
+        """
+        start = bisect.bisect_left(self._grams, gram << VARIANT_BITS)
+        return start, bisect.bisect_left(self._grams, (gram + 1) << VARIANT_BITS, start)
+
+    def containing(self, text):
+        """
+        Variants containing text, verified lazily so that a caller needing a few of them stops early
+        :param text: non-empty
+        :return: generator of positions of variants, in the order of the index
+        """
+        mask = (1 << VARIANT_BITS) - 1
+        ranges = sorted((self._gram_range(gram) for gram in grams(text)), key=lambda t: t[1] - t[0])
+        start, end = ranges[0]  # Intersect from the rarest gram
+        if len(ranges) == 1:  # Positions of a single gram are already sorted, stream them
+            for j in range(start, end):
+                k = self._grams[j] & mask
+                if len(text) == 1 or text in self.variant(k):
+                    yield k
+            return
+        candidates = {v & mask for v in self._grams[start: end]}
+        for start, end in ranges[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(v & mask for v in self._grams[start: end])
+        for k in sorted(candidates):
+            if len(text) == 1 or text in self.variant(k):
+                yield k
+
+    def close(self):
+        self._grams.release()
+        self._refs.release()
+        self._variant_offsets.release()
+        self._ref_offsets.release()
+        self._mm.close()
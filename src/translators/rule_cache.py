@@ -0,0 +1,142 @@
+"""
+Precompiled cache of parsed "*.rule" files.
+
+A parsed rule (sections, pattern tuples, tries, transliteration table and the resolved ".to_phonetics"/".post"
+ functions) is pickled into a "<lang_code>.rulec" file next to its source. The cache is valid as long as the
+ "<lang_code>.rule" and "<lang_code>.py" files it was built from are unchanged: mtime is checked first and the
+ content hash decides when mtime differs.
+"""
+import os
+import pickle
+import hashlib
+import importlib
+
+CACHE_VERSION = 3  # Bump it when the structure of a parsed rule changes
+CACHE_EXT = '.rulec'
+
+
+def _sources(rule_path):
+    """
+    Source files a parsed rule depends on: the ".rule" file and the optional "<lang_code>.py"
+    :param rule_path: e.g. './translators/data/rule/en.rule'
+    :return: list of paths
+    """
+    l_sources = [rule_path]
+    py_path = os.path.splitext(rule_path)[0] + '.py'
+    if os.path.exists(py_path):
+        l_sources.append(py_path)
+    return l_sources
+
+
+def _digest(path):
+    """
+    SHA1 of the content of a file
+    :param path:
+    :return: str
+    """
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def source_digest(rule_path):
+    """
+    SHA1 of all the sources a parsed rule depends on, which identifies the version of its results
+    :param rule_path:
+    :return: bytes
+    """
+    sha1 = hashlib.sha1()
+    for path in _sources(rule_path):
+        with open(path, 'rb') as f:
+            sha1.update(hashlib.sha1(f.read()).digest())
+    return sha1.digest()
+
+
+def results_digest(rule_path):
+    """
+    SHA1 identifying the results of a rule: source_digest() and the data_version() of its "<lang_code>.py" module
+     if the module defines one, for data it loads which change results (e.g. a phonetic dictionary or a model)
+    :param rule_path:
+    :return: bytes
+    """
+    sha1 = hashlib.sha1(source_digest(rule_path))
+    if len(_sources(rule_path)) > 1:
+        lang_code = os.path.splitext(os.path.basename(rule_path))[0]
+        module = importlib.import_module('translators.data.rule.{}'.format(lang_code))
+        if hasattr(module, 'data_version'):
+            sha1.update(module.data_version().encode('utf8'))
+    return sha1.digest()
+
+
+def _fingerprint(rule_path):
+    """
+    :param rule_path:
+    :return: {<file name>: (<mtime_ns>, <sha1>), ...}
+    """
+    d_fingerprint = {}
+    for path in _sources(rule_path):
+        d_fingerprint[os.path.basename(path)] = (os.stat(path).st_mtime_ns, _digest(path))
+    return d_fingerprint
+
+
+def cache_path(rule_path):
+    """
+    :param rule_path: e.g. './translators/data/rule/en.rule'
+    :return: e.g. './translators/data/rule/en.rulec'
+    """
+    return os.path.splitext(rule_path)[0] + CACHE_EXT
+
+
+def is_valid(rule_path, d_fingerprint):
+    """
+    Check whether a stored fingerprint still matches the sources of rule_path
+    :param rule_path:
+    :param d_fingerprint: {<file name>: (<mtime_ns>, <sha1>), ...}
+    :return: True if valid, else False
+    """
+    l_sources = _sources(rule_path)
+    if len(l_sources) != len(d_fingerprint):  # "<lang_code>.py" was added or removed
+        return False
+    for path in l_sources:
+        stored = d_fingerprint.get(os.path.basename(path))
+        if stored is None:
+            return False
+        if os.stat(path).st_mtime_ns != stored[0] and _digest(path) != stored[1]:
+            return False
+    return True
+
+
+def load(rule_path):
+    """
+    Load a parsed rule from its cache file in a single read.
+    :param rule_path: path of the ".rule" file
+    :return: the parsed rule dict, None if there is no valid cache
+    """
+    try:
+        with open(cache_path(rule_path), 'rb') as f:
+            version, d_fingerprint, rule = pickle.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:  # Broken cache files are rebuilt from the sources
+        print('(invalid cache: {}) '.format(str(e)), end='')
+        return None
+    if version != CACHE_VERSION or not is_valid(rule_path, d_fingerprint):
+        return None
+    return rule
+
+
+def dump(rule_path, rule):
+    """
+    Store a parsed rule next to its source. Failing to write the cache is not fatal.
+    :param rule_path: path of the ".rule" file
+    :param rule: the parsed rule dict
+    """
+    path = cache_path(rule_path)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(pickle.dumps((CACHE_VERSION, _fingerprint(rule_path), rule), pickle.HIGHEST_PROTOCOL))
+        os.replace(tmp_path, path)  # Workers starting at the same time never read a half written file
+    except Exception as e:
+        print('(cache not written: {}) '.format(str(e)), end='')
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,150 @@
+"""
+Precomputed transliterations of a rule, queried through mmap.
+
+Words known by a rule have deterministic results, so "python cli.py build_tables" runs the words of the rule
+ module's vocabulary (e.g. the phonetic dictionary of "en.py") and the names of the indexes through the rule once
+ and stores the results in "<lang_code>.table" next to "<lang_code>.rule":
+
+ +--------+---------------------+-----------------------+----------+------------+
+ | header | key offsets (n + 1) | value offsets (n + 1) | key blob | value blob |
+ +--------+---------------------+-----------------------+----------+------------+
+
+Keys are capitalized keywords, UTF-8 encoded and sorted by bytes. A value is "<people>\\x1f<places>", the Chinese
+ of both categories after the ".post" functions. Offsets are native unsigned 32-bit integers.
+
+A table is only used while the SHA1 of the ".rule" and ".py" files and of the data of the rule module (e.g. the
+ phonetic dictionary and the prediction model, see rule_cache.results_digest()) it was built from matches the current
+ ones, a stale table is ignored until it is rebuilt.
+"""
+import os
+import sys
+import mmap
+import struct
+from array import array
+
+from translators import rule_cache
+
+MAGIC = b'PPATTB1' + (b'L' if sys.byteorder == 'little' else b'B')  # Offsets are in native byte order
+HEADER = struct.Struct('<8s20sI')  # magic, SHA1 of the sources and data, number of keys
+FIELD_SEP = '\x1f'
+TABLE_EXT = '.table'
+
+
+def table_path(rule_path):
+    """
+    :param rule_path: e.g. './translators/data/rule/en.rule'
+    :return: e.g. './translators/data/rule/en.table'
+    """
+    return os.path.splitext(rule_path)[0] + TABLE_EXT
+
+
+def is_fresh(rule_path, path):
+    """
+    Check whether the table at path was built from the current sources of rule_path
+    :param rule_path:
+    :param path:
+    :return: True if fresh, else False
+    """
+    try:
+        with open(path, 'rb') as f:
+            magic, digest, _ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return False
+    return magic == MAGIC and digest == rule_cache.results_digest(rule_path)
+
+
+def build(rule_path, path, items):
+    """
+    Write a table
+    :param rule_path: the ".rule" file the results come from
+    :param path: the table file
+    :param items: iterable of (<capitalized keyword>, <people chinese>, <places chinese>)
+    :return: number of keywords in the table
+    """
+    d_values = {}
+    for keyword, people, places in items:
+        d_values[keyword] = people + FIELD_SEP + places
+    keys = sorted(d_values.keys(), key=lambda k: k.encode('utf8'))
+
+    key_offsets = array('I', [0])
+    value_offsets = array('I', [0])
+    assert key_offsets.itemsize == 4
+    key_blob = bytearray()
+    value_blob = bytearray()
+    for k in keys:
+        key_blob += k.encode('utf8')
+        key_offsets.append(len(key_blob))
+        value_blob += d_values[k].encode('utf8')
+        value_offsets.append(len(value_blob))
+
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, rule_cache.results_digest(rule_path), len(keys)))
+        f.write(key_offsets.tobytes())
+        f.write(value_offsets.tobytes())
+        f.write(key_blob)
+        f.write(value_blob)
+    os.replace(tmp_path, path)  # Processes still reading the old table keep their own mapping
+    return len(keys)
+
+
+def open_fresh(rule_path):
+    """
+    :param rule_path:
+    :return: RuleTable of rule_path if its table is fresh, else None
+    """
+    path = table_path(rule_path)
+    if not is_fresh(rule_path, path):
+        return None
+    return RuleTable(path)
+
+
+class RuleTable:
+    """
+    Read-only view of a table file
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, n = HEADER.unpack_from(self._mm, 0)
+        assert magic == MAGIC, 'Invalid table file: {}'.format(path)
+        self.n = n
+        view = memoryview(self._mm)
+        start = HEADER.size
+        self._key_offsets = view[start: start + 4 * (n + 1)].cast('I')
+        start += 4 * (n + 1)
+        self._value_offsets = view[start: start + 4 * (n + 1)].cast('I')
+        start += 4 * (n + 1)
+        self._key_base = start
+        self._value_base = start + self._key_offsets[n]
+
+    def __len__(self):
+        return self.n
+
+    def _key(self, i):
+        return self._mm[self._key_base + self._key_offsets[i]: self._key_base + self._key_offsets[i + 1]]
+
+    def get(self, keyword):
+        """
+        :param keyword: capitalized keyword
+        :return: (<people chinese>, <places chinese>), None if keyword is not in the table
+        """
+        b_key = keyword.encode('utf8')
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < b_key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.n or self._key(lo) != b_key:
+            return None
+        value = self._mm[self._value_base + self._value_offsets[lo]:
+                         self._value_base + self._value_offsets[lo + 1]].decode('utf8')
+        return tuple(value.split(FIELD_SEP, 1))
+
+    def close(self):
+        self._key_offsets.release()
+        self._value_offsets.release()
+        self._mm.close()
@@ -1,7 +1,44 @@
 import os
+import sys
 import json
 import re
+import time
+import hashlib
 import importlib
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from translators import rule_cache, rule_table, index_store, reverse_index, metrics, memory
+from translators.cache import LRUCache, DEFAULT_PHONETICS_CACHE_SIZE, DEFAULT_RESULTS_CACHE_SIZE
+
+WORKERS_ENV = 'PPAT_RULE_WORKERS'
+PARALLEL_MIN_KEYWORDS = 32  # Smaller batches of translate_many() are not worth handing to the worker pool
+
+
+class Transliteration:
+    """
+    Compact record of a dictionary transliteration. The keyword, category and language strings are shared by all
+     records of a name, category or culture, only results being serialized are turned into dicts.
+    """
+    __slots__ = ('keyword', 'category', 'language', 'chinese')
+
+    def __init__(self, keyword, category, language, chinese):
+        self.keyword = keyword
+        self.category = category
+        self.language = language
+        self.chinese = chinese
+
+    def to_dict(self):
+        """
+        :return: {'keyword': str, 'category': str, 'language': str, 'chinese': str}
+        """
+        return {
+            'keyword': self.keyword,
+            'category': self.category,
+            'language': self.language,
+            'chinese': self.chinese,
+        }
 
 
 class IndexTranslator:
@@ -9,42 +46,112 @@ class IndexTranslator:
     Transliterating by dictionary
     """
 
-    def __init__(self):
+    def __init__(self, results_cache_size=DEFAULT_RESULTS_CACHE_SIZE):
+        """
+        :param results_cache_size: max number of lookup() results kept in the LRU cache, 0 to disable it
+        """
+        self.results_cache = LRUCache(results_cache_size)
         print('==========================================')
         print('Initializing index translator...')
-        with open(os.path.join('.', 'translators', 'data', 'index', 'people.json'), 'r', encoding='utf8') as people_json:
-            with open(os.path.join('.', 'translators', 'data', 'index', 'places.json'), 'r', encoding='utf8') as place_json:
-                try:
-                    print('Loading file "data/index/places.json" ... ', end='')
-                    people_data = json.loads(people_json.read())
-                    print('OK.')
-                    print('Loading file "data/index/people.json" ... ', end='')
-                    place_data = json.loads(place_json.read())
-                    print('OK.')
-                except json.JSONDecodeError as e:
-                    print(str(e))
-                    exit(1)
-                else:
-                    self.people_index = {}
-                    self.places_index = {}
-
-                    # build indexes
-                    print('Indexing people names data ... ', end='')
-                    for m in people_data:
-                        if self.people_index.__contains__(m['name']):
-                            self.people_index[m['name']].append(m)
-                        else:
-                            self.people_index[m['name']] = [m]
-                    print('OK.')
-                    print('Indexing places names data ... ', end='')
-                    for n in place_data:
-                        if self.places_index.__contains__(n['name']):
-                            self.places_index[n['name']].append(n)
-                        else:
-                            self.places_index[n['name']] = [n]
-                    print('OK.')
-                    print('Index Translator initialized successfully!')
-                    print('==========================================')
+        # (<category>, NameIndex, ReverseIndex) replaced as a whole by reload(), so a search never mixes two
+        #  versions of the indexes
+        self.indexes = tuple((category.capitalize(),) + self._open_index(category) for category in ('people', 'places'))
+        self.version = self._content_version(self.indexes)
+        self.versions = {category: self._index_version(category) for category in ('people', 'places')}
+        print('Index Translator initialized successfully!')
+        print('==========================================')
+
+    @property
+    def people_index(self):
+        return self.indexes[0][1]
+
+    @property
+    def places_index(self):
+        return self.indexes[1][1]
+
+    @staticmethod
+    def _content_version(indexes):
+        """
+        :param indexes: self.indexes
+        :return: hex digest identifying the content of the indexes, it changes when a JSON file changes
+        """
+        sha1 = hashlib.sha1()
+        for _, index, _ in indexes:
+            sha1.update(index.source_sha1)
+        return sha1.hexdigest()
+
+    @staticmethod
+    def _index_version(category):
+        """
+        :param category: 'people' | 'places'
+        :return: (mtime_ns, size) of "<category>.json", "<category>.idx" and "<category>.rev", None for a missing file
+        """
+        json_path = os.path.join('.', 'translators', 'data', 'index', category + '.json')
+        idx_path = index_store.index_path(json_path)
+        return tuple(_file_version(path) for path in (json_path, idx_path, reverse_index.reverse_path(idx_path)))
+
+    def reload(self):
+        """
+        Reopen the indexes whose JSON, ".idx" or ".rev" files changed (rebuilding stale ones first) and swap them in
+         at once. Searches running in other threads finish on the former indexes. An index failing to load is kept
+         in its former version.
+        :return: {'reloaded': [<category>, ...], 'errors': {<category>: <message>}, 'seconds': float}
+        """
+        t_start = time.perf_counter()
+        report = {'reloaded': [], 'errors': {}}
+        indexes = list(self.indexes)
+        versions = dict(self.versions)
+        for i, category in enumerate(('people', 'places')):
+            version = self._index_version(category)
+            if version == versions[category]:
+                continue
+            try:
+                indexes[i] = (indexes[i][0],) + self._open_index(category)
+            except (SystemExit, Exception) as e:  # _open_index() exits on invalid files
+                report['errors'][category] = _error_message(e)
+                continue
+            versions[category] = self._index_version(category)  # The ".idx" and ".rev" may have been rebuilt
+            report['reloaded'].append(category)
+        if report['reloaded']:
+            self.indexes = tuple(indexes)
+            self.version = self._content_version(self.indexes)  # After the indexes, read before them
+            self.versions = versions
+            self.results_cache = self.results_cache.empty_copy()  # After the swap, see lookup()
+        report['seconds'] = time.perf_counter() - t_start
+        metrics.observe('reload_index', report['seconds'])
+        return report
+
+    @staticmethod
+    def _open_index(category):
+        """
+        Open "data/index/<category>.idx" and its reverse index "<category>.rev", (re)build them first if
+         "<category>.json" is newer.
+        :param category: 'people' | 'places'
+        :return: (NameIndex, ReverseIndex)
+        """
+        json_path = os.path.join('.', 'translators', 'data', 'index', category + '.json')
+        idx_path = index_store.index_path(json_path)
+        if os.path.exists(json_path) and not index_store.is_fresh(json_path, idx_path):
+            print('Building index "data/index/{}.idx" from "data/index/{}.json" ... '.format(category, category),
+                  end='')
+            try:
+                index_store.build(json_path, idx_path)
+            except json.JSONDecodeError as e:
+                print(str(e))
+                exit(1)
+            print('OK.')
+        if not os.path.exists(idx_path):
+            print('No such file: "data/index/{}.json" or "data/index/{}.idx"'.format(category, category))
+            exit(1)
+        print('Loading index "data/index/{}.idx" ... '.format(category), end='')
+        index = index_store.NameIndex(idx_path)
+        print('OK. {} names.'.format(len(index)))
+        rev_path = reverse_index.reverse_path(idx_path)
+        if not reverse_index.is_fresh(idx_path, rev_path):
+            print('Building reverse index "data/index/{}.rev" ... '.format(category), end='')
+            reverse_index.build(idx_path, rev_path)
+            print('OK.')
+        return index, reverse_index.ReverseIndex(rev_path)
 
     def search(self, keyword):
         """
@@ -52,35 +159,171 @@ class IndexTranslator:
         Must be a name of a place or a person.
         Spaces are not permitted.
         
-        return: [<dict>...]
+        return: {'transliterations': [<dict>...]} built from the records of lookup(), callers may modify it.
+        """
+        return {'transliterations': [t.to_dict() for t in self.lookup(keyword)]}
+
+    def lookup(self, keyword):
+        """
+        Like search() without building dicts.
+        param: keyword
+        Must be a name of a place or a person.
+        Spaces are not permitted.
+
+        return: (Transliteration, ...) The result is cached and must not be modified.
         """
         assert isinstance(keyword, str) and ' ' not in keyword
 
+        t_start = time.perf_counter()
         keyword = keyword.capitalize()
+        # The cache is read before the indexes: a result of former indexes never gets into a reloaded cache
+        results_cache = self.results_cache
+        indexes = self.indexes
+        results = results_cache.get(keyword)
+        if results is not None:
+            metrics.observe('search', time.perf_counter() - t_start)
+            return results
+        l_results = []
+        for category, index, _ in indexes:
+            t_index = time.perf_counter()
+            entries = index.get(keyword, ())
+            metrics.observe('index_search', time.perf_counter() - t_index, category=category.lower())
+            for culture, chinese in entries:
+                l_results.append(Transliteration(keyword, category, culture, chinese))
+
+        results = tuple(l_results)
+        results_cache.put(keyword, results)
+        metrics.observe('search', time.perf_counter() - t_start)
+        return results
+
+    def suggest(self, keyword, max_edits=1, limit=10, prefix=False):
+        """
+        Approximate search for spelling variants or the start of a name.
+        param: keyword
+        Spaces are not permitted, up to index_store.MAX_KEYWORD_LENGTH characters.
+        param: max_edits
+        Max Levenshtein distance (case insensitive) between keyword and names, up to index_store.MAX_EDITS.
+        param: limit
+        Max number of names in results.
+        param: prefix
+        If True, find names starting with keyword instead (autocomplete, case insensitive), max_edits is ignored.
+
+        return: {'transliterations': [<dict>...]} like search() with the "distance" of each name,
+         sorted by distance and name (case insensitive).
+        """
+        assert isinstance(keyword, str) and ' ' not in keyword
+        assert len(keyword) <= index_store.MAX_KEYWORD_LENGTH, \
+            'keyword should be at most {} characters'.format(index_store.MAX_KEYWORD_LENGTH)
+        assert isinstance(limit, int) and limit > 0
+
+        matches = []  # (<distance>, <name>, <category>, <index>, <position in the index>)
+        for category, index, _ in self.indexes:
+            if prefix:
+                for i in index.prefix(keyword, limit):
+                    matches.append((0, index.key(i).decode('utf8'), category, index, i))
+            else:
+                for distance, name, i in index.fuzzy(keyword, max_edits):
+                    matches.append((distance, name, category, index, i))
+        matches.sort(key=lambda m: (m[0], m[1].lower(), m[1], m[2]))
+
         results = {'transliterations': []}
-        people_index_items = self.people_index.get(keyword, -1)
-        places_index_items = self.places_index.get(keyword, -1)
-        if people_index_items != -1:
-            for people_index_item in people_index_items:
-                result = {
-                    'keyword': keyword,
-                    'category': 'People',
-                    'language': people_index_item['culture'],
-                    'chinese': people_index_item['chinese'],
-                }
-                results['transliterations'].append(result)
-        if places_index_items != -1:
-            for places_index_item in places_index_items:
-                result = {
-                    'keyword': keyword,
-                    'category': 'Places',
-                    'language': places_index_item['culture'],
-                    'chinese': places_index_item['chinese'],
-                }
-                results['transliterations'].append(result)
+        l_names = []
+        for distance, name, category, index, i in matches:
+            if name not in l_names:
+                if len(l_names) == limit:
+                    break
+                l_names.append(name)
+            for culture, chinese in index.entries(i):
+                results['transliterations'].append({
+                    'keyword': name,
+                    'category': category,
+                    'language': culture,
+                    'chinese': chinese,
+                    'distance': distance,
+                })
+        return results
+
+    def reverse(self, chinese, substring=False, limit=20):
+        """
+        Names transliterated into a Chinese variant, see translators/reverse_index.py.
+        param: chinese
+        A variant, e.g. "亚历克斯", its parenthesised notes are ignored.
+        param: substring
+        If True, find variants containing chinese instead.
+        param: limit
+        Max number of entries in results.
+
+        return: {'transliterations': [<dict>...], 'truncated': bool} like search() with the matched "variant" of
+         each entry. Exact matches come first, then the other variants in the order of the reverse indexes.
+        """
+        assert isinstance(chinese, str)
+        assert isinstance(limit, int) and limit > 0
+        l_variants = reverse_index.variants(chinese)
+        assert len(l_variants) == 1, 'One Chinese variant expected.'
+        s_variant = l_variants[0]
+
+        t_start = time.perf_counter()
+        indexes = self.indexes
+        exact = [(category, index, rev_index, rev_index.find(s_variant)) for category, index, rev_index in indexes]
+
+        def iter_matches():
+            for category, index, rev_index, k in exact:
+                if k is not None:
+                    yield category, index, rev_index, k
+            if substring:
+                for category, index, rev_index, k_exact in exact:
+                    for k in rev_index.containing(s_variant):
+                        if k != k_exact:
+                            yield category, index, rev_index, k
 
+        results = {'transliterations': [], 'truncated': False}
+        for category, index, rev_index, k in iter_matches():
+            s_matched = rev_index.variant(k)
+            for i, j in rev_index.refs(k):
+                if len(results['transliterations']) == limit:
+                    results['truncated'] = True
+                    break
+                culture, s_chinese = index.entries(i)[j]
+                results['transliterations'].append({
+                    'keyword': index.key(i).decode('utf8'),
+                    'category': category,
+                    'language': culture,
+                    'chinese': s_chinese,
+                    'variant': s_matched,
+                })
+            if results['truncated']:
+                break
+        metrics.observe('reverse_search', time.perf_counter() - t_start)
         return results
 
+    def cache_stats(self):
+        """
+        :return: {'results': <stats of the results cache>}
+        """
+        return {'results': self.results_cache.stats()}
+
+
+def _file_version(path):
+    """
+    :param path:
+    :return: (mtime_ns, size) of the file, None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _error_message(e):
+    """
+    :param e: exception raised while loading a file, SystemExit if the loader exited after printing the reason
+    :return: str
+    """
+    if isinstance(e, SystemExit):
+        return 'Invalid file, see the log.'
+    return str(e) or type(e).__name__
+
 
 class NoRuleMatched(Exception):
     def __init__(self, section, l_phonetics=None):
@@ -92,26 +335,469 @@ class NoRuleMatched(Exception):
             NO RULE MATCHED IN "{}" section. CHECK YOUR RULE FILES'.format(str(self.l_phonetics), self.section)
 
 
+# Codes of the special phonetics of <pre> and <post>, phonemes are encoded from 1 and UNKNOWN_PHONEME is 0
+ANY_VOWEL = -1       # '@'
+ANY_CONSONANT = -2   # '&'
+WORD_START = -3      # '$'
+WORD_END = -4        # '^'
+SPECIAL_CODES = {'@': ANY_VOWEL, '&': ANY_CONSONANT, '$': WORD_START, '^': WORD_END}
+UNKNOWN_PHONEME = 0  # Phonemes unknown to the rule, they match nothing
+VOWEL = 1            # Bits of PhonemeInventory.classes
+CONSONANT = 2
+
+
+class PhonemeInventory:
+    """
+    Phonemes of a rule interned to small integers.
+
+    Phonemes of the ".phonetics" section and of the patterns are numbered from 1 when the rule is compiled, so
+     phonetics of a word are matched as an array('B') of codes and "any vowel/consonant" is tested on a bitmask
+     looked up by code.
+    """
+
+    def __init__(self, l_consonants, l_vowels, l_phonemes):
+        """
+        :param l_consonants: ".phonetics" consonants
+        :param l_vowels: ".phonetics" vowels
+        :param l_phonemes: other phonemes found in the patterns
+        """
+        self.codes = {}  # <phoneme>: <code>
+        self.phonemes = [None]  # phonemes indexed by code
+        for p in l_consonants + l_vowels + l_phonemes:
+            if p not in self.codes:
+                self.codes[p] = len(self.phonemes)
+                self.phonemes.append(p)
+        classes = bytearray(len(self.phonemes))
+        for p in l_vowels:
+            classes[self.codes[p]] |= VOWEL
+        for p in l_consonants:
+            classes[self.codes[p]] |= CONSONANT
+        self.classes = bytes(classes)
+        self.typecode = 'B' if len(self.phonemes) <= 256 else 'H'
+
+    def encode(self, l_phonetics):
+        """
+        :param l_phonetics: e.g. ['AA', 'L', 'AE', 'X']
+        :return: array of codes
+        """
+        get = self.codes.get
+        return array(self.typecode, [get(p, UNKNOWN_PHONEME) for p in l_phonetics])
+
+    def encode_pattern(self, t_pattern):
+        """
+        :param t_pattern: <pre> or <post>, e.g. ('$', 'AE', '@',)
+        :return: tuple of codes, special phonetics get their negative codes
+        """
+        return tuple(SPECIAL_CODES[p] if p in SPECIAL_CODES else self.codes[p] for p in t_pattern)
+
+    def decode(self, codes):
+        """
+        :param codes: encoded phonetics without UNKNOWN_PHONEME
+        :return: list of phonetics
+        """
+        return [self.phonemes[code] for code in codes]
+
+
+def check_pre(codes, i_start, pre, classes):
+    """
+    Check whether the phonetics before i_start match <pre>.
+     <pre> is read from the tail of the pre phonetics backwards, starting at the index of their length, and a
+     phonetic out of them raises IndexError, as indexes of the list they were sliced into used to.
+    :param codes: encoded phonetics of a word
+    :param i_start: the pre phonetics are codes[0:i_start]
+    :param pre: encoded <pre> e.g. (WORD_START, <code of 'AE'>, ANY_VOWEL)
+    :param classes: PhonemeInventory.classes
+    :return: True if matched, else False
+    """
+    if not i_start:  # No phonetic in pre
+        return pre == (WORD_START,)
+    index = i_start
+    for p in pre:
+        if p == WORD_START:
+            if index != 1:
+                return False
+        else:
+            if not -i_start <= index < i_start:
+                raise IndexError('pre phonetic index out of range')
+            code = codes[index] if index >= 0 else codes[i_start + index]
+            if p == ANY_VOWEL:
+                if not classes[code] & VOWEL:
+                    return False
+            elif p == ANY_CONSONANT:
+                if not classes[code] & CONSONANT:
+                    return False
+            elif p != code:
+                return False
+        index -= 1
+    return True
+
+
+def check_post(codes, i_end, post, classes):
+    """
+    Check whether the phonetics from i_end match <post>
+    :param codes: encoded phonetics of a word
+    :param i_end: the post phonetics are codes[i_end:]
+    :param post: encoded <post> e.g. (<code of 'AE'>, ANY_VOWEL, WORD_END)
+    :param classes: PhonemeInventory.classes
+    :return: True if matched, else False
+    """
+    n = len(codes) - i_end
+    if not n:  # No phonetic in post
+        return post == (WORD_END,)
+    index = 0
+    for p in post:
+        if p == WORD_END:
+            if index != n - 1:
+                return False
+        else:
+            if index >= n:
+                raise IndexError('post phonetic index out of range')
+            code = codes[i_end + index]
+            if p == ANY_VOWEL:
+                if not classes[code] & VOWEL:
+                    return False
+            elif p == ANY_CONSONANT:
+                if not classes[code] & CONSONANT:
+                    return False
+            elif p != code:
+                return False
+        index += 1
+    return True
+
+
+class PhoneticTrie:
+    """
+    Prefix trie compiled from a <consonants | vowels> section.
+
+    Every <match> alternative of the section is inserted code by code. The terminal node of an alternative
+     keeps its <pre> and <post> as guards, so all patterns matching at a position are found by walking the trie
+     only once instead of scanning every rule of the section. Each node holds the candidates of its whole path
+     already in the order they are resolved, so matching allocates nothing.
+    """
+
+    def __init__(self, rule, inventory):
+        """
+        :param rule: dict of a <consonants | vowels> section
+                     e.g. {(<pre>, ((<match1>), (<match2>), ...), <post>): <coord>, ...}
+        :param inventory: PhonemeInventory of the rule
+        """
+        assert isinstance(rule, dict)
+        root = ({}, [])  # node: ({<code>: <child node>}, [<terminal>, ...])
+        for key_index, (k, v) in enumerate(rule.items()):
+            pre, l_patterns, post = k
+            pre, post = inventory.encode_pattern(pre), inventory.encode_pattern(post)
+            for alt_index, patterns in enumerate(l_patterns):
+                node = root
+                for p in patterns:
+                    node = node[0].setdefault(inventory.codes[p], ({}, []))
+                # (<rule order>, <order in the rule>, <length of the match>, <pre>, <post>, <coord>)
+                node[1].append((key_index, alt_index, len(patterns), pre, post, v))
+        self.root = self._freeze(root, [])
+
+    def _freeze(self, node, l_path_terminals):
+        """
+        :param node: node being built
+        :param l_path_terminals: terminals of the ancestors of node
+        :return: node: ({<code>: <child node>}, ((<rule order>, <length>, <pre>, <post>, <coord>), ...))
+        """
+        l_terminals = sorted(l_path_terminals + node[1], key=lambda t: (t[0], t[1]))
+        candidates = tuple((t[0], t[2], t[3], t[4], t[5]) for t in l_terminals)
+        return {code: self._freeze(child, l_terminals) for code, child in node[0].items()}, candidates
+
+    def match(self, codes, i_start, classes):
+        """
+        Match a longest pattern at the i_start index of codes.
+
+        Candidates are resolved in the order the rules are written, an alternative failing its <pre> or <post>
+         skips the rest alternatives of the same rule and an equal length match never replaces a former one.
+        :param codes: encoded phonetics of a word
+        :param i_start: int: start index of the phonetic that need to match
+        :param classes: PhonemeInventory.classes
+        :return: (<value of the matched rule>, <length of the matched pattern>)
+        """
+        node = self.root
+        for i in range(i_start, len(codes)):
+            child = node[0].get(codes[i])
+            if child is None:
+                break
+            node = child
+
+        matched_rule_value = 0
+        pattern_len = 0
+        skipped_key_index = -1
+        for key_index, _pattern_len, pre, post, v in node[1]:
+            if key_index == skipped_key_index:
+                continue
+            if pre and not check_pre(codes, i_start, pre, classes):  # Have <pre>
+                skipped_key_index = key_index  # invalid match, check next rule
+                continue
+            if post and not check_post(codes, i_start + _pattern_len, post, classes):  # Have <post>
+                skipped_key_index = key_index  # invalid match, check next rule
+                continue
+            # <pre> and <post> are both satisfied, compare the match length
+            if _pattern_len > pattern_len:
+                pattern_len = _pattern_len
+                matched_rule_value = v
+        return matched_rule_value, pattern_len
+
+
+def copy_in(word):
+    """
+    Function of "out = in": just copy words.
+     Defined at module level so that parsed rules referencing it can be cached.
+    """
+    return word
+
+
+def copy_in_many(words):
+    """
+    Batch version of copy_in()
+    """
+    return list(words)
+
+
 class RuleTranslator:
     """
     Transliterating by rules
     """
-    def __init__(self):
+    def __init__(self, use_rule_cache=True,
+                 phonetics_cache_size=DEFAULT_PHONETICS_CACHE_SIZE, results_cache_size=DEFAULT_RESULTS_CACHE_SIZE,
+                 memory_path=None, workers=None):
+        """
+        :param use_rule_cache: load parsed rules from "*.rulec" files if they are up to date,
+                               see translators/rule_cache.py
+        :param phonetics_cache_size: max number of (lang_code, keyword) --> phonetics kept in the LRU cache
+        :param results_cache_size: max number of (keyword, lang_codes) --> translate() results kept in the LRU cache
+        :param memory_path: SQLite file of the translation memory shared by processes, see translators/memory.py.
+                            Default is "$PPAT_TRANSLATION_MEMORY", '' to disable it.
+        :param workers: number of threads evaluating languages of large translate_many() batches at once, see
+                        _map(). Default is "$PPAT_RULE_WORKERS", 0 to evaluate them one after another.
+        """
         print('Initializing rule translator...')
         self.rules = {}
-        self.current_rule = {}
-        for file_path in os.listdir(os.path.join('.', 'translators', 'data', 'rule')):
-            if os.path.splitext(file_path)[1] == '.rule':
-                print('Found rule file: {} ... '.format(file_path), end='')
-                file_path = os.path.join('.', 'translators', 'data', 'rule', file_path)
-                with open(file_path, 'r', encoding='utf8') as rule_file:
-                    print('loading...', end='')
-                    self._load_rule(file_path, rule_file)
-                    print('OK.')
+        self.versions = {}  # lang_code --> _rule_version()
+        self.version = ''  # _content_version() of the rules
+        self.phonetics_cache = LRUCache(phonetics_cache_size)
+        self.results_cache = LRUCache(results_cache_size)
+        memory_path = memory.memory_path() if memory_path is None else memory_path
+        self.memory = memory.TranslationMemory(memory_path) if memory_path else None
+        self.workers = int(os.environ.get(WORKERS_ENV, 0)) if workers is None else workers
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self.load_rules(use_rule_cache)
         print('==========================================')
         print('All "*.rule" files in "data/rule/" are loaded!')
         print('==========================================')
 
+    @staticmethod
+    def _rule_paths():
+        """
+        :return: {<lang_code>: <path of "data/rule/<lang_code>.rule">}
+        """
+        paths = {}
+        for file_path in os.listdir(os.path.join('.', 'translators', 'data', 'rule')):
+            if os.path.splitext(file_path)[1] == '.rule':
+                paths[os.path.splitext(file_path)[0]] = os.path.join('.', 'translators', 'data', 'rule', file_path)
+        return paths
+
+    @staticmethod
+    def _rule_version(file_path):
+        """
+        :param file_path: path of a ".rule" file
+        :return: (mtime_ns, size) of the ".rule", ".py" and ".table" files, None for a missing file
+        """
+        base = os.path.splitext(file_path)[0]
+        return _file_version(file_path), _file_version(base + '.py'), _file_version(rule_table.table_path(file_path))
+
+    def _load_rule_file(self, file_path, use_rule_cache):
+        """
+        Load a rule from its cache or its source, with its precomputed table
+        :param file_path: path of a ".rule" file
+        :param use_rule_cache:
+        :return: dict of the rule
+        """
+        print('Found rule file: {} ... '.format(os.path.basename(file_path)), end='')
+        # Digest the sources before reading them: if they change meanwhile, the next reload changes the version
+        digest = rule_cache.results_digest(file_path)
+        rule = rule_cache.load(file_path) if use_rule_cache else None
+        if rule is not None:
+            print('loading from cache...', end='')
+        else:
+            with open(file_path, 'r', encoding='utf8') as rule_file:
+                print('loading...', end='')
+                rule = self._load_rule(file_path, rule_file)
+            if use_rule_cache:
+                rule_cache.dump(file_path, rule)
+        rule['digest'] = digest  # Not cached, see _content_version()
+        self._open_table(rule, file_path)
+        print('OK.')
+        return rule
+
+    @staticmethod
+    def _open_table(rule, file_path):
+        """
+        Attach the precomputed table of a rule if it is fresh
+        :param rule: dict of the rule
+        :param file_path: path of the ".rule" file
+        """
+        rule['table'] = rule_table.open_fresh(file_path)  # Not cached, it is mapped from its own file
+        if rule['table'] is not None:
+            print('{} precomputed words...'.format(len(rule['table'])), end='')
+        elif os.path.exists(rule_table.table_path(file_path)):
+            print('(stale table ignored, run "python cli.py build_tables")...', end='')
+
+    def load_rules(self, use_rule_cache=True):
+        """
+        (Re)load all "*.rule" files in "data/rule/" and invalidate cached phonetics and results.
+         Rules are loaded into a new dict which replaces self.rules at once, so translations running in other
+         threads always see a complete set of rules.
+        :param use_rule_cache:
+        """
+        rules = {}
+        versions = {}
+        for lang_code, file_path in self._rule_paths().items():
+            versions[lang_code] = self._rule_version(file_path)
+            rules[lang_code] = self._load_rule_file(file_path, use_rule_cache)
+        self._swap(rules, versions)
+
+    def _swap(self, rules, versions):
+        """
+        Replace the rules and invalidate the caches. Caches are replaced after the rules and read before them by
+         translations (see translate()), so results of former rules never get into the new caches.
+        """
+        self.rules = rules
+        self.version = self._content_version(rules)  # After the rules, read before them
+        self.versions = versions
+        self.phonetics_cache = self.phonetics_cache.empty_copy()
+        self.results_cache = self.results_cache.empty_copy()
+        if self.memory is not None:
+            self.memory.prune({lang_code: self._memory_version(rule) for lang_code, rule in rules.items()})
+
+    @staticmethod
+    def _memory_version(rule):
+        """
+        :param rule: self.rules[lang_code]
+        :return: version of the rule in the translation memory
+        """
+        return rule['digest'].hex()
+
+    @staticmethod
+    def _content_version(rules):
+        """
+        :param rules: dict of rules
+        :return: hex digest identifying the content of the rules, it changes when a ".rule" or ".py" file or the data
+                 of a rule module changes, but not when only a precomputed table does, as tables never change results
+        """
+        sha1 = hashlib.sha1()
+        for lang_code in sorted(rules.keys()):
+            sha1.update(lang_code.encode('utf8') + rules[lang_code]['digest'])
+        return sha1.hexdigest()
+
+    def reload(self, use_rule_cache=True):
+        """
+        Reload only the rules whose ".rule", ".py" or ".table" files changed, load new "*.rule" files and drop
+         removed ones. A changed "<lang_code>.py" module is reloaded with importlib.reload().
+         The new rules are swapped in at once, translations running in other threads finish on the former rules.
+         A rule failing to load is kept in its former version.
+        :param use_rule_cache:
+        :return: {'reloaded': [<lang_code>, ...], 'removed': [...], 'errors': {<lang_code>: <message>},
+                  'seconds': float}
+        """
+        t_start = time.perf_counter()
+        report = {'reloaded': [], 'removed': [], 'errors': {}}
+        rules = dict(self.rules)
+        versions = dict(self.versions)
+        paths = self._rule_paths()
+        for lang_code, file_path in paths.items():
+            version = self._rule_version(file_path)
+            former = versions.get(lang_code)
+            if version == former:
+                continue
+            try:
+                if former is not None and version[:2] == former[:2]:  # Only the table changed
+                    rule = dict(rules[lang_code])
+                    print('Found rule file: {} ... '.format(os.path.basename(file_path)), end='')
+                    self._open_table(rule, file_path)
+                    print('OK.')
+                else:
+                    module = sys.modules.get('translators.data.rule.{}'.format(lang_code))
+                    if module is not None and (former is None or version[1] != former[1]):
+                        importlib.reload(module)
+                    rule = self._load_rule_file(file_path, use_rule_cache)
+            except (SystemExit, Exception) as e:  # The rule loader exits on syntax errors
+                print('Failed to reload "{}.rule": {}'.format(lang_code, _error_message(e)))
+                report['errors'][lang_code] = _error_message(e)
+                continue
+            rules[lang_code] = rule
+            versions[lang_code] = version
+            report['reloaded'].append(lang_code)
+        for lang_code in list(rules.keys()):
+            if lang_code not in paths:
+                del rules[lang_code]
+                del versions[lang_code]
+                report['removed'].append(lang_code)
+        if report['reloaded'] or report['removed']:
+            self._swap(rules, versions)
+        report['seconds'] = time.perf_counter() - t_start
+        metrics.observe('reload_rules', report['seconds'])
+        return report
+
+    def cache_stats(self):
+        """
+        :return: {'phonetics': <stats of the phonetics cache>, 'results': <stats of the results cache>,
+                  'memory': <stats of the translation memory> if it is enabled}
+        """
+        stats = {'phonetics': self.phonetics_cache.stats(), 'results': self.results_cache.stats()}
+        if self.memory is not None:
+            stats['memory'] = self.memory.stats()
+        return stats
+
+    def _rule_modules(self):
+        """
+        Python modules "data/rule/<lang_code>.py" used by loaded rules
+        :return: {<lang_code>: <module>}
+        """
+        modules = {}
+        for lang_code in self.rules.keys():
+            module = sys.modules.get('translators.data.rule.{}'.format(lang_code))
+            if module is not None:
+                modules[lang_code] = module
+        return modules
+
+    def warm_up(self, background=False):
+        """
+        Load lazy resources of rule modules (e.g. the phonetic dictionary and the prediction model of "en.py")
+         by calling their optional warm_up() functions.
+        :param background: if True, warm up in a daemon thread and return at once
+        :return: the thread if background, else None
+        """
+        def _warm_up():
+            for lang_code, module in self._rule_modules().items():
+                if hasattr(module, 'warm_up'):
+                    t_start = time.time()
+                    module.warm_up()
+                    print('Rule module "{}.py" warmed up in {:.2f} s.'.format(lang_code, time.time() - t_start))
+
+        if not background:
+            _warm_up()
+            return None
+        thread = threading.Thread(target=_warm_up, name='rule-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def loaded_resources(self):
+        """
+        Lazy resources of rule modules reported by their optional loaded_resources() functions
+        :return: {'<lang_code>.<resource name>': <whether it is loaded>}
+        """
+        resources = {}
+        for lang_code, module in self._rule_modules().items():
+            if hasattr(module, 'loaded_resources'):
+                for name, loaded in module.loaded_resources().items():
+                    resources['{}.{}'.format(lang_code, name)] = loaded
+        return resources
+
     def _get_kv(self, line, line_number, lang_code):
         """
         Get a k, v pair from a line likes 'key   =  value'.
@@ -125,9 +811,10 @@ class RuleTranslator:
 
         return items[0].rstrip(), items[1].lstrip().rstrip('\n')
 
-    def _load_kv(self, line, current_section, line_number, lang_code):
+    def _load_kv(self, rule, line, current_section, line_number, lang_code):
         """
         Load Key/Value of a line
+        :param rule: dict of the rule being loaded
         :param line:
         :param current_section:
         :param line_number:
@@ -172,8 +859,8 @@ class RuleTranslator:
             return m, n
 
         try:
-            if current_section not in self.rules[lang_code].keys():
-                self.rules[lang_code][current_section] = {}  # init 'current_section' as a dict
+            if current_section not in rule.keys():
+                rule[current_section] = {}  # init 'current_section' as a dict
             k, v = self._get_kv(line, line_number, lang_code)
 
             # validate k/v
@@ -182,17 +869,17 @@ class RuleTranslator:
                     'Invalid key (should be "consonants" or "vowels"): "{}" ' \
                     'in ".phonetics" section at line {} in file {}.py' \
                         .format(k, line_number, lang_code)
-                self.rules[lang_code][current_section][k] = v.split('|')
+                rule[current_section][k] = v.split('|')
             elif current_section.startswith('consonants') or current_section.startswith('vowels'):
                 # v should be a digit
                 assert v.isdigit(), 'Value should be a digit in section "{}": line {} in file: {}.rule'\
                     .format(current_section, line_number, lang_code)
-                self.rules[lang_code][current_section][parse_k_cv(k)] = int(v)
+                rule[current_section][parse_k_cv(k)] = int(v)
             elif current_section.startswith('transliteration'):
                 # Key in this section should be a <k, v> pair
                 assert v is not '', 'Value should not be empty in section "{}": line {} in file: {}.rule'\
                     .format(current_section, line_number, lang_code)
-                self.rules[lang_code][current_section][parse_k_t(k)] = v
+                rule[current_section][parse_k_t(k)] = v
         except Exception as e:
             print('Error: {} while loading k/v in "{}" section at line {} in file: {}.rule' \
                   .format(str(e), current_section, line_number, lang_code))
@@ -210,18 +897,21 @@ class RuleTranslator:
         assert k in self.available_meta_keys, \
             'Invalid key in ".meta" section at line {} in file: {}.rule'.format(line_number, lang_code)
 
-    def _load_func(self, section, line, lang_code, line_number, rule_file):
+    def _load_func(self, rule, section, line, lang_code, line_number, rule_file):
         """
         Load sections contain functions
+        :param rule: dict of the rule being loaded
         :param section:
         :param line:
         :return:
         """
-        if section not in self.rules[lang_code].keys():  # init 'section' as a list
-            self.rules[lang_code][section] = []
+        if section not in rule.keys():  # init 'section' as a list
+            rule[section] = []
         k, v = self._get_kv(line, line_number, lang_code)  # lines here will be 'out = in' or 'out = fun(in)'
         if k == 'out' and v == 'in':  # just copy words
-            self.rules[lang_code][section] = lambda x: x
+            rule[section] = copy_in
+            if section == 'to_phonetics':
+                rule['to_phonetics_many'] = copy_in_many
         elif re.match(r'\w+\(in\)', v) is not None:
             function_name = v.split('(')[0]  # Get the function name and import it dynamically
 
@@ -229,8 +919,11 @@ class RuleTranslator:
                 'No such file: {}.py in "data/rule/" for {}() in ".{}" section' \
                 ' at line {} in file: {}.rule'.format(lang_code, function_name, section, line_number, lang_code)
 
-            self.rules[lang_code][section] = \
-                importlib.import_module('translators.data.rule.{}'.format(lang_code)).__getattribute__(function_name)
+            module = importlib.import_module('translators.data.rule.{}'.format(lang_code))
+            rule[section] = module.__getattribute__(function_name)
+            if section == 'to_phonetics':
+                # Optional batch version "<func>_many(in)" used by translate_many()
+                rule['to_phonetics_many'] = getattr(module, function_name + '_many', None)
         else:
             print('Syntax Error in ".{}" section at line {} in rule file: {}'.format(section, line_number, rule_file))
             print('"out = in" or syntax like "out = <func>(in)" expected.')
@@ -239,14 +932,15 @@ class RuleTranslator:
 
     def _load_rule(self, file_path, rule_file):
         """
-        Load rules in "*.rule" file. Store it into self.rules
+        Load rules in "*.rule" file.
         :param file_path:
         :param rule_file:
+        :return: dict of the rule
         """
         current_section = ''
         line_number = 0
         lang_code = os.path.split(os.path.splitext(file_path)[0])[1]  # Get 'a' from '/c/d/a.rule'
-        self.rules[lang_code] = {'meta': {}}
+        rule = {'meta': {}}
         available_sections = ('phonetics',  # consonants + vowels
                               'consonants people',
                               'vowels people',
@@ -268,132 +962,80 @@ class RuleTranslator:
             if current_section == 'meta':  # meta information
                 k, v = self._get_kv(line, line_number, lang_code)
                 self._check_meta_k(k, line_number, lang_code)
-                self.rules[lang_code]['meta'][k] = v
+                rule['meta'][k] = v
             elif current_section == 'to_phonetics':  # rules for translating words to phonetics
-                self._load_func(current_section, line, lang_code, line_number, rule_file)
+                self._load_func(rule, current_section, line, lang_code, line_number, rule_file)
             elif current_section.startswith('post'):
-                self._load_func(current_section, line, lang_code, line_number, rule_file)
+                self._load_func(rule, current_section, line, lang_code, line_number, rule_file)
             elif current_section in available_sections:
-                self._load_kv(line, current_section, line_number, lang_code)
+                self._load_kv(rule, line, current_section, line_number, lang_code)
             else:
                 print('Invalid section name "{}" at line {} in rule file: {}'.format(current_section,
                                                                                      line_number, rule_file))
                 exit(1)
+        self._compile_rule(rule)
+        return rule
+
+    def _compile_rule(self, rule):
+        """
+        Compile every <consonants | vowels> section of a loaded rule into a PhoneticTrie.
+         Tries are stored in rule['tries'] with the section names as keys, on the codes of rule['phonemes'].
+        :param rule: dict of the rule being loaded
+        """
+        sections = [section for section in rule.keys()
+                    if section.startswith('consonants') or section.startswith('vowels')]
+        l_phonemes = []
+        for section in sections:
+            for pre, l_patterns, post in rule[section].keys():
+                l_phonemes.extend(p for p in pre + post if p not in SPECIAL_CODES)
+                for patterns in l_patterns:
+                    l_phonemes.extend(patterns)
+        phonetics = rule.get('phonetics', {})
+        inventory = PhonemeInventory(phonetics.get('consonants', []), phonetics.get('vowels', []), l_phonemes)
+        rule['phonemes'] = inventory
+        rule['tries'] = {section: PhoneticTrie(rule[section], inventory) for section in sections}
 
-    def _check_pre(self, pre_phonetic, pre_pattern):
+    def _check_pre(self, rule, codes, i_start, pre_pattern):
         """
-        Check whether pre_phonetic matches pre
-        :param pre_phonetic: list e.g. ['AE', 'OW', 'O']
+        Check whether the phonetics before i_start match pre, see check_pre()
+        :param rule: self.rules[lang_code]
+        :param codes: phonetics encoded by rule['phonemes']
+        :param i_start: start index of the match
         :param pre_pattern: tuple  e.g. ('$', 'AE', '@',)
                                     head <--------- tail
         :return: True if matched, else False
         """
-        assert isinstance(pre_phonetic, list)
         assert isinstance(pre_pattern, tuple) and len(pre_pattern) != 0
-        l_all_consonants = self.current_rule['phonetics']['consonants']
-        l_all_vowels = self.current_rule['phonetics']['vowels']
-        list(pre_pattern).reverse()
-        if not pre_phonetic:  # No phonetic in pre
-            if pre_pattern == ('$',):
-                return True
-            else:
-                return False
-        index = len(pre_phonetic)
-        for i in pre_pattern:
-            if i == '@' and pre_phonetic[index] not in l_all_vowels:  # Any Vowels
-                return False
-            if i == '&' and pre_phonetic[index] not in l_all_consonants:  # Any Consonants
-                return False
-            if i == '$' and index != 1:
-                return False
-            if i not in ['@', '&', '$'] and i != pre_phonetic[index]:
-                return False
-            index -= 1
-        return True
+        return check_pre(codes, i_start, rule['phonemes'].encode_pattern(pre_pattern), rule['phonemes'].classes)
 
-    def _check_post(self, post_phonetic, post_pattern):
+    def _check_post(self, rule, codes, i_end, post_pattern):
         """
-        Check whether pre_phonetic matches pre
-        :param post_phonetic: list e.g. ['AE', 'OW', 'O']
+        Check whether the phonetics from i_end match post, see check_post()
+        :param rule: self.rules[lang_code]
+        :param codes: phonetics encoded by rule['phonemes']
+        :param i_end: end index of the match
         :param post_pattern: tuple  e.g. ('AE', '@', '$',)
                                     head <--------- tail
         :return: True if matched, else False
         """
-        assert isinstance(post_phonetic, list)
         assert isinstance(post_pattern, tuple) and len(post_pattern) != 0
-        l_all_consonants = self.current_rule['phonetics']['consonants']
-        l_all_vowels = self.current_rule['phonetics']['vowels']
-        if not post_phonetic:  # No phonetic in post
-            if post_pattern == ('^',):
-                return True
-            else:
-                return False
-        index = 0
-        for i in post_pattern:
-            if i == '@' and post_phonetic[index] not in l_all_vowels:  # Any Vowels
-                return False
-            if i == '&' and post_phonetic[index] not in l_all_consonants:  # Any Consonants
-                return False
-            if i == '^' and index != (len(post_phonetic) - 1):
-                return False
-            if i not in ['@', '&', '^'] and i != post_phonetic[index]:
-                return False
-            index += 1
-        return True
+        return check_post(codes, i_end, rule['phonemes'].encode_pattern(post_pattern), rule['phonemes'].classes)
 
-    def _match(self, phonetic, i_start, rule):
+    def _match(self, rule, codes, i_start, trie):
         """
-        Match a longest pattern in rule at the i_start index of phonetic
+        Match a longest pattern in trie at the i_start index of codes
         If matched, return >=1.
         Else, return 0.
-        :param phonetic: a complete phonetic list of a word
+        :param rule: self.rules[lang_code]
+        :param codes: phonetics encoded by rule['phonemes']
         :param i_start: int: start index of the phonetic that need to match
-        :param rule: self.rule[lang_code + category]
+        :param trie: rule['tries'][<section>]
         :return: (<value of the matched rule>, <length of the matched pattern>)
         """
-        assert isinstance(rule, dict)
+        assert isinstance(trie, PhoneticTrie)
         assert isinstance(i_start, int)
-        assert isinstance(phonetic, list)
 
-        matched_rule_value = 0
-        pattern_len = 0  # value of the matched rule
-
-        def _match_len(l_string, l_patterns):
-            """
-            len of matching pattern
-
-            :param l_string:
-            :param l_patterns:
-            :return:
-            """
-            r = 0
-            # if len(l_patterns) > len(l_string), no need for match
-            if len(l_patterns) > len(l_string):
-                return 0
-            for i in range(len(l_patterns)):
-                if l_string[i] == l_patterns[i]:
-                    r += 1
-                else:
-                    return 0
-            return r
-
-        for k in rule.keys():  # k: ('<(pre)>', [<[match1]>, <[match2]>, ...], '<(post)>'), v: int
-            pre = k[0]
-            post = k[2]
-
-            for patterns in k[1]:  # <match>: ['', '', ...]
-                _pattern_len = _match_len(phonetic[i_start:], patterns)
-                if _pattern_len != 0:  # matched, check <pre> and <post>
-                    if len(k[0]) != 0 and not self._check_pre(phonetic[0:i_start], pre):  # Have <pre>
-                        break  # invalid match, check next
-                    if len(k[2]) != 0 and not self._check_post(phonetic[i_start + _pattern_len:], post):  # Have <post>
-                        break  # invalid match, check next
-                    # <pre> and <post> are both satisfied, compare the match length
-                    if _pattern_len > pattern_len:
-                        pattern_len = _pattern_len
-                        matched_rule_value = rule[k]
-
-        return matched_rule_value, pattern_len
+        return trie.match(codes, i_start, rule['phonemes'].classes)
 
     def _find(self, coord_c, coord_v, l_rule_t):
         """
@@ -412,9 +1054,31 @@ class RuleTranslator:
             raise NoRuleMatched('.transliteration')
         return s_return
 
-    def _phonetics2chinese(self, l_phonetics, category):
+    def _phonetics2chinese(self, rule, phonetics, category):
+        """
+        Phonetic to chinese in the rule's category, see _match_phonetics()
+        :param rule: self.rules[lang_code]
+        :param phonetics: list of phonetics -- e.g. ['AA', 'L', 'AE', 'X'], or them encoded by rule['phonemes']
+        :param category: 'places' | 'people'
+        :return: str
+        """
+        return rule['post ' + category](self._match_phonetics(rule, phonetics, category))
+
+    @staticmethod
+    def _encode(rule, l_phonetics):
+        """
+        Phonetics as kept by the phonetics cache: encoded by rule['phonemes'], or the list itself if it has
+         phonemes unknown to the rule so that NoRuleMatched can still show them
+        :param rule: self.rules[lang_code]
+        :param l_phonetics: list of phonetics
+        :return: array of codes | list of phonetics
+        """
+        codes = rule['phonemes'].encode(l_phonetics)
+        return l_phonetics if UNKNOWN_PHONEME in codes else codes
+
+    def _match_phonetics(self, rule, phonetics, category):
         """
-        Phonetic to chinese in the current_rule's category
+        Phonetic to chinese in the rule's category, before the ".post" function
 
         Match longest pattern in vowels column.
          If matched,
@@ -427,11 +1091,13 @@ class RuleTranslator:
          Match longest pattern in vowels column.
          find chinese at (coord_c, coord_v)
 
-        self.current_rule Example:
+        rule Example:
 
         {'meta':
             {'language_name':''},
          'to_phonetic': func,
+         'phonemes': PhonemeInventory,
+         'tries': {'consonants people': PhoneticTrie, 'vowels people': PhoneticTrie, ...},
          'consonants people': [rule1, rule2, ...],
          'vowels people': [rule1, rule2, ...],
          'transliteration people': [rule1, rule2, ...],
@@ -439,41 +1105,45 @@ class RuleTranslator:
          'vowels places': [rule1, rule2, ...],
          'transliteration places': [rule1, rule2, ...],
         }
-        :param l_phonetics: list of phonetics -- e.g. ['AA', 'L', 'AE', 'X']
+        :param rule: self.rules[lang_code]
+        :param phonetics: list of phonetics -- e.g. ['AA', 'L', 'AE', 'X'], or them encoded by rule['phonemes']
         :param category: 'places' | 'people'
         :return: str
         """
         assert category in ('people', 'places', )
-        
-        l_rule_c = self.current_rule['consonants ' + category]       # .consonants      section's rules
-        l_rule_v = self.current_rule['vowels ' + category]           # .vowels          section's rules
-        l_rule_t = self.current_rule['transliteration ' + category]  # .transliteration section's rules
-        l_func_p = self.current_rule['post ' + category]             # .post            section's function
+
+        codes = rule['phonemes'].encode(phonetics) if isinstance(phonetics, list) else phonetics
+        classes = rule['phonemes'].classes
+        l_rule_c = rule['tries']['consonants ' + category]  # .consonants  section's rules
+        l_rule_v = rule['tries']['vowels ' + category]      # .vowels      section's rules
+        l_rule_t = rule['transliteration ' + category]  # .transliteration section's rules
 
         s_return = ''
         i_start = 0
-        while i_start != len(l_phonetics):
-            coord_v, p_len = self._match(l_phonetics, i_start, l_rule_v)
+        n = len(codes)
+        while i_start != n:
+            coord_v, p_len = l_rule_v.match(codes, i_start, classes)
             if coord_v:
                 s_return += self._find(1, coord_v, l_rule_t)
                 i_start += p_len
             else:
-                coord_c, p_len = self._match(l_phonetics, i_start, l_rule_c)
+                coord_c, p_len = l_rule_c.match(codes, i_start, classes)
                 if coord_c:
                     i_start += p_len
                     # the consonant is the last phonetic of the word, no need to check vowels
-                    if i_start == len(l_phonetics):
+                    if i_start == n:
                         s_return += self._find(coord_c, 1, l_rule_t)
                         break
-                    coord_v, p_len = self._match(l_phonetics, i_start, l_rule_v)
+                    coord_v, p_len = l_rule_v.match(codes, i_start, classes)
                     if coord_v:
                         s_return += self._find(coord_c, coord_v, l_rule_t)
                         i_start += p_len
                     else:
                         s_return += self._find(coord_c, 1, l_rule_t)
                 else:
-                    raise NoRuleMatched('.consonants', l_phonetics)
-        return l_func_p(s_return)
+                    raise NoRuleMatched('.consonants', phonetics if isinstance(phonetics, list)
+                                        else rule['phonemes'].decode(codes))
+        return s_return
 
     def _words2phonetics(self, func, keyword):
         """
@@ -490,48 +1160,359 @@ class RuleTranslator:
         """
         return func(keyword)
 
-    def translate(self, keyword, lang_codes):
+    def _words2phonetics_many(self, rule, keywords):
         """
-        Outer interface, translate words into chinese characters in selected cultures.
-        :param keyword: a string that not contains spaces
-        :param lang_codes: list: if empty, select all lang_codes.
-        :return:
+        Phonetics of many keywords in the rule.
+         Use the batch function "<func>_many" of ".to_phonetics" section if the rule file provides one.
+        :param rule: self.rules[lang_code]
+        :param keywords: list of str
+        :return: list of phonetics lists or exceptions raised by ".to_phonetics", in the order of keywords
         """
-        assert isinstance(keyword, str) and isinstance(lang_codes, list) and ' ' not in keyword
+        func_many = rule.get('to_phonetics_many')
+        if func_many is not None:
+            try:
+                return func_many(keywords)
+            except Exception:  # Find out which keywords fail one by one
+                pass
+        ll_phonetics = []
+        for keyword in keywords:
+            try:
+                ll_phonetics.append(self._words2phonetics(rule['to_phonetics'], keyword))
+            except Exception as e:
+                ll_phonetics.append(e)
+        return ll_phonetics
 
-        keyword = keyword.capitalize()
-
-        # Combine lang_codes
+    def _select_lang_codes(self, rules, lang_codes):
+        """
+        Combine lang_codes
+        :param rules: self.rules
+        :param lang_codes: list: if empty, select all lang_codes.
+        :return: list of loaded lang_codes
+        """
         _lang_codes = []
         if len(lang_codes) == 0:
-            _lang_codes = self.rules.keys()
+            _lang_codes = list(rules.keys())
         else:
-            for m in self.rules.keys():
+            for m in rules.keys():
                 for n in lang_codes:
                     if m == n:
                         _lang_codes.append(m)
                         break
+        return _lang_codes
+
+    def _transliterations(self, rule, lang_code, keyword, phonetics):
+        """
+        Transliterations of a keyword for both categories in the rule
+        :param rule: self.rules[lang_code]
+        :param lang_code: label of the timings
+        :param keyword:
+        :param phonetics: list of phonetics, or them encoded by rule['phonemes']
+        :return: [<people result>, <places result>]
+        """
+        if isinstance(phonetics, list):  # Encoded once for both categories
+            phonetics = self._encode(rule, phonetics)
+        results = []
+        for category in ('people', 'places'):
+            t_start = time.perf_counter()
+            s_chinese = self._match_phonetics(rule, phonetics, category)
+            t_post = time.perf_counter()
+            s_chinese = rule['post ' + category](s_chinese)
+            t_end = time.perf_counter()
+            metrics.observe('rule_match', t_post - t_start, lang_code, category)
+            metrics.observe('post', t_end - t_post, lang_code, category)
+            results.append({
+                'keyword': keyword,
+                'language': rule['meta']['language_name'],
+                'category': category.capitalize(),
+                'chinese': s_chinese,
+            })
+        return results
+
+    def _table_transliterations(self, rule, keyword, t_chinese):
+        """
+        Transliterations of a keyword found in the precomputed table of the rule, the same as _transliterations()
+        :param rule: self.rules[lang_code]
+        :param keyword:
+        :param t_chinese: (<people chinese>, <places chinese>)
+        :return: [<people result>, <places result>]
+        """
+        return [
+            {
+                'keyword': keyword,
+                'language': rule['meta']['language_name'],
+                'category': category,
+                'chinese': s_chinese,
+            } for category, s_chinese in zip(('People', 'Places'), t_chinese)
+        ]
+
+    def _table_lookup(self, rule, lang_code, keyword):
+        """
+        :param rule: self.rules[lang_code]
+        :param lang_code: label of the timings
+        :param keyword: capitalized keyword
+        :return: (<people chinese>, <places chinese>), None if the rule has no table or the keyword is not in it
+        """
+        table = rule.get('table')
+        if table is None:
+            return None
+        t_start = time.perf_counter()
+        t_chinese = table.get(keyword)
+        metrics.observe('table_lookup', time.perf_counter() - t_start, lang_code)
+        return t_chinese
+
+    def _memory_lookup(self, translation_memory, rule, lang_code, keywords):
+        """
+        :param translation_memory: self.memory
+        :param rule: self.rules[lang_code]
+        :param lang_code:
+        :param keywords: list of distinct capitalized keywords
+        :return: {<keyword>: <row>} of the keywords in the translation memory, see TranslationMemory.get_many()
+        """
+        t_start = time.perf_counter()
+        d_rows = translation_memory.get_many(lang_code, self._memory_version(rule), keywords)
+        metrics.observe('memory_lookup', time.perf_counter() - t_start, lang_code)
+        return d_rows
+
+    def _remembered_transliterations(self, rule, lang_code, keyword, row):
+        """
+        Transliterations of a keyword found in the translation memory, the same as _transliterations()
+        :param rule: self.rules[lang_code]
+        :param lang_code: label of the timings
+        :param keyword:
+        :param row: (<phonetics list>, <people chinese>, <places chinese>)
+        :return: [<people result>, <places result>], raises NoRuleMatched again if no rule matched the phonetics
+        """
+        l_phonetics, people, places = row
+        if people is None:
+            return self._transliterations(rule, lang_code, keyword, l_phonetics)
+        return self._table_transliterations(rule, keyword, (people, places))
+
+    def _remember(self, translation_memory, rule, lang_code, keyword, phonetics):
+        """
+        _transliterations() whose result, or phonetics if no rule matched them, is put in the translation memory
+        :param translation_memory: self.memory or None
+        :return: [<people result>, <places result>]
+        """
+        if translation_memory is None:
+            return self._transliterations(rule, lang_code, keyword, phonetics)
+        l_phonetics = phonetics if isinstance(phonetics, list) else rule['phonemes'].decode(phonetics)
+        try:
+            results = self._transliterations(rule, lang_code, keyword, phonetics)
+        except NoRuleMatched:
+            translation_memory.put(lang_code, self._memory_version(rule), keyword, l_phonetics)
+            raise
+        translation_memory.put(lang_code, self._memory_version(rule), keyword, l_phonetics,
+                               results[0]['chinese'], results[1]['chinese'])
+        return results
+
+    def _worker_pool(self):
+        """
+        :return: ThreadPoolExecutor of this process, a forked process starts its own (see prefork_server.py)
+        """
+        with self._pool_lock:
+            if self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='rule-worker')
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _map(self, func, l_args, n_keywords):
+        """
+        [func(*args) for args in l_args], by the worker pool if there is one and the batch is large enough.
+         Languages overlap where their work releases the GIL: predictions, the phoneme service and the translation
+         memory. Matching rules is pure Python and still runs one language at a time.
+        :param func:
+        :param l_args: list of argument tuples, one per language or ".to_phonetics" function
+        :param n_keywords: size of the batch
+        :return: list of results in the order of l_args
+        """
+        if self.workers > 0 and len(l_args) > 1 and n_keywords >= PARALLEL_MIN_KEYWORDS:
+            return list(self._worker_pool().map(lambda args: func(*args), l_args))
+        return [func(*args) for args in l_args]
+
+    def _shared_phonetics(self, rule, lang_code, keywords, shared):
+        """
+        Phonetics of keywords by the ".to_phonetics" function of a rule, generated once for all rules using it
+        :param rule: self.rules[lang_code]
+        :param lang_code: label of the timing
+        :param keywords: list of distinct capitalized keywords
+        :param shared: (<lock>, {<keyword>: <phonetics list> or the exception raised}) of the function
+        :return: the dict of shared, with all keywords
+        """
+        lock, d_phonetics = shared
+        with lock:  # Rules of the same function running in other threads wait for the phonetics they also need
+            l_missed = [keyword for keyword in keywords if keyword not in d_phonetics]
+            if l_missed:
+                t_phonetics = time.perf_counter()  # One observation per batch
+                d_phonetics.update(zip(l_missed, self._words2phonetics_many(rule, l_missed)))
+                metrics.observe('to_phonetics', time.perf_counter() - t_phonetics, lang_code)
+        return d_phonetics
+
+    def _translate_language(self, rule, lang_code, position, keywords, l_todo, d_failed, shared, translation_memory,
+                            phonetics_cache):
+        """
+        Transliterations of the keywords of translate_many() in one of its languages
+        :param rule: self.rules[lang_code]
+        :param lang_code:
+        :param position: position of lang_code in the languages of translate_many()
+        :param keywords: list of capitalized keywords
+        :param l_todo: indexes of the keywords to translate
+        :param d_failed: {<index>: <position of a language failing it>} shared by the languages. Keywords failing in a
+                         former language fail whatever the next ones give, so they are skipped. Every position
+                         recorded does fail, so skipping is right even if languages in other threads race to record.
+        :param shared: see _shared_phonetics()
+        :param translation_memory: self.memory or None
+        :param phonetics_cache: self.phonetics_cache
+        :return: {<index>: [<people result>, <places result>] or the exception raised} of the keywords not skipped
+        """
+        d_outcomes = {}
+        l_live = []  # indexes of keywords not in the precomputed table
+        for i in l_todo:
+            if d_failed.get(i, position) < position:
+                continue
+            t_chinese = self._table_lookup(rule, lang_code, keywords[i])
+            if t_chinese is None:
+                l_live.append(i)
+            else:
+                d_outcomes[i] = self._table_transliterations(rule, keywords[i], t_chinese)
+        if translation_memory is not None and l_live:
+            d_rows = self._memory_lookup(translation_memory, rule, lang_code,
+                                         list({keywords[i]: None for i in l_live}))
+            l_remaining = []  # indexes of keywords not in the translation memory either
+            for i in l_live:
+                row = d_rows.get(keywords[i])
+                if row is None:
+                    l_remaining.append(i)
+                    continue
+                try:
+                    d_outcomes[i] = self._remembered_transliterations(rule, lang_code, keywords[i], row)
+                except Exception as e:
+                    d_outcomes[i] = e
+                    d_failed.setdefault(i, position)
+            l_live = l_remaining
+        ll_phonetics = [phonetics_cache.get((lang_code, keywords[i])) for i in l_live]
+        l_missed = list({keywords[i]: None for i, phonetics in zip(l_live, ll_phonetics) if phonetics is None}.keys())
+        d_phonetics = self._shared_phonetics(rule, lang_code, l_missed, shared) if l_missed else {}
+        d_encoded = {}  # keyword --> phonetics of d_phonetics encoded by the rule
+        for i, phonetics in zip(l_live, ll_phonetics):
+            keyword = keywords[i]
+            if phonetics is None:
+                phonetics = d_encoded.get(keyword)
+            if phonetics is None:
+                l_phonetics = d_phonetics[keyword]
+                if isinstance(l_phonetics, Exception):
+                    d_outcomes[i] = l_phonetics
+                    d_failed.setdefault(i, position)
+                    continue
+                phonetics = d_encoded[keyword] = self._encode(rule, l_phonetics)
+                phonetics_cache.put((lang_code, keyword), phonetics)
+            try:
+                d_outcomes[i] = self._remember(translation_memory, rule, lang_code, keyword, phonetics)
+            except Exception as e:
+                d_outcomes[i] = e
+                d_failed.setdefault(i, position)
+        return d_outcomes
+
+    def translate(self, keyword, lang_codes):
+        """
+        Outer interface, translate words into chinese characters in selected cultures.
+         Phonetics are generated once per ".to_phonetics" function, shared by the rules using the same function.
+        :param keyword: a string that not contains spaces
+        :param lang_codes: list: if empty, select all lang_codes.
+        :return: The result is cached and must not be modified.
+        """
+        assert isinstance(keyword, str) and isinstance(lang_codes, list) and ' ' not in keyword
+
+        t_start = time.perf_counter()
+        keyword = keyword.capitalize()
+        # Caches are read before the rules, see _swap()
+        phonetics_cache, results_cache = self.phonetics_cache, self.results_cache
+        rules = self.rules  # Keep using the same rules even if they are reloaded by another thread
+        translation_memory = self.memory
+        _lang_codes = self._select_lang_codes(rules, lang_codes)
+
+        results = results_cache.get((keyword, tuple(_lang_codes)))
+        if results is not None:
+            metrics.observe('translate', time.perf_counter() - t_start)
+            return results
 
         results = {'transliterations': []}  # store results for every lang_code [<lang_code1>, <lang_code2>, ...]
+        d_phonetics = {}  # to_phonetics function --> phonetics of the keyword, shared by the rules using it
 
         for _lang_code in _lang_codes:
             # Select rule for lang_code
-            self.current_rule = self.rules[_lang_code]  # lang_code specified rule
+            rule = rules[_lang_code]  # lang_code specified rule
 
-            # to phonetics
-            l_phonetics = self._words2phonetics(self.current_rule['to_phonetics'], keyword)
+            # precomputed by "python cli.py build_tables"
+            t_chinese = self._table_lookup(rule, _lang_code, keyword)
+            if t_chinese is not None:
+                results['transliterations'].extend(self._table_transliterations(rule, keyword, t_chinese))
+                continue
 
-            results['transliterations'].append({
-                'keyword': keyword,
-                'language': self.current_rule['meta']['language_name'],
-                'category': 'People',
-                'chinese': self._phonetics2chinese(l_phonetics, 'people'),
-            })
-            results['transliterations'].append({
-                'keyword': keyword,
-                'language': self.current_rule['meta']['language_name'],
-                'category': 'Places',
-                'chinese': self._phonetics2chinese(l_phonetics, 'places'),
-            })
+            # translated before by any process, see translators/memory.py
+            if translation_memory is not None:
+                row = self._memory_lookup(translation_memory, rule, _lang_code, [keyword]).get(keyword)
+                if row is not None:
+                    results['transliterations'].extend(
+                        self._remembered_transliterations(rule, _lang_code, keyword, row))
+                    continue
+
+            # to phonetics, cached encoded
+            phonetics = phonetics_cache.get((_lang_code, keyword))
+            if phonetics is None:
+                l_phonetics = d_phonetics.get(rule['to_phonetics'])
+                if l_phonetics is None:
+                    t_phonetics = time.perf_counter()
+                    l_phonetics = self._words2phonetics(rule['to_phonetics'], keyword)
+                    metrics.observe('to_phonetics', time.perf_counter() - t_phonetics, _lang_code)
+                    d_phonetics[rule['to_phonetics']] = l_phonetics
+                phonetics = self._encode(rule, l_phonetics)
+                phonetics_cache.put((_lang_code, keyword), phonetics)
+
+            results['transliterations'].extend(
+                self._remember(translation_memory, rule, _lang_code, keyword, phonetics))
 
+        results_cache.put((keyword, tuple(_lang_codes)), results)
+        metrics.observe('translate', time.perf_counter() - t_start)
+        return results
+
+    def translate_many(self, keywords, lang_codes):
+        """
+        Outer interface, translate many words at once.
+         Phonetics of all keywords are generated in one batch per ".to_phonetics" function, shared by the rules using
+         the same function, see _words2phonetics_many(). Languages of large batches are evaluated by the worker pool,
+         see _map(), and their results are merged in the order of the languages.
+        :param keywords: list of strings that not contain spaces
+        :param lang_codes: list: if empty, select all lang_codes.
+        :return: list of results in the order of keywords. A keyword failed to translate gets the exception
+                 raised in place of its result, like NoRuleMatched. Results are cached and must not be modified.
+        """
+        assert isinstance(keywords, list) and isinstance(lang_codes, list)
+        assert all(isinstance(keyword, str) and ' ' not in keyword for keyword in keywords)
+
+        keywords = [keyword.capitalize() for keyword in keywords]
+        # Caches are read before the rules, see _swap()
+        phonetics_cache, results_cache = self.phonetics_cache, self.results_cache
+        rules = self.rules  # Keep using the same rules even if they are reloaded by another thread
+        translation_memory = self.memory
+        _lang_codes = self._select_lang_codes(rules, lang_codes)
+        results = [results_cache.get((keyword, tuple(_lang_codes))) for keyword in keywords]
+        l_todo = [i for i, result in enumerate(results) if result is None]  # indexes of keywords not cached
+
+        d_failed = {}  # index of keyword --> position of a language failing it, see _translate_language()
+        d_shared = {rules[_lang_code]['to_phonetics']: (threading.Lock(), {}) for _lang_code in _lang_codes}
+        l_outcomes = self._map(self._translate_language, [
+            (rules[_lang_code], _lang_code, position, keywords, l_todo, d_failed,
+             d_shared[rules[_lang_code]['to_phonetics']], translation_memory, phonetics_cache)
+            for position, _lang_code in enumerate(_lang_codes)], len(l_todo))
+
+        for i in l_todo:
+            results[i] = {'transliterations': []}
+            for d_outcomes in l_outcomes:
+                outcome = d_outcomes[i]
+                if isinstance(outcome, Exception):  # The first language failing
+                    results[i] = outcome
+                    break
+                results[i]['transliterations'].extend(outcome)
+            if not isinstance(results[i], Exception):
+                results_cache.put((keywords[i], tuple(_lang_codes)), results[i])
         return results